@@ -1,26 +1,173 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, url_for
 from flask_sqlalchemy import SQLAlchemy
 from config import Config
+import click
 import os
+import uuid
+import hashlib
+import heapq
+import sys
+from datetime import datetime, timezone
+from sqlalchemy import func, or_
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
 from werkzeug.utils import secure_filename
-from openai import OpenAI
-from database import db
-from models import User, Message, VoiceMessage
+from database import (
+    configure_engine, db, init_database, read_only_request, reads_from_replica, sync_sqlite_replicas
+)
+from models import User, Message, VoiceMessage, conversation_key, next_completed_seq
+from pagination import (
+    PaginationError, conversation_page, conversation_rows, decode_cursor, encode_cursor, page_args, with_cursor
+)
+from timeline import timeline_page
+from metrics import Metrics
+from serialization import (
+    CONVERSATION_FIELDS, MESSAGE_FIELDS, SEARCH_FIELDS, TIMELINE_FIELDS, USER_FIELDS, VOICE_MESSAGE_FIELDS,
+    FastJSONProvider, FieldError, compress_response, ndjson_response, parse_fields, project, wants_ndjson
+)
+from search import SearchError, rebuild_search_index, search_page
+from migrations import migrate, pending_migrations
+from retention import MessageArchive, compact, describe_report, run_retention
+from summaries import check_summaries, conversation_list, mark_read, record_messages, summarized
+from cache import MISSING, TTLCache
+from transcription import TranscriptionQueue, create_transcriber
+from transcript_cache import TranscriptionCache
+from uploads import ChatRequest
+from ingest import IngestError, WriteCoalescer, insert_messages
+from events import EventHub, create_event_backend, message_event, parse_event_id, sse_stream, voice_message_event
 
 # Entry Point
 app = Flask(__name__)  # Create a new Flask application instance
+app.request_class = ChatRequest  # Stream uploads into size- and format-checked buffers
 app.config.from_object(Config)  # Load configuration from the Config object
+app.json = FastJSONProvider(app)  # orjson-backed jsonify() with ISO 8601 timestamps
 
-db.init_app(app)  # Initialize SQLAlchemy with the Flask app
+init_database(app)  # Primary engine plus one engine per read replica
 
-# Ensure upload folder exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)  # Create the upload folder if it doesn't exist
+# Pub/sub hub that pushes new messages to connected clients
+events = EventHub(create_event_backend(app.config))
 
-# Initialize OpenAI client
-client = OpenAI()  # Initialize the OpenAI client for interacting with OpenAI APIs
+# Cache of finished transcriptions keyed by audio hash, so repeated clips skip the API
+transcript_cache = TranscriptionCache(
+    app.config['TRANSCRIPTION_CACHE_MEMORY_SIZE'], app.config['TRANSCRIPTION_CACHE_TTL'],
+    app.config['TRANSCRIPTION_CACHE_MAX_ROWS']
+) if app.config['TRANSCRIPTION_CACHE_ENABLED'] else None
 
+# Request, query and transcription timings, served at /metrics
+metrics = Metrics(app.config) if app.config['METRICS_ENABLED'] else None
+if metrics:
+    metrics.init_app(app)
+    if transcript_cache:
+        metrics.track_transcription_cache(transcript_cache)
+
+# Function to push a finished voice message to both participants
+def publish_voice_message(vm):
+    events.publish(voice_message_event(voice_message_to_dict(vm), username_of(vm.sender_id), vm.completed_seq))
+
+# Initialize the transcription worker pool
+transcription_queue = TranscriptionQueue(
+    app, create_transcriber(app.config), on_complete=publish_voice_message, cache=transcript_cache, metrics=metrics
+)
+
+# Groups concurrent single-message writes into one commit when MESSAGE_WRITE_COALESCING is on
+write_coalescer = WriteCoalescer(
+    app, app.config['MESSAGE_COALESCE_WINDOW_MS'] / 1000, app.config['MESSAGE_COALESCE_MAX_BATCH']
+)
+
+# Cache of id <-> username lookups, shared by all requests in this process
+user_cache = TTLCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+# Function to prepare every engine the app opens
+def prepare_engine(engine):
+    configure_engine(engine, app.config)  # Apply SQLite pragmas to every pooled connection
+    if metrics:
+        metrics.instrument_engine(engine)  # Count and time every query
+
+# The schema is created and upgraded by migrations (flask --app app migrate), not on import
 with app.app_context():
-    db.create_all()  # Create all database tables if they don't exist
+    for engine in db.engines.values():
+        prepare_engine(engine)
+
+# Monthly files holding messages older than RETENTION_DAYS; history reads fall through to them
+archive = MessageArchive(app.config['ARCHIVE_DIR'] or os.path.join(app.instance_path, 'archive'), prepare_engine)
+
+# Return pagination, search query and ?fields= mistakes as a 400 instead of a server error
+@app.errorhandler(PaginationError)
+@app.errorhandler(SearchError)
+@app.errorhandler(FieldError)
+def handle_pagination_error(e):
+    return jsonify({"error": str(e)}), 400
+
+# Return upload rejections as JSON like the other errors
+@app.errorhandler(RequestEntityTooLarge)
+@app.errorhandler(UnsupportedMediaType)
+def handle_upload_rejected(e):
+    return jsonify({"error": e.description}), e.code
+
+# Compress large responses for clients that accept gzip or brotli
+@app.after_request
+def compress(response):
+    return compress_response(response, app.config)
+
+# Function to convert a message into its JSON representation
+def message_to_dict(message):
+    return {field: getattr(message, field) for field in MESSAGE_FIELDS}
+
+# Function to convert a voice message into its JSON representation
+def voice_message_to_dict(vm):
+    return {field: getattr(vm, field) for field in VOICE_MESSAGE_FIELDS}
+
+# Function to look up a user by username, going through the user cache
+def find_user_by_username(username):
+    user = user_cache.get(('username', username))
+    if user is MISSING:
+        row = User.query.filter_by(username=username).first()  # Served by the unique username index
+        user = {"id": row.id, "username": row.username} if row else None
+        if user:
+            user_cache.set(('username', username), user)
+            user_cache.set(('id', user['id']), user)
+        else:
+            # Remember unknown names only briefly; create_user in another worker can't invalidate them
+            user_cache.set(('username', username), None, ttl=app.config['USER_CACHE_NEGATIVE_TTL'])
+    return user
+
+# Function to look up a user by ID, going through the user cache
+def find_user(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    user = user_cache.get(('id', user_id))
+    if user is MISSING:
+        row = db.session.get(User, user_id)
+        if not row:
+            return None
+        user = {"id": row.id, "username": row.username}
+        user_cache.set(('id', user_id), user)
+        user_cache.set(('username', row.username), user)
+    return user
+
+# Function to get a user's username, or None if the user doesn't exist
+def username_of(user_id):
+    user = find_user(user_id)
+    return user['username'] if user else None
+
+# Function to compute the ETag of a user directory listing. Users are only ever added,
+# so the highest user ID together with the query string identifies the listing.
+def user_directory_etag():
+    max_id = db.session.query(func.max(User.id)).scalar() or 0
+    return hashlib.sha1(f"{max_id}?{request.query_string.decode()}".encode()).hexdigest()
+
+# Function to get the smallest string that sorts after every string starting with prefix, or None
+# when there is none (the prefix is all U+10FFFF). Trailing U+10FFFF can't be incremented, so the
+# bound is taken on the prefix without them; surrogates can't be encoded, so they are skipped.
+def prefix_upper_bound(prefix):
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return None
+    next_code = ord(stem[-1]) + 1
+    if 0xD800 <= next_code <= 0xDFFF:
+        next_code = 0xE000
+    return stem[:-1] + chr(next_code)
 
 # Route to create a new user
 @app.route('/users', methods=['POST'])
@@ -35,13 +182,53 @@ def create_user():
     new_user = User(username=username)  # Create a new user object
     db.session.add(new_user)  # Add the new user to the database session
     db.session.commit()  # Commit the session to save the user in the database
+    user_cache.pop(('username', username))  # Drop any cached "not found" for this name
     return jsonify({"id": new_user.id, "username": new_user.username}), 201  # Return the new user's info
 
-# Route to get a list of all users
+# Route to get a page of users, optionally filtered by username prefix
 @app.route('/users', methods=['GET'])
+@reads_from_replica
 def get_users():
-    users = User.query.all()  # Query all users from the database
-    return jsonify([{"id": user.id, "username": user.username} for user in users])  # Return user data as JSON
+    etag = user_directory_etag()
+    if request.if_none_match.contains_weak(etag):  # Compressed listings carry a weak ETag
+        response = app.response_class(status=304)  # The client's copy is still current
+        response.set_etag(etag)
+        return response
+
+    limit, _, after = page_args(request.args, app.config)  # Read ?limit= and the ?after= cursor
+    fields = parse_fields(request.args.get('fields'), USER_FIELDS)  # Optional ?fields= projection
+    prefix = request.args.get('prefix', '')  # Optional username prefix to search for
+    query = db.select(User.id, User.username)
+    if prefix:
+        query = query.where(User.username >= prefix)  # Index range
+        upper_bound = prefix_upper_bound(prefix)
+        if upper_bound is not None:
+            query = query.where(User.username < upper_bound)
+    if after:
+        query = query.where(User.id > decode_cursor(after, int)[0])
+    users = db.session.execute(query.order_by(User.id).limit(limit)).all()  # Query one page of users
+    next_cursor = encode_cursor(users[-1].id) if len(users) == limit else None
+
+    response = with_cursor(jsonify(project((user._asdict() for user in users), fields)), next_cursor)
+    response.set_etag(etag)
+    return response  # Return user data as JSON
+
+# Route to look up a single user by username
+@app.route('/users/by-username/<username>', methods=['GET'])
+@read_only_request
+def get_user_by_username(username):
+    user = find_user_by_username(username)  # Cached lookup backed by the unique username index
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify(user)
+
+# Function to check a message payload, returning an (error, status code) pair or (None, None)
+def message_payload_error(sender_id, recipient_id, content):
+    if not sender_id or not recipient_id or not content:
+        return "sender_id, recipient_id, and content are required", 400
+    if not isinstance(content, str) or len(content) > app.config['MAX_MESSAGE_LENGTH']:
+        return f"message is longer than {app.config['MAX_MESSAGE_LENGTH']} characters", 401
+    return None, None
 
 # Route to send a message between users
 @app.route('/messages', methods=['POST'])
@@ -51,54 +238,120 @@ def send_message():
     recipient_id = data.get('recipient_id')  # Extract the recipient ID
     content = data.get('content')  # Extract the message content
     
-    if not sender_id or not recipient_id or not content:
-        return jsonify({"error": "sender_id, recipient_id, and content are required"}), 400  # Validate input
-    elif len(content) > 10:
-        return jsonify({"error": "message is longer than 500 characters"}), 401
-    sender = User.query.get(sender_id)  # Get the sender from the database
-    recipient = User.query.get(recipient_id)  # Get the recipient from the database
+    error, status = message_payload_error(sender_id, recipient_id, content)
+    if error:
+        return jsonify({"error": error}), status  # Validate input
+    sender = find_user(sender_id)  # Get the sender from the user cache or database
+    recipient = find_user(recipient_id)  # Get the recipient from the user cache or database
     if not sender or not recipient:
         return jsonify({"error": "Sender or recipient not found"}), 404  # Check if sender and recipient exist
     
-    new_message = Message(content=content, sender_id=sender_id, recipient_id=recipient_id)  # Create a new message
-    db.session.add(new_message)  # Add the message to the session
-    db.session.commit()  # Commit the session to save the message in the database
+    if app.config['MESSAGE_WRITE_COALESCING']:
+        # Share one commit with the other messages arriving in the same few milliseconds
+        row = {"content": content, "sender_id": sender['id'], "recipient_id": recipient['id'],
+               "conversation_key": conversation_key(sender['id'], recipient['id'])}
+        db.session.rollback()  # Hand back the write lock (if a user lookup took it) before waiting on the group commit
+        message_id, timestamp = write_coalescer.submit(row)
+        message = {"id": message_id, "content": content, "timestamp": timestamp,
+                   "sender_id": sender['id'], "recipient_id": recipient['id']}
+    else:
+        new_message = Message(content=content, sender_id=sender_id, recipient_id=recipient_id)  # Create a new message
+        db.session.add(new_message)  # Add the message to the session
+        db.session.flush()  # Assign the ID and timestamp
+        record_messages([summarized('text', new_message.id, sender_id, recipient_id, new_message.timestamp, content)])
+        db.session.commit()  # Commit the session to save the message and conversation summaries
+        message = message_to_dict(new_message)
+    events.publish(message_event(message, sender['username']))  # Push to both participants
     
-    return jsonify({
-        "id": new_message.id,
-        "content": new_message.content,
-        "timestamp": new_message.timestamp,
-        "sender_id": new_message.sender_id,
-        "recipient_id": new_message.recipient_id
-    }), 201  # Return the new message details
+    return jsonify(message), 201  # Return the new message details
 
-# Route to get all messages between two users
+# Route to send many messages at once, e.g. for bridges and history imports.
+# All users are validated with one query and rows are inserted in chunked transactions. If a chunk
+# fails, the messages of earlier chunks are still reported (and pushed) as created and the rest
+# get status 500, so clients retry only those.
+@app.route('/messages/batch', methods=['POST'])
+def send_messages_batch():
+    items = (request.json or {}).get('messages')  # Get the list of messages from the request
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "messages must be a non-empty list"}), 400
+    if len(items) > app.config['BATCH_MAX_MESSAGES']:
+        return jsonify({"error": f"At most {app.config['BATCH_MAX_MESSAGES']} messages per batch"}), 413
+
+    # Validate every item and collect the user IDs they refer to
+    results = [None] * len(items)
+    candidates = []  # (index, row) pairs that passed validation
+    for index, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        error, status = message_payload_error(item.get('sender_id'), item.get('recipient_id'), item.get('content'))
+        if not error:
+            try:
+                sender_id, recipient_id = int(item['sender_id']), int(item['recipient_id'])
+            except (TypeError, ValueError):
+                error, status = "sender_id and recipient_id must be integers", 400
+        if error:
+            results[index] = {"index": index, "status": 400 if status == 401 else status, "error": error}
+            continue
+        candidates.append((index, {"content": item['content'], "sender_id": sender_id, "recipient_id": recipient_id,
+                                   "conversation_key": conversation_key(sender_id, recipient_id)}))
+
+    user_ids = {row[key] for _, row in candidates for key in ('sender_id', 'recipient_id')}
+    known = set(db.session.scalars(db.select(User.id).where(User.id.in_(user_ids)))) if user_ids else set()
+
+    accepted = []
+    for index, row in candidates:
+        if row['sender_id'] in known and row['recipient_id'] in known:
+            accepted.append((index, row))
+        else:
+            results[index] = {"index": index, "status": 404, "error": "Sender or recipient not found"}
+
+    try:
+        inserted = insert_messages([row for _, row in accepted], app.config['BATCH_CHUNK_SIZE'])
+    except IngestError as e:
+        inserted = e.inserted  # Earlier chunks are committed; only the rest can be retried
+        for index, _ in accepted[len(inserted):]:
+            results[index] = {"index": index, "status": 500, "error": "Message could not be stored; retry it"}
+    for (index, row), (message_id, timestamp) in zip(accepted, inserted):
+        results[index] = {"index": index, "status": 201, "id": message_id, "timestamp": timestamp}
+        message = {"id": message_id, "content": row['content'], "timestamp": timestamp,
+                   "sender_id": row['sender_id'], "recipient_id": row['recipient_id']}
+        events.publish(message_event(message, username_of(row['sender_id'])))  # Push to both participants
+
+    return jsonify({"created": len(inserted), "failed": len(items) - len(inserted), "results": results})
+
+# Route to get a page of messages between two users
 @app.route('/messages', methods=['GET'])
+@reads_from_replica
 def get_messages():
-    user1_id = request.args.get('user1_id')  # Extract the first user ID from the query parameters
-    user2_id = request.args.get('user2_id')  # Extract the second user ID from the query parameters
+    user1_id = request.args.get('user1_id', type=int)  # Extract the first user ID from the query parameters
+    user2_id = request.args.get('user2_id', type=int)  # Extract the second user ID from the query parameters
     
     if not user1_id or not user2_id:
         return jsonify({"error": "Both user1_id and user2_id are required"}), 400  # Validate input
+    fields = parse_fields(request.args.get('fields'), MESSAGE_FIELDS)  # Optional ?fields= projection
+    key = conversation_key(user1_id, user2_id)
+    if wants_ndjson():
+        # Stream the whole history (or ?limit= rows) oldest first, one JSON object per line
+        return ndjson_response(conversation_rows(
+            Message, key, fields, request.args.get('after'), request.args.get('limit', type=int), archive=archive
+        ))
+    limit, before, after = page_args(request.args, app.config)  # Read ?limit=, ?before= and ?after=
+    
+    # Range scan over the conversation index, newest page first unless a cursor is given
+    messages, next_cursor = conversation_page(Message, key, limit, before, after, fields, archive)
     
-    # Query messages where user1 is the sender and user2 is the recipient or vice versa
-    messages = Message.query.filter(
-        ((Message.sender_id == user1_id) & (Message.recipient_id == user2_id)) |
-        ((Message.sender_id == user2_id) & (Message.recipient_id == user1_id))
-    ).order_by(Message.timestamp).all()  # Order by timestamp
-    
-    return jsonify([{
-        "id": message.id,
-        "content": message.content,
-        "timestamp": message.timestamp,
-        "sender_id": message.sender_id,
-        "recipient_id": message.recipient_id
-    } for message in messages])  # Return the messages as JSON
-
-# Route to upload a voice message and get a transcription
+    return with_cursor(jsonify(messages), next_cursor)  # Return as JSON
+
+# Function to add a new voice message to the conversation summaries before it is committed
+def record_voice_message(vm):
+    db.session.flush()  # Assign the ID and timestamp
+    record_messages([summarized('voice', vm.id, vm.sender_id, vm.recipient_id, vm.timestamp, vm.transcription)])
+
+# Route to upload a voice message and queue it for transcription
 @app.route('/voice_messages', methods=['POST'])
 def upload_voice_message():
-    if 'file' not in request.files:
+    if request.content_length and request.content_length > app.config['VOICE_MESSAGE_MAX_BYTES']:
+        raise RequestEntityTooLarge("Voice message is too large")  # Reject before reading the body
+    if 'file' not in request.files:  # Parsing streams the file into a checked AudioUploadStream
         return jsonify({"error": "No file part"}), 400  # Validate that a file was uploaded
     file = request.files['file']
     if file.filename == '':
@@ -109,67 +362,261 @@ def upload_voice_message():
     
     if not sender_id or not recipient_id:
         return jsonify({"error": "sender_id and recipient_id are required"}), 400  # Validate input
+    if not (sender_id.isdecimal() and recipient_id.isdecimal()):
+        return jsonify({"error": "sender_id and recipient_id must be integers"}), 400
+    sender = find_user(sender_id)  # Get the sender from the user cache or database
+    recipient = find_user(recipient_id)  # Get the recipient from the user cache or database
+    if not sender or not recipient:
+        return jsonify({"error": "Sender or recipient not found"}), 404  # Check if sender and recipient exist
     
-    if file and file.filename.rsplit('.', 1)[1].lower() in ['wav', 'mp3', 'ogg']:  # Check file extension
-        filename = secure_filename(file.filename)  # Secure the filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)  # Define the file path
-        file.save(file_path)  # Save the file
-        
-        try:
-            with open(file_path, "rb") as audio_file:
-                transcript = client.audio.transcriptions.create(model="whisper-1", file=audio_file)  # Transcribe
-            transcription = transcript.text  # Extract the transcription text
-        except Exception as e:
-            transcription = f"Transcription failed: {str(e)}"  # Handle transcription errors
-        
-        # Create a new voice message with the transcription
+    audio = file.stream  # Format was sniffed from the header bytes while the body streamed in
+    filename = secure_filename(file.filename)  # Secure the filename
+    storage_key = f"{uuid.uuid4().hex}.{audio.audio_format}"  # Unique name for the buffer handed to the transcriber
+    
+    # Identical audio (client retries, forwarded clips) reuses the earlier transcription
+    model = transcription_queue.transcriber.model
+    cached = transcript_cache.get(audio.sha256, model) if transcript_cache else None
+    if cached is not None:
         new_voice_message = VoiceMessage(
-            filename=filename, 
-            sender_id=sender_id, 
-            recipient_id=recipient_id,
-            transcription=transcription
+            filename=filename,
+            sender_id=sender['id'],
+            recipient_id=recipient['id'],
+            transcription=cached,
+            status='completed',
+            completed_seq=db.session.scalar(next_completed_seq())
         )
-        
         db.session.add(new_voice_message)  # Add the voice message to the session
+        record_voice_message(new_voice_message)
         db.session.commit()  # Commit the session to save the voice message in the database
-        
-        # Delete the audio file after transcription
-        os.remove(file_path)
-        
-        return jsonify({
-            "id": new_voice_message.id,
-            "filename": new_voice_message.filename,
-            "timestamp": new_voice_message.timestamp,
-            "sender_id": new_voice_message.sender_id,
-            "recipient_id": new_voice_message.recipient_id,
-            "transcription": new_voice_message.transcription
-        }), 201  # Return the voice message details
-    return jsonify({"error": "File type not allowed. Only WAV, MP3, and OGG files are accepted."}), 400  # Invalid file
-
-# Route to get all voice messages between two users
+        publish_voice_message(new_voice_message)  # Push to both participants
+        return jsonify(voice_message_to_dict(new_voice_message)), 201  # Transcribed from the cache
+    
+    # Create the voice message right away; the transcription is filled in by a worker
+    new_voice_message = VoiceMessage(
+        filename=filename, 
+        sender_id=sender['id'],  # Integers, as rows aren't reloaded after the commit
+        recipient_id=recipient['id'],
+        status='pending'
+    )
+    
+    db.session.add(new_voice_message)  # Add the voice message to the session
+    record_voice_message(new_voice_message)
+    db.session.commit()  # Commit the session to save the voice message in the database
+    
+    # The worker caches the result under the audio's hash and releases the buffer
+    transcription_queue.submit(
+        new_voice_message.id, audio.claim(), storage_key, digest=audio.sha256, duration=audio.duration
+    )
+    
+    location = url_for('get_voice_message', voice_message_id=new_voice_message.id)  # Where to poll for the result
+    return jsonify(voice_message_to_dict(new_voice_message)), 202, {'Location': location}  # Accepted for processing
+
+# Route to poll the transcription status of a single voice message
+@app.route('/voice_messages/<int:voice_message_id>', methods=['GET'])
+@read_only_request
+def get_voice_message(voice_message_id):
+    voice_message = db.session.get(VoiceMessage, voice_message_id)  # Look up the voice message by ID
+    if not voice_message:
+        return jsonify({"error": "Voice message not found"}), 404
+    return jsonify(voice_message_to_dict(voice_message))  # Return the voice message and its status
+
+# Route to get a page of voice messages between two users
 @app.route('/voice_messages', methods=['GET'])
+@reads_from_replica
 def get_voice_messages():
-    user1_id = request.args.get('user1_id')  # Extract the first user ID from the query parameters
-    user2_id = request.args.get('user2_id')  # Extract the second user ID from the query parameters
+    user1_id = request.args.get('user1_id', type=int)  # Extract the first user ID from the query parameters
+    user2_id = request.args.get('user2_id', type=int)  # Extract the second user ID from the query parameters
     
     if not user1_id or not user2_id:
         return jsonify({"error": "Both user1_id and user2_id are required"}), 400  # Validate input
+    fields = parse_fields(request.args.get('fields'), VOICE_MESSAGE_FIELDS)  # Optional ?fields= projection
+    key = conversation_key(user1_id, user2_id)
+    if wants_ndjson():
+        # Stream the whole history (or ?limit= rows) oldest first, one JSON object per line
+        return ndjson_response(conversation_rows(
+            VoiceMessage, key, fields, request.args.get('after'), request.args.get('limit', type=int), archive=archive
+        ))
+    limit, before, after = page_args(request.args, app.config)  # Read ?limit=, ?before= and ?after=
     
-    # Query voice messages where user1 is the sender and user2 is the recipient or vice versa
-    voice_messages = VoiceMessage.query.filter(
-        ((VoiceMessage.sender_id == user1_id) & (VoiceMessage.recipient_id == user2_id)) |
-        ((VoiceMessage.sender_id == user2_id) & (VoiceMessage.recipient_id == user1_id))
-    ).order_by(VoiceMessage.timestamp).all()  # Order by timestamp
-    
-    return jsonify([{
-        "id": vm.id,
-        "filename": vm.filename,
-        "timestamp": vm.timestamp,
-        "sender_id": vm.sender_id,
-        "recipient_id": vm.recipient_id,
-        "transcription": vm.transcription
-    } for vm in voice_messages])  # Return the voice messages as JSON
-
-# Run the app in debug mode
+    # Range scan over the conversation index, newest page first unless a cursor is given
+    voice_messages, next_cursor = conversation_page(VoiceMessage, key, limit, before, after, fields, archive)
+    
+    return with_cursor(jsonify(voice_messages), next_cursor)  # Return as JSON
+
+# Route to get a page of the merged text and voice timeline between two users
+@app.route('/conversations/<int:user1_id>/<int:user2_id>/timeline', methods=['GET'])
+@reads_from_replica
+def get_timeline(user1_id, user2_id):
+    limit, before, after = page_args(request.args, app.config)  # Read ?limit=, ?before= and ?after=
+    fields = parse_fields(request.args.get('fields'), TIMELINE_FIELDS)  # Optional ?fields= projection
+    items, next_cursor = timeline_page(conversation_key(user1_id, user2_id), limit, before, after, archive)  # Merged in SQL
+    return with_cursor(jsonify(project(items, fields)), next_cursor)  # Return the timeline items as JSON
+
+# Route to get a page of a user's conversations, most recently active first, with the partner,
+# a preview of the last message and the number of unread messages. Read from the conversation
+# summaries; page on with the ?after= cursor from the X-Next-Cursor header. Served by the primary,
+# since a lagging replica would bring back unread counts the user just cleared with mark-read.
+@app.route('/users/<int:user_id>/conversations', methods=['GET'])
+@read_only_request
+def get_conversations(user_id):
+    if not find_user(user_id):
+        return jsonify({"error": "User not found"}), 404
+    limit, before, after = page_args(request.args, app.config)  # Read ?limit= and the ?after= cursor
+    if before:
+        raise PaginationError("Conversation lists only page forward, with after")
+    fields = parse_fields(request.args.get('fields'), CONVERSATION_FIELDS)  # Optional ?fields= projection
+    conversations, next_cursor = conversation_list(user_id, limit, after, fields)
+    return with_cursor(jsonify(conversations), next_cursor)
+
+# Route to mark a partner's messages as read, all of them or up to the "up_to" timestamp of the JSON
+# body (e.g. the newest message the client has shown). The partner sees it as partner_read_at.
+@app.route('/users/<int:user_id>/conversations/<int:partner_id>/read', methods=['POST'])
+def mark_conversation_read(user_id, partner_id):
+    up_to = (request.get_json(silent=True) or {}).get('up_to')
+    if up_to is not None:
+        try:
+            up_to = datetime.fromisoformat(up_to)
+        except (TypeError, ValueError):
+            return jsonify({"error": "up_to must be an ISO 8601 timestamp"}), 400
+        if up_to.tzinfo:
+            up_to = up_to.astimezone(timezone.utc).replace(tzinfo=None)  # Timestamps are stored as naive UTC
+    summary = mark_read(user_id, partner_id, up_to)
+    if summary is None:
+        return jsonify({"error": "Conversation not found"}), 404
+    conversation = {field: getattr(summary, field, None) for field in CONVERSATION_FIELDS}
+    conversation['partner_username'] = username_of(partner_id)
+    return jsonify(conversation)
+
+# Route to search text messages and voice transcriptions, best match first. ?user1_id= limits the
+# search to that user's conversations and adding ?user2_id= limits it to the conversation between them.
+@app.route('/search', methods=['GET'])
+@reads_from_replica
+def search():
+    query = request.args.get('q', '')  # Words to search for; end a word with * to match it as a prefix
+    user1_id = request.args.get('user1_id', type=int)
+    user2_id = request.args.get('user2_id', type=int)
+    if user2_id and not user1_id:
+        return jsonify({"error": "user2_id requires user1_id"}), 400
+    limit = request.args.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))  # Clamp to a sane page size
+    fields = parse_fields(request.args.get('fields'), SEARCH_FIELDS)  # Optional ?fields= projection
+
+    items, next_cursor = search_page(
+        query, limit, request.args.get('after'), user1_id, user2_id,
+        app.config['SEARCH_HIGHLIGHT'], app.config['SEARCH_SNIPPET_TOKENS'], app.config['SEARCH_MAX_CANDIDATES']
+    )
+    return with_cursor(jsonify(project(items, fields)), next_cursor)  # Return the results as JSON
+
+# Command to create or upgrade the database schema: flask --app app migrate
+@app.cli.command('migrate')
+@click.option('--dry-run', is_flag=True, help="List the pending steps without applying them")
+def migrate_command(dry_run):
+    if dry_run:
+        steps = [(version, description) for version, description, _ in pending_migrations(db.engine)]
+    else:
+        steps = migrate(db.engine)
+    for version, description in steps:
+        click.echo(f"{'Pending' if dry_run else 'Applied'} {version}: {description}")
+    if not steps:
+        click.echo("Schema is up to date")
+
+# Command to copy the SQLite primary onto the SQLite read replicas: flask --app app sync-replicas
+@app.cli.command('sync-replicas')
+def sync_replicas_command():
+    for path in sync_sqlite_replicas():
+        click.echo(f"Copied the primary to {path}")
+
+# Command to archive old messages and compact the database once: flask --app app archive
+@app.cli.command('archive')
+@click.option('--days', type=int, help="Retention horizon, overriding RETENTION_DAYS")
+def archive_command(days):
+    if days is not None:
+        app.config['RETENTION_DAYS'] = days
+    report = run_retention(archive, app.config)
+    for (kind, month), count in sorted(report['moved'].items()):
+        click.echo(f"Moved {count} {kind} messages to {archive.path(month)}")
+    click.echo(describe_report(report))
+
+# Command to hand free pages back to the OS: flask --app app compact [--full]
+@app.cli.command('compact')
+@click.option('--full', is_flag=True, help="Rewrite the file with VACUUM, enabling incremental vacuum (blocks writers)")
+def compact_command(full):
+    report = compact(db.engine, app.config['COMPACT_MAX_PAGES'], full=full)
+    if report is None:
+        click.echo("Compaction is only implemented for SQLite")
+        return
+    click.echo(f"Reclaimed {report['reclaimed_bytes'] / 1024:.0f} KiB: "
+               f"{report['before']['file_bytes'] / 1024:.0f} KiB -> {report['after']['file_bytes'] / 1024:.0f} KiB on disk, "
+               f"{report['after']['free_bytes'] / 1024:.0f} KiB still free")
+    if not report['incremental']:
+        click.echo("Incremental vacuum is off for this file; run with --full once to enable it")
+
+# Command to compare the conversation summaries with the messages: flask --app app check-summaries [--repair]
+@app.cli.command('check-summaries')
+@click.option('--repair', is_flag=True, help="Rewrite the summaries that differ")
+def check_summaries_command(repair):
+    with db.engine.begin() as connection:
+        report = check_summaries(connection, repair=repair)
+    click.echo(f"Checked {report['checked']} summaries: {len(report['missing'])} missing, "
+               f"{len(report['stale'])} stale, {len(report['orphaned'])} orphaned")
+    for problem in ('missing', 'stale', 'orphaned'):
+        for user_id, partner_id in report[problem][:20]:
+            click.echo(f"  {problem}: user {user_id}, partner {partner_id}")
+    if repair:
+        click.echo("Repaired")
+    elif report['missing'] or report['stale'] or report['orphaned']:
+        raise SystemExit(1)  # Let scripts notice drift
+
+# Command to index messages written before the search index existed: flask --app app rebuild-search-index
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    counts = rebuild_search_index(db.engine)
+    click.echo(f"Indexed {counts['text']} messages and {counts['voice']} voice messages")
+
+# Route to stream a user's new messages as Server-Sent Events. Reconnecting clients send
+# Last-Event-ID (or ?last_event_id=) and get everything after it replayed first. The ID holds the last
+# text message ID and the last voice completion number, since voice messages finish out of ID order.
+@app.route('/users/<int:user_id>/events', methods=['GET'])
+@read_only_request
+def stream_events(user_id):
+    if not find_user(user_id):
+        return jsonify({"error": "User not found"}), 404
+
+    subscription = events.subscribe(user_id)  # Subscribe before replaying so nothing falls in between
+    last_ids = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    replay = []
+    caught_up = True
+    if last_ids:
+        text_id, voice_id = last_ids
+        limit = app.config['EVENT_REPLAY_LIMIT']
+        messages = Message.query.filter(
+            Message.id > text_id, or_(Message.sender_id == user_id, Message.recipient_id == user_id)
+        ).order_by(Message.id).limit(limit).all()  # Primary key range scan from the last seen message
+        voice_messages = VoiceMessage.query.filter(
+            VoiceMessage.completed_seq > voice_id,
+            or_(VoiceMessage.sender_id == user_id, VoiceMessage.recipient_id == user_id)
+        ).order_by(VoiceMessage.completed_seq).limit(limit).all()  # Unfinished ones are pushed once transcribed
+        texts = [message_event(message_to_dict(m), username_of(m.sender_id)) for m in messages]
+        voices = [
+            voice_message_event(voice_message_to_dict(vm), username_of(vm.sender_id), vm.completed_seq)
+            for vm in voice_messages
+        ]
+        # Interleave by timestamp but keep each kind in cursor order, so a stream cut off mid-replay
+        # resumes without skipping anything
+        replay = list(heapq.merge(texts, voices, key=lambda event: event['timestamp']))
+        caught_up = len(messages) < limit and len(voice_messages) < limit  # Otherwise more are waiting
+    else:
+        last_ids = (0, 0)
+
+    stream = sse_stream(subscription, replay, last_ids, app.config['EVENT_HEARTBEAT'], caught_up)
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+    })
+
+# Run the app in debug mode (use serve.py in production)
 if __name__ == '__main__':
+    if app.config['MIGRATE_ON_START']:
+        with app.app_context():
+            migrate(db.engine)
     app.run(debug=True)
@@ -0,0 +1,140 @@
+# audio.py
+
+import io
+import struct
+import wave
+import numpy as np
+
+# Function to detect the audio container from the first bytes of a file.
+# Returns 'wav', 'mp3', 'ogg' or None when the bytes don't look like audio.
+def sniff_audio_format(header):
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:4] == b'OggS':
+        return 'ogg'
+    if header[:3] == b'ID3' or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return 'mp3'  # ID3 tag or a bare MPEG audio frame sync
+    return None
+
+# Function to read a WAV file's duration in seconds from its header bytes.
+# Returns None when the fmt and data chunks aren't both within the given bytes.
+def wav_duration(header):
+    byte_rate = None
+    offset = 12  # Skip "RIFF", the RIFF size and "WAVE"
+    while offset + 8 <= len(header):
+        chunk_id, chunk_size = struct.unpack('<4sI', header[offset:offset + 8])
+        if chunk_id == b'fmt ' and offset + 20 <= len(header):
+            byte_rate = struct.unpack('<I', header[offset + 16:offset + 20])[0]  # After format, channels and rate
+        elif chunk_id == b'data':
+            if not byte_rate or chunk_size == 0xFFFFFFFF:
+                return None  # Unknown rate, or a streamed WAV without a real length
+            return chunk_size / byte_rate
+        offset += 8 + chunk_size + (chunk_size & 1)  # Chunks are padded to an even size
+    return None
+
+# Function to decode a PCM WAV file into mono float32 samples in [-1, 1] and its sample rate
+def decode_wav(data):
+    with wave.open(io.BytesIO(data), 'rb') as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(frames, np.uint8).astype(np.float32) - 128) / 128  # 8-bit WAV is unsigned
+    elif width == 2:
+        samples = np.frombuffer(frames, '<i2').astype(np.float32) / 32768
+    elif width == 3:
+        raw = np.frombuffer(frames, np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8).astype(np.float32) / 8388608
+    else:
+        samples = np.frombuffer(frames, '<i4').astype(np.float32) / 2147483648
+    return samples.reshape(-1, channels).mean(axis=1), rate  # Downmix by averaging the channels
+
+# Function to resample to target_rate, low-pass filtering first so downsampling doesn't alias
+def resample(samples, rate, target_rate, taps=63):
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < rate:
+        cutoff = 0.5 * target_rate / rate * 0.95  # Just below the new Nyquist frequency, in cycles per sample
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)  # Windowed-sinc FIR
+        samples = np.convolve(samples, kernel / kernel.sum(), mode='same')
+    positions = np.arange(int(len(samples) * target_rate / rate)) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+# Function to compute the RMS level in dB of consecutive frames of frame samples each
+def frame_energy_db(samples, frame):
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame)
+    return 10 * np.log10(np.maximum(np.mean(frames ** 2, axis=1), 1e-12))
+
+# Function to cut leading and trailing silence, judged by the RMS energy of short frames
+def trim_silence(samples, rate, threshold_db, frame_ms=20, padding_ms=150):
+    frame = max(1, rate * frame_ms // 1000)
+    if len(samples) < frame:
+        return samples
+    loud = np.flatnonzero(frame_energy_db(samples, frame) > threshold_db)
+    if loud.size == 0:
+        return samples  # All quiet; leave it to the transcriber
+    padding = padding_ms // frame_ms  # Keep a little context around speech
+    start = max(loud[0] - padding, 0) * frame
+    end = min((loud[-1] + 1 + padding) * frame, len(samples))
+    return samples[start:end]
+
+# Function to split a long clip into segments of at most max_seconds, cutting at the quietest
+# point in the second half of each segment so cuts land in pauses rather than mid-word.
+# Every cut costs the transcriber some context, so segments are kept as long as allowed.
+# Returns (start, end) sample offsets.
+def split_on_silence(samples, rate, max_seconds, frame_ms=20):
+    frame = max(1, rate * frame_ms // 1000)
+    max_frames = max(2, int(max_seconds * 1000 / frame_ms))
+    count = len(samples) // frame
+    if count <= max_frames:
+        return [(0, len(samples))]
+    # Average over ~100ms so a longer pause beats a single quiet frame
+    energy = np.convolve(frame_energy_db(samples, frame), np.ones(5) / 5, mode='same')
+    bounds = []
+    start = 0
+    while count - start > max_frames:
+        earliest = start + max_frames // 2
+        window = energy[earliest:start + max_frames]
+        cut = earliest + len(window) - 1 - int(np.argmin(window[::-1]))  # Latest of the quietest frames
+        bounds.append((start * frame, cut * frame))
+        start = cut
+    bounds.append((start * frame, len(samples)))
+    return bounds
+
+# Function to encode float samples as G.711 mu-law bytes (8 bits per sample)
+def mulaw_encode(samples):
+    pcm = (samples * 32767).astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), 32635) + 0x84  # Clip, then add the G.711 bias
+    exponent = np.floor(np.log2(magnitude >> 7)).astype(np.int32)  # Segment = highest set bit above bit 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | exponent << 4 | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+# Function to encode mono float samples as a WAV file, either 16-bit PCM or 8-bit mu-law
+def encode_wav(samples, rate, encoding='pcm16'):
+    samples = np.clip(samples, -1, 1)
+    if encoding == 'mulaw':
+        payload = mulaw_encode(samples)
+        fmt = struct.pack('<HHIIHHH', 7, 1, rate, rate, 1, 8, 0)  # WAVE_FORMAT_MULAW needs a cbSize field
+        fact = b'fact' + struct.pack('<II', 4, len(samples))  # Non-PCM formats carry a sample count
+    else:
+        payload = (samples * 32767).astype('<i2').tobytes()
+        fmt = struct.pack('<HHIIHH', 1, 1, rate, rate * 2, 2, 16)
+        fact = b''
+    body = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + fact
+    body += b'data' + struct.pack('<I', len(payload)) + payload
+    if len(payload) & 1:
+        body += b'\0'  # Pad the data chunk to an even size
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+# Function to decode a WAV clip and run the sample-level preprocessing: downmix, resample, trim silence.
+# Whisper works on 16kHz mono internally, so the extra bytes in typical recordings carry nothing it uses.
+def preprocess_samples(data, target_rate=16000, silence_threshold_db=-45):
+    samples, rate = decode_wav(data)
+    samples = resample(samples, rate, target_rate)
+    return trim_silence(samples, target_rate, silence_threshold_db)
+
+# Function to shrink a WAV clip before transcription
+def preprocess_wav(data, target_rate=16000, silence_threshold_db=-45, encoding='pcm16'):
+    return encode_wav(preprocess_samples(data, target_rate, silence_threshold_db), target_rate, encoding)
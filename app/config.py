@@ -1,8 +1,125 @@
 import os
 
 class Config:
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///chat_with_voice.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///chat_with_voice.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    UPLOAD_FOLDER = 'voice_messages'
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 10),  # Connections kept open per process
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 20),  # Extra connections allowed under load
+        'pool_timeout': 30,
+    }
+    MIGRATE_ON_START = os.environ.get('MIGRATE_ON_START', 'true').lower() == 'true'  # serve.py and app.py apply migrations
+
+    # Read routing: GET /messages, /voice_messages, /users, timelines and search read from these engines,
+    # one per request, round-robin. Writes and everything else use the primary above.
+    DATABASE_REPLICA_URLS = [url for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url]
+    READ_ONLY_CONNECTIONS = os.environ.get('READ_ONLY_CONNECTIONS', 'false').lower() == 'true'  # SQLite without replicas
+    READ_ENGINE_OPTIONS = {  # Pool of each read engine
+        'pool_size': int(os.environ.get('READ_DB_POOL_SIZE') or 10),
+        'max_overflow': int(os.environ.get('READ_DB_MAX_OVERFLOW') or 20),
+        'pool_timeout': 30,
+    }
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB file upload limit
+    MAX_MESSAGE_LENGTH = 500  # Characters per text message
+
+    # Voice uploads are streamed into a buffer and checked while they arrive
+    VOICE_MESSAGE_MAX_BYTES = 25 * 1024 * 1024  # Largest file the Whisper API accepts
+    VOICE_MESSAGE_MAX_SECONDS = 600  # Longest WAV accepted, read from its header
+    VOICE_UPLOAD_SPOOL_SIZE = 1024 * 1024  # Uploads up to 1MB stay in memory, larger ones spill to a temp file
+
+    # Message ingest
+    BATCH_MAX_MESSAGES = 5000  # Messages accepted by one POST /messages/batch
+    BATCH_CHUNK_SIZE = 1000  # Rows inserted per transaction
+    MESSAGE_WRITE_COALESCING = os.environ.get('MESSAGE_WRITE_COALESCING', 'false').lower() == 'true'
+    MESSAGE_COALESCE_WINDOW_MS = 5  # How long the first write of a group waits for others
+    MESSAGE_COALESCE_MAX_BATCH = 500
+
+    # SQLite tuning, applied to every pooled connection
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = 5000  # Milliseconds to wait for a lock held by another writer
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # 256MB of memory-mapped I/O
+    SQLITE_CACHE_SIZE = -64000  # Negative values are in KiB, so about 64MB per connection
+    SQLITE_AUTO_VACUUM = 'INCREMENTAL'  # Lets compaction free pages in small steps (new database files only)
+
+    # Retention: messages older than RETENTION_DAYS move to one SQLite file per month in ARCHIVE_DIR,
+    # and history reads fall through to those files. serve.py runs it in the background when enabled.
+    RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', 'false').lower() == 'true'
+    RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS') or 365)
+    RETENTION_INTERVAL = 3600  # Seconds between background runs
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR')  # Defaults to instance/archive
+    ARCHIVE_BATCH_SIZE = 5000  # Rows moved per transaction
+    COMPACT_MAX_PAGES = 25000  # Free pages handed back to the OS per run (about 100MB at 4KiB pages)
+
+    # Production server (python serve.py)
+    SERVER_BIND = os.environ.get('SERVER_BIND') or '127.0.0.1:5000'
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or (os.cpu_count() or 1) * 2 + 1)  # Worker processes
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 4)  # Threads per worker process
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT') or 30)
+
+    # Instrumentation, exposed in Prometheus format at /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Seconds
+    METRICS_QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)  # Queries per request
+    METRICS_TRANSCRIPTION_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)  # Seconds
+    SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS') or 0) or None  # Log slower requests (None is off)
+    SLOW_REQUEST_TOP_QUERIES = 5  # Statements listed per slow request, most expensive first
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false').lower() == 'true'  # Honour PROFILER_HEADER
+    PROFILER_HEADER = 'X-Profile'  # Requests carrying this header are profiled
+    PROFILER_INTERVAL = 0.005  # Seconds between stack samples
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')  # Where profiles are written; defaults to instance/profiles
+
+    # Response compression
+    COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/plain')
+    COMPRESS_MIN_SIZE = 1024  # Bytes; smaller bodies are sent as they are
+    COMPRESS_LEVEL = 6  # gzip level
+    BROTLI_QUALITY = 5  # Brotli quality, used when the brotli package is installed
+
+    # History pagination
+    PAGE_SIZE = 50  # Default number of items per page
+    MAX_PAGE_SIZE = 500  # Upper bound for the ?limit= parameter
+
+    # Full-text search
+    SEARCH_PAGE_SIZE = 20  # Default number of results per page
+    SEARCH_SNIPPET_TOKENS = 16  # Words of context around the matches in each snippet
+    SEARCH_HIGHLIGHT = ('[', ']')  # Markers placed around matched words in snippets
+    SEARCH_MAX_CANDIDATES = 10000  # Newest matches of each kind that get ranked (None ranks every match)
+
+    # In-process cache of id <-> username lookups
+    USER_CACHE_SIZE = 10000  # Maximum number of cached entries
+    USER_CACHE_TTL = 300  # Seconds before a cached entry is looked up again
+    USER_CACHE_NEGATIVE_TTL = 5  # Seconds to remember unknown usernames (other workers may create them)
+
+    # Audio preprocessing before transcription (WAV only)
+    AUDIO_PREPROCESS = os.environ.get('AUDIO_PREPROCESS', 'true').lower() == 'true'
+    AUDIO_TARGET_RATE = 16000  # Whisper resamples to 16kHz anyway
+    AUDIO_SILENCE_THRESHOLD_DB = -45  # Frames quieter than this count as silence when trimming
+    AUDIO_ENCODING = 'pcm16'  # 'pcm16', or 'mulaw' for 8-bit G.711 at half the size
+
+    # Real-time delivery over Server-Sent Events
+    EVENT_BACKEND = 'memory'  # In-process pub/sub; replace with a broker backend for multi-process setups
+    EVENT_QUEUE_SIZE = 1000  # Events buffered per subscriber before it is disconnected
+    EVENT_HEARTBEAT = 15  # Seconds between keep-alive comments on idle streams
+    EVENT_REPLAY_LIMIT = 1000  # Maximum messages of each kind replayed to a reconnecting client
+
+    # Voice transcription pipeline
+    TRANSCRIBER = os.environ.get('TRANSCRIBER') or 'openai'  # 'openai' or 'fake'
+    TRANSCRIPTION_MODEL = 'whisper-1'
+    TRANSCRIPTION_EXECUTOR = os.environ.get('TRANSCRIPTION_EXECUTOR') or 'thread'  # 'thread' or 'process'
+    TRANSCRIPTION_WORKERS = int(os.environ.get('TRANSCRIPTION_WORKERS') or 4)
+    TRANSCRIPTION_MAX_RETRIES = 3
+    TRANSCRIPTION_RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled after each attempt
+    TRANSCRIPTION_STORE_RETRIES = 5  # Retries of the database write that saves a finished transcription
+    TRANSCRIPTION_STORE_BACKOFF = 0.2  # Seconds before the first retry of that write, doubled after each attempt
+    TRANSCRIPTION_CACHE_ENABLED = os.environ.get('TRANSCRIPTION_CACHE_ENABLED', 'true').lower() == 'true'
+    TRANSCRIPTION_CACHE_MEMORY_SIZE = 1024  # Entries in the in-memory LRU tier
+    TRANSCRIPTION_CACHE_TTL = 30 * 24 * 3600  # Seconds an entry stays valid (30 days)
+    TRANSCRIPTION_CACHE_MAX_ROWS = 100000  # Rows kept in the SQLite tier
+    FAKE_TRANSCRIBER_DELAY = float(os.environ.get('FAKE_TRANSCRIBER_DELAY') or 0)  # Seconds per call
+    FAKE_TRANSCRIBER_DELAY_PER_SECOND = float(os.environ.get('FAKE_TRANSCRIBER_DELAY_PER_SECOND') or 0)  # Per audio second
+
+    # Long WAV clips are split at pauses and the segments transcribed concurrently
+    SEGMENTED_TRANSCRIPTION = os.environ.get('SEGMENTED_TRANSCRIPTION', 'true').lower() == 'true'
+    SEGMENT_SECONDS = 30  # Longest segment sent to the transcriber
+    SEGMENT_COORDINATORS = 2  # Threads that split long clips and stitch their segments back together
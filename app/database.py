@@ -1,5 +1,126 @@
 # database.py
 
+import functools
+import itertools
+import sqlite3
+from flask import current_app, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 
-db = SQLAlchemy()
\ No newline at end of file
+READ_BIND_PREFIX = 'read'  # Bind keys of the read engines are read0, read1, ...
+
+# Session that sends the queries of routes marked with @reads_from_replica to the read engine
+# picked for the request. Flushes, and everything outside those routes, go to the primary.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and 'read_bind' in g:
+            return self._db.engines[g.read_bind]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+# Objects keep their values after a commit: reading them again would begin a new write transaction
+# (see configure_engine) and hold the write lock until the request ends
+db = SQLAlchemy(session_options={'class_': RoutingSession, 'expire_on_commit': False})
+
+# Function to turn a SQLite URL into one that opens the same file read-only
+def read_only_url(url):
+    url = make_url(url)
+    return url.set(database=f"file:{url.database}").update_query_dict({'mode': 'ro', 'uri': 'true'})
+
+# Function to build the SQLALCHEMY_BINDS entries of the read engines, each with READ_ENGINE_OPTIONS
+# as its own pool settings. Without replicas, READ_ONLY_CONNECTIONS reads the SQLite primary
+# through a separate pool of read-only connections.
+def read_binds(config):
+    urls = list(config['DATABASE_REPLICA_URLS'])
+    primary = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if not urls and config['READ_ONLY_CONNECTIONS'] and primary.get_backend_name() == 'sqlite':
+        urls = [read_only_url(primary)]
+    return {f"{READ_BIND_PREFIX}{i}": {'url': url, **config['READ_ENGINE_OPTIONS']} for i, url in enumerate(urls)}
+
+# Function to set up the primary and read engines for the app
+def init_database(app):
+    binds = read_binds(app.config)
+    app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), **binds}
+    db.init_app(app)
+    app.extensions['read_replicas'] = itertools.cycle(list(binds)) if binds else None  # Round-robin over bind keys
+
+# Decorator for routes that only read the primary: their transactions start deferred, without
+# taking the write lock (see configure_engine)
+def read_only_request(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+# Decorator for read-only routes: every query of the request goes to the next read engine, so
+# one response never mixes replicas that lag by different amounts
+def reads_from_replica(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        replicas = current_app.extensions['read_replicas']
+        if replicas is not None:
+            g.read_bind = next(replicas)
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+# Function to apply the SQLite tuning pragmas from the config to every new pooled connection, and
+# to start write transactions with BEGIN IMMEDIATE. pysqlite's deferred transactions read first and
+# take the write lock at the first write; if another commit lands in between, that upgrade fails at
+# once with "database is locked", busy_timeout or not. BEGIN IMMEDIATE takes the lock up front,
+# waiting up to busy_timeout for it. Routes marked with @read_only_request or @reads_from_replica,
+# and read-only files, begin deferred so readers never queue behind writers.
+def configure_engine(engine, config):
+    if engine.dialect.name != 'sqlite':
+        return
+    read_only = engine.url.query.get('mode') == 'ro'
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(connection):
+        if connection.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+            return
+        deferred = read_only or (has_app_context() and g.get('read_only'))
+        connection.exec_driver_sql("BEGIN" if deferred else "BEGIN IMMEDIATE")
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None  # Let begin_transaction issue BEGIN instead of pysqlite
+        cursor = dbapi_connection.cursor()
+        # Wait for locks instead of failing; set first, since the mode pragmas below need a lock too
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}")
+        if not read_only:  # Read-only connections can't change the file's modes; they follow them
+            cursor.execute(f"PRAGMA auto_vacuum={config['SQLITE_AUTO_VACUUM']}")  # Takes effect in new files only
+            cursor.execute(f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")  # WAL lets readers run alongside the writer
+        cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")  # NORMAL is safe in WAL mode
+        cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")  # Read pages through the OS page cache
+        cursor.execute(f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}")  # Per-connection page cache
+        cursor.close()
+
+# Function to fold a SQLite engine's WAL back into the main file. Checkpoints can't run inside a
+# transaction, so this uses an autocommit connection.
+def checkpoint(engine):
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        return connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").one()
+
+# Function to copy the SQLite primary onto every SQLite replica file, returning the paths written.
+# Local stand-in for replication: run it whenever the replicas should catch up. Must run inside
+# an app context; read-only connections to the primary itself are skipped.
+def sync_sqlite_replicas():
+    primary = db.engines[None]
+    if primary.dialect.name != 'sqlite':
+        return []
+    written = []
+    for key, engine in db.engines.items():
+        if key is None or engine.dialect.name != 'sqlite' or engine.url.query.get('mode') == 'ro':
+            continue
+        engine.dispose()  # Replicas reopen the new copy on their next checkout
+        source, target = sqlite3.connect(primary.url.database), sqlite3.connect(engine.url.database)
+        try:
+            source.backup(target)  # Consistent snapshot, even while the primary takes writes
+        finally:
+            source.close()
+            target.close()
+        written.append(engine.url.database)
+    return written
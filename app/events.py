@@ -0,0 +1,149 @@
+# events.py
+
+import json
+import queue
+import threading
+from collections import defaultdict
+
+# Interface for pub/sub backends. The in-memory backend only reaches subscribers in the
+# same process; a broker-backed implementation (Redis, NATS, ...) can be dropped in for
+# multi-process or multi-node deployments.
+class EventBackend:
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+# A subscriber's view of one channel, filled by the backend
+class Subscription:
+    def __init__(self, backend, channel, queue_size):
+        self.backend = backend
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False  # Set when the subscriber fell too far behind and lost events
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True  # The client resumes from its last event ID after reconnecting
+
+    # Wait up to timeout seconds for the next event, returning None if there was none
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+# Backend that fans events out to subscriber queues in this process
+class InMemoryBackend(EventBackend):
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._subscriptions = defaultdict(set)  # channel -> subscriptions
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+# Function to build the event backend selected by the app configuration
+def create_event_backend(config):
+    name = config['EVENT_BACKEND']
+    if isinstance(name, EventBackend):
+        return name  # Allow a ready-made backend to be plugged in directly
+    if name == 'memory':
+        return InMemoryBackend(queue_size=config['EVENT_QUEUE_SIZE'])
+    raise ValueError(f"Unknown event backend: {name}")
+
+# Hub that routes chat events to per-user channels
+class EventHub:
+    def __init__(self, backend):
+        self.backend = backend
+
+    # Send an event to both participants of a conversation
+    def publish(self, event):
+        for user_id in {event['sender_id'], event['recipient_id']}:
+            self.backend.publish(f"user:{user_id}", event)
+
+    def subscribe(self, user_id):
+        return self.backend.subscribe(f"user:{user_id}")
+
+# Function to build the event for a text message from its JSON representation
+def message_event(message, sender_username):
+    return {
+        "kind": "text",
+        **message,
+        "timestamp": message['timestamp'].isoformat(),
+        "sender_username": sender_username,
+        "status": None,
+    }
+
+# Function to build the event for a transcribed voice message from its JSON representation and its
+# completion number, which resuming streams count voice messages by
+def voice_message_event(vm, sender_username, completed_seq):
+    return {
+        "kind": "voice",
+        **vm,
+        "timestamp": vm['timestamp'].isoformat(),
+        "sender_username": sender_username,
+        "content": vm['transcription'],
+        "completed_seq": completed_seq,
+    }
+
+# Function to parse a Last-Event-ID of the form "<text id>-<voice completion number>"
+def parse_event_id(event_id):
+    try:
+        text_id, voice_id = event_id.split('-')
+        return int(text_id), int(voice_id)
+    except (AttributeError, ValueError):
+        return None
+
+# Function to stream events in Server-Sent Events format. Replayed events go out first;
+# live events already covered by the replay are skipped. The stream ends when the
+# subscription overflows so the client reconnects and replays what it missed. A replay cut
+# short by its limit (caught_up=False) also ends the stream, since a live event's ID would
+# skip the rows not replayed yet; the client reconnects from the last replayed event.
+def sse_stream(subscription, replay, last_ids, heartbeat, caught_up=True):
+    text_id, voice_id = last_ids
+    replayed = {(event['kind'], event['id']) for event in replay}
+
+    def format_event(event):
+        nonlocal text_id, voice_id
+        if event['kind'] == 'text':
+            text_id = max(text_id, event['id'])
+        else:
+            voice_id = max(voice_id, event['completed_seq'])
+        return f"id: {text_id}-{voice_id}\nevent: message\ndata: {json.dumps(event)}\n\n"
+
+    try:
+        yield "retry: 3000\n\n"  # Ask clients to reconnect after three seconds
+        for event in replay:
+            yield format_event(event)
+        while caught_up and not subscription.overflowed:
+            event = subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ": keep-alive\n\n"  # Comment line that keeps proxies from closing the connection
+            elif (event['kind'], event['id']) not in replayed:
+                yield format_event(event)
+    finally:
+        subscription.close()
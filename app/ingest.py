@@ -0,0 +1,107 @@
+# ingest.py
+
+import logging
+import os
+import queue
+import threading
+import time
+from sqlalchemy import insert
+from database import db
+from models import Message
+from summaries import record_messages, summarized
+
+ingest_log = logging.getLogger('chat.ingest')
+
+# Raised when a chunk of insert_messages fails. The chunks before it stay committed; inserted holds
+# their (id, timestamp) pairs, so callers can report which rows were stored.
+class IngestError(Exception):
+    def __init__(self, inserted):
+        super().__init__(f"Insert failed after {len(inserted)} rows were committed")
+        self.inserted = inserted
+
+# Function to insert message rows with one multi-row INSERT and one commit per chunk, updating the
+# conversation summaries in the same transaction. Returns the (id, timestamp) of every row, in the
+# order the rows were given. A failing chunk is rolled back and raises IngestError.
+def insert_messages(rows, chunk_size):
+    statement = insert(Message).returning(Message.id, Message.timestamp, sort_by_parameter_order=True)
+    inserted = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            results = db.session.execute(statement, chunk).all()
+            record_messages([
+                summarized('text', message_id, row['sender_id'], row['recipient_id'], timestamp, row['content'])
+                for row, (message_id, timestamp) in zip(chunk, results)
+            ])
+            db.session.commit()  # One transaction (and one WAL sync) per chunk
+        except Exception as e:
+            db.session.rollback()
+            ingest_log.warning("Inserting messages failed after %d of %d rows", len(inserted), len(rows), exc_info=True)
+            raise IngestError(inserted) from e
+        inserted.extend(results)
+    return inserted
+
+# A message waiting in the coalescer for its group commit
+class _PendingWrite:
+    def __init__(self, row):
+        self.row = row
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+# Groups single-message writes that arrive within a few milliseconds of each other into one
+# transaction. Request threads block in submit() until the group containing their row commits.
+class WriteCoalescer:
+    def __init__(self, app, window, max_batch):
+        self.app = app
+        self.window = window  # Seconds to wait for more writes after the first one arrives
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None  # Process that owns the flush thread (the app may be imported before a fork)
+
+    # Insert one message row through the next group commit, returning its (id, timestamp)
+    def submit(self, row):
+        self._ensure_started()
+        pending = _PendingWrite(row)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, name='write-coalescer', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]  # Block until the first write of a group arrives
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                results = insert_messages([pending.row for pending in batch], len(batch))
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                db.session.rollback()
+                for pending in batch:
+                    pending.error = e  # Every writer in the group sees the failure
+        for pending in batch:
+            pending.done.set()
@@ -0,0 +1,278 @@
+# metrics.py
+
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+slow_request_log = logging.getLogger('chat.slow_requests')
+
+# Function to escape a label value for the Prometheus text format
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Function to format one sample line in the Prometheus text format
+def _sample(name, labels, value):
+    if labels:
+        label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+        return f"{name}{{{label_text}}} {value}"
+    return f"{name} {value}"
+
+# Monotonic counter with optional labels
+class CounterMetric:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield _sample(self.name, list(zip(self.labelnames, key)), value)
+
+# Histogram with fixed upper bounds, exposed as cumulative buckets plus _sum and _count
+class HistogramMetric:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield _sample(f"{self.name}_bucket", labels + [('le', bound)], cumulative)
+            yield _sample(f"{self.name}_sum", labels, counts[-1])
+            yield _sample(f"{self.name}_count", labels, cumulative)
+
+# Gauge or counter whose samples are read from a callback at scrape time
+class CallbackMetric:
+    def __init__(self, name, help_text, kind, callback, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.callback = callback  # Returns a {label values tuple: value} dict
+
+    def samples(self):
+        for key, value in sorted(self.callback().items()):
+            yield _sample(self.name, list(zip(self.labelnames, key)), value)
+
+# Set of metrics rendered together at /metrics
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(CounterMetric(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, buckets, labelnames=()):
+        return self.register(HistogramMetric(name, help_text, buckets, labelnames))
+
+    def callback(self, name, help_text, kind, callback, labelnames=()):
+        return self.register(CallbackMetric(name, help_text, kind, callback, labelnames))
+
+    # Render every metric in the Prometheus text exposition format
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+# Profiler that samples the stack of one thread at a fixed interval from a helper thread.
+# The result is in the collapsed-stack format read by flamegraph tools: "outer;inner count" per line.
+class SamplingProfiler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+# Request, query and transcription instrumentation for the app, exposed through a MetricsRegistry
+class Metrics:
+    def __init__(self, config):
+        self.config = config
+        self.registry = MetricsRegistry()
+        buckets = config['METRICS_LATENCY_BUCKETS']
+        self.request_seconds = self.registry.histogram(
+            'http_request_duration_seconds', "Time spent handling requests", buckets, ('method', 'route', 'status')
+        )
+        self.request_queries = self.registry.histogram(
+            'http_request_db_queries', "Database queries issued per request",
+            config['METRICS_QUERY_COUNT_BUCKETS'], ('method', 'route')
+        )
+        self.request_query_seconds = self.registry.histogram(
+            'http_request_db_query_duration_seconds', "Time spent in database queries per request",
+            buckets, ('method', 'route')
+        )
+        self.queries = self.registry.counter(
+            'db_queries_total', "Database queries issued, including those of background workers", ('context',)
+        )
+        self.transcription_seconds = self.registry.histogram(
+            'transcription_duration_seconds', "Time from queueing a voice message to storing its transcription",
+            config['METRICS_TRANSCRIPTION_BUCKETS'], ('status',)
+        )
+        self.transcriber_call_seconds = self.registry.histogram(
+            'transcriber_call_duration_seconds', "Time spent in one transcriber call, retries included",
+            config['METRICS_TRANSCRIPTION_BUCKETS'], ('kind',)
+        )
+        self.slow_requests = self.registry.counter(
+            'http_slow_requests_total', "Requests slower than SLOW_REQUEST_SECONDS", ('method', 'route')
+        )
+
+    # Export the counters of a TranscriptionCache
+    def track_transcription_cache(self, cache):
+        self.registry.callback(
+            'transcription_cache_events_total', "Transcription cache hits per tier, misses and stores", 'counter',
+            lambda: {(name,): value for name, value in cache.stats().items() if name != 'memory_entries'},
+            ('event',)
+        )
+        self.registry.callback(
+            'transcription_cache_memory_entries', "Entries in the in-memory transcription cache tier", 'gauge',
+            lambda: {(): cache.stats()['memory_entries']}
+        )
+
+    # Record a finished transcription; called from TranscriptionQueue
+    def observe_transcription(self, seconds, status):
+        self.transcription_seconds.observe(seconds, status=status)
+
+    def observe_transcriber_call(self, seconds, kind):
+        self.transcriber_call_seconds.observe(seconds, kind=kind)
+
+    # Count and time every query on the engine, attributing it to the current request when there is one
+    def instrument_engine(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def start_query(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def end_query(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['query_start'].pop()
+            if has_request_context() and 'queries' in g:
+                g.queries.append((statement, elapsed))
+                self.queries.inc(context='request')
+            else:
+                self.queries.inc(context='background')
+
+    # Hook the before/after request handlers and the /metrics route into the app
+    def init_app(self, app):
+        @app.before_request
+        def start_request():
+            g.request_start = time.perf_counter()
+            g.queries = []  # (statement, seconds) for every query of this request
+            if self.config['PROFILER_ENABLED'] and request.headers.get(self.config['PROFILER_HEADER']):
+                g.profiler = SamplingProfiler(threading.get_ident(), self.config['PROFILER_INTERVAL']).start()
+
+        @app.after_request
+        def finish_request(response):
+            if 'request_start' not in g:
+                return response  # A before_request hook registered earlier rejected the request
+            elapsed = time.perf_counter() - g.request_start
+            route = request.url_rule.rule if request.url_rule else 'unmatched'  # Keeps label values bounded
+            query_seconds = sum(seconds for _, seconds in g.queries)
+            self.request_seconds.observe(elapsed, method=request.method, route=route, status=response.status_code)
+            self.request_queries.observe(len(g.queries), method=request.method, route=route)
+            self.request_query_seconds.observe(query_seconds, method=request.method, route=route)
+
+            threshold = self.config['SLOW_REQUEST_SECONDS']
+            if threshold and elapsed >= threshold:
+                self.slow_requests.inc(method=request.method, route=route)
+                self.log_slow_request(route, elapsed, query_seconds)
+            if 'profiler' in g:
+                response.headers['X-Profile'] = self.save_profile(app, route, g.pop('profiler').stop())
+            return response
+
+        # Stop a profiler whose request ended in an unhandled error
+        @app.teardown_request
+        def stop_profiler(exc):
+            if 'profiler' in g:
+                g.pop('profiler').stop()
+
+        @app.route('/metrics', methods=['GET'])
+        def metrics():
+            return self.registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    # Log a slow request with its query breakdown. Identical statements are grouped, so an N+1
+    # pattern shows up as one statement run many times.
+    def log_slow_request(self, route, elapsed, query_seconds):
+        grouped = defaultdict(lambda: [0, 0.0])
+        for statement, seconds in g.queries:
+            grouped[statement][0] += 1
+            grouped[statement][1] += seconds
+        top = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:self.config['SLOW_REQUEST_TOP_QUERIES']]
+        lines = [
+            f"{request.method} {request.path} ({route}) took {elapsed * 1000:.1f}ms, "
+            f"{len(g.queries)} queries in {query_seconds * 1000:.1f}ms"
+        ]
+        for statement, (count, seconds) in top:
+            lines.append(f"  {count:>4}x {seconds * 1000:8.1f}ms  {' '.join(statement.split())[:200]}")
+        slow_request_log.warning("\n".join(lines))
+
+    # Write a collapsed-stack profile to PROFILE_DIR, returning its file name
+    def save_profile(self, app, route, stacks):
+        directory = self.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'\W+', '_', route).strip('_') or 'root'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{slug}.folded"
+        with open(os.path.join(directory, name), 'w') as profile:
+            profile.write(stacks)
+        return name
@@ -0,0 +1,240 @@
+# migrations.py - versioned schema changes, applied by `flask --app app migrate` or on server start
+#
+# Every step runs once, in its own transaction, and is recorded in the schema_version table. Steps
+# are written to be idempotent, so a database created by an earlier release (when tables were made
+# with create_all on import) is brought up to date by the same chain. Each step spells out the schema
+# of its own version instead of reading models.py, so it keeps doing what it did when it shipped.
+# Append new steps at the end; never edit or renumber one that has shipped.
+
+from datetime import datetime
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, inspect, select
+)
+
+MIGRATIONS = []  # (version, description, function taking a connection), in order
+
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+frozen = MetaData()  # Tables as the step that creates them defines them
+
+# Decorator that registers a migration step under the next version number
+def migration(description):
+    def register(fn):
+        MIGRATIONS.append((len(MIGRATIONS) + 1, description, fn))
+        return fn
+    return register
+
+# Function to add a column unless an earlier release already created the table with it
+def add_column(connection, table, column, definition):
+    if column not in {existing['name'] for existing in inspect(connection).get_columns(table)}:
+        connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+# The tables of the first release
+Table(
+    'user', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+)
+Table(
+    'message', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('content', String(500), nullable=False),
+    Column('timestamp', DateTime),
+    Column('sender_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('recipient_id', Integer, ForeignKey('user.id'), nullable=False),
+)
+Table(
+    'voice_message', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('filename', String(255), nullable=False),
+    Column('timestamp', DateTime),
+    Column('sender_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('recipient_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('transcription', Text),
+)
+
+@migration("Create tables")
+def create_tables(connection):
+    for name in ('user', 'message', 'voice_message'):
+        frozen.tables[name].create(connection, checkfirst=True)
+
+Table(
+    'transcription_cache', frozen,
+    Column('key', String(100), primary_key=True),  # "<model>:<sha256 hex digest>"
+    Column('transcription', Text, nullable=False),
+    Column('created_at', DateTime, nullable=False, index=True),
+)
+
+@migration("Add columns and indexes missing from databases created by earlier releases")
+def upgrade_legacy_tables(connection):
+    # Conversation keys; rows written before the column existed are filled in below
+    add_column(connection, 'message', 'conversation_key', "VARCHAR(32) NOT NULL DEFAULT ''")
+    add_column(connection, 'voice_message', 'conversation_key', "VARCHAR(32) NOT NULL DEFAULT ''")
+    # Background transcription; early releases transcribed before answering the upload
+    add_column(connection, 'voice_message', 'status', "VARCHAR(20) NOT NULL DEFAULT 'completed'")
+    add_column(connection, 'voice_message', 'segments_total', "INTEGER")
+    add_column(connection, 'voice_message', 'segments_done', "INTEGER")
+    frozen.tables['transcription_cache'].create(connection, checkfirst=True)  # Indexes included
+
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_message_conversation ON message (conversation_key, timestamp, id)"
+    )
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_voice_message_conversation ON voice_message (conversation_key, timestamp, id)"
+    )
+    for table in ('message', 'voice_message'):
+        connection.exec_driver_sql(
+            f"UPDATE {table} SET conversation_key = CASE WHEN sender_id < recipient_id "
+            f"THEN CAST(sender_id AS VARCHAR(16)) || ':' || CAST(recipient_id AS VARCHAR(16)) "
+            f"ELSE CAST(recipient_id AS VARCHAR(16)) || ':' || CAST(sender_id AS VARCHAR(16)) END "
+            f"WHERE conversation_key IS NULL OR conversation_key = ''"
+        )
+
+# External-content FTS5 indexes: they store only the inverted index and read the text back from the
+# message tables, so message text isn't stored twice. Triggers keep them in sync; an update has to
+# tell the index the old text to remove, so it is a delete plus an insert.
+SEARCH_INDEX_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(content, conversation_key, "
+    "content='message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN "
+    "INSERT INTO message_fts(rowid, content, conversation_key) VALUES (new.id, new.content, new.conversation_key); END",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN "
+    "INSERT INTO message_fts(message_fts, rowid, content, conversation_key) "
+    "VALUES ('delete', old.id, old.content, old.conversation_key); END",
+    "CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF content, conversation_key ON message BEGIN "
+    "INSERT INTO message_fts(message_fts, rowid, content, conversation_key) "
+    "VALUES ('delete', old.id, old.content, old.conversation_key); "
+    "INSERT INTO message_fts(rowid, content, conversation_key) VALUES (new.id, new.content, new.conversation_key); END",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS voice_message_fts USING fts5(transcription, conversation_key, "
+    "content='voice_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS voice_message_fts_insert AFTER INSERT ON voice_message BEGIN "
+    "INSERT INTO voice_message_fts(rowid, transcription, conversation_key) "
+    "VALUES (new.id, new.transcription, new.conversation_key); END",
+    "CREATE TRIGGER IF NOT EXISTS voice_message_fts_delete AFTER DELETE ON voice_message BEGIN "
+    "INSERT INTO voice_message_fts(voice_message_fts, rowid, transcription, conversation_key) "
+    "VALUES ('delete', old.id, old.transcription, old.conversation_key); END",
+    "CREATE TRIGGER IF NOT EXISTS voice_message_fts_update AFTER UPDATE OF transcription, conversation_key "
+    "ON voice_message BEGIN "
+    "INSERT INTO voice_message_fts(voice_message_fts, rowid, transcription, conversation_key) "
+    "VALUES ('delete', old.id, old.transcription, old.conversation_key); "
+    "INSERT INTO voice_message_fts(rowid, transcription, conversation_key) "
+    "VALUES (new.id, new.transcription, new.conversation_key); END",
+)
+
+@migration("Create the full-text search index")
+def create_search_tables(connection):
+    if connection.dialect.name != 'sqlite':
+        return  # Search is built on SQLite FTS5
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+    # Index the rows written before the search index existed
+    for fts in ('message_fts', 'voice_message_fts'):
+        connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+Table(
+    'archive_catalog', frozen,
+    Column('conversation_key', String(32), primary_key=True),
+    Column('kind', String(10), primary_key=True),  # 'text' or 'voice'
+    Column('month', String(7), primary_key=True),  # 'YYYY-MM', names the archive file
+)
+
+@migration("Create the message archive catalog")
+def create_archive_catalog(connection):
+    frozen.tables['archive_catalog'].create(connection, checkfirst=True)
+
+Table(
+    'conversation_summary', frozen,
+    Column('user_id', Integer, ForeignKey('user.id'), primary_key=True),
+    Column('partner_id', Integer, ForeignKey('user.id'), primary_key=True),
+    Column('conversation_key', String(32), nullable=False),
+    Column('last_kind', String(10), nullable=False),
+    Column('last_message_id', Integer, nullable=False),
+    Column('last_sender_id', Integer, nullable=False),
+    Column('last_preview', String(100)),
+    Column('last_timestamp', DateTime, nullable=False),
+    Column('unread_count', Integer, nullable=False),
+    Column('last_read_at', DateTime),
+    Column('partner_read_at', DateTime),
+)
+
+@migration("Create conversation summaries, counting existing history as read")
+def create_conversation_summaries(connection):
+    frozen.tables['conversation_summary'].create(connection, checkfirst=True)
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_conversation_summary_inbox "
+        "ON conversation_summary (user_id, last_timestamp, partner_id)"
+    )
+    # The newest message of every conversation, in timeline order (timestamp, kind, id), becomes the
+    # last message of both participants' summaries. UNION folds the two views of a self-conversation.
+    connection.exec_driver_sql("""
+        WITH messages AS (
+            SELECT 'text' AS kind, id, conversation_key, sender_id, recipient_id, timestamp,
+                   NULLIF(substr(content, 1, 100), '') AS preview
+            FROM message
+            UNION ALL
+            SELECT 'voice', id, conversation_key, sender_id, recipient_id, timestamp,
+                   NULLIF(substr(transcription, 1, 100), '')
+            FROM voice_message
+        ), newest AS (
+            SELECT * FROM (
+                SELECT messages.*, row_number() OVER (
+                    PARTITION BY conversation_key ORDER BY timestamp DESC, kind DESC, id DESC
+                ) AS rank
+                FROM messages
+            ) ranked WHERE rank = 1
+        )
+        INSERT INTO conversation_summary (
+            user_id, partner_id, conversation_key, last_kind, last_message_id, last_sender_id,
+            last_preview, last_timestamp, unread_count, last_read_at, partner_read_at
+        )
+        SELECT user_id, partner_id, conversation_key, kind, id, sender_id, preview, timestamp, 0, timestamp, timestamp
+        FROM (
+            SELECT sender_id AS user_id, recipient_id AS partner_id, newest.* FROM newest
+            UNION
+            SELECT recipient_id, sender_id, newest.* FROM newest
+        ) views
+    """)
+
+@migration("Number voice messages in the order they finished, for resuming event streams")
+def add_completed_seq(connection):
+    add_column(connection, 'voice_message', 'completed_seq', "INTEGER")
+    connection.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_voice_message_completed_seq ON voice_message (completed_seq)"
+    )
+    # Finished rows keep the order streams resumed in until now: their ID
+    connection.exec_driver_sql(
+        "UPDATE voice_message SET completed_seq = id WHERE status IN ('completed', 'failed') AND completed_seq IS NULL"
+    )
+
+# Function to read the schema version of a database; 0 when it has never been migrated
+def current_version(connection):
+    if not inspect(connection).has_table('schema_version'):
+        return 0
+    return connection.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar() or 0
+
+# Function to list the steps not yet applied to a database
+def pending_migrations(engine):
+    with engine.connect() as connection:
+        version = current_version(connection)
+    return [step for step in MIGRATIONS if step[0] > version]
+
+# Function to apply every pending step to the primary, returning the (version, description) pairs applied
+def migrate(engine):
+    applied = []
+    with engine.begin() as connection:
+        schema_version.create(connection, checkfirst=True)
+    for version, description, fn in MIGRATIONS:
+        with engine.begin() as connection:
+            if current_version(connection) >= version:
+                continue  # Already applied, possibly by another process that got here first
+            fn(connection)
+            connection.execute(schema_version.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        applied.append((version, description))
+    return applied
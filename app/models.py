@@ -7,12 +7,26 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
 
+# Function to build the normalized key shared by both directions of a conversation
+def conversation_key(user1_id, user2_id):
+    low, high = sorted((int(user1_id), int(user2_id)))
+    return f"{low}:{high}"
+
+# Column default that derives the conversation key from the row being inserted
+def _default_conversation_key(context):
+    params = context.get_current_parameters()
+    return conversation_key(params['sender_id'], params['recipient_id'])
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.String(500), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    conversation_key = db.Column(db.String(32), nullable=False, default=_default_conversation_key)
+
+    # History reads are a single range scan over one conversation in timestamp order
+    __table_args__ = (db.Index('ix_message_conversation', 'conversation_key', 'timestamp', 'id'),)
 
     sender = db.relationship('User', foreign_keys=[sender_id])
     recipient = db.relationship('User', foreign_keys=[recipient_id])
@@ -24,6 +38,61 @@ class VoiceMessage(db.Model):
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     transcription = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, completed or failed
+    segments_total = db.Column(db.Integer)  # Set for long clips transcribed in segments
+    segments_done = db.Column(db.Integer)
+    conversation_key = db.Column(db.String(32), nullable=False, default=_default_conversation_key)
+    # Order in which voice messages were completed or failed, set with the final status. Transcriptions
+    # finish out of ID order, so event streams resume from this instead of the ID.
+    completed_seq = db.Column(db.Integer, unique=True, index=True)
+
+    __table_args__ = (db.Index('ix_voice_message_conversation', 'conversation_key', 'timestamp', 'id'),)
 
     sender = db.relationship('User', foreign_keys=[sender_id])
-    recipient = db.relationship('User', foreign_keys=[recipient_id])
\ No newline at end of file
+    recipient = db.relationship('User', foreign_keys=[recipient_id])
+
+# Function to build the query for the next completion number, run in the transaction that gives a voice
+# message its final status. Write transactions on the primary take the write lock up front (BEGIN IMMEDIATE),
+# so numbers are handed out in commit order.
+def next_completed_seq():
+    return db.select(db.func.coalesce(db.func.max(VoiceMessage.completed_seq), 0) + 1)
+
+# Persistent tier of the transcription cache, keyed by model and SHA-256 of the audio bytes
+class TranscriptionCacheEntry(db.Model):
+    __tablename__ = 'transcription_cache'
+
+    key = db.Column(db.String(100), primary_key=True)  # "<model>:<sha256 hex digest>"
+    transcription = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+# Months of the message archive that hold rows of a conversation (see retention.py), so reads
+# falling through to the archive only open the files they need
+class ArchivedConversation(db.Model):
+    __tablename__ = 'archive_catalog'
+
+    conversation_key = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)  # 'text' or 'voice'
+    month = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM', names the archive file
+
+PREVIEW_LENGTH = 100  # Characters of the last message kept in a conversation summary
+
+# One user's view of a conversation: the newest message and how many of the partner's messages the
+# user hasn't read. Kept up to date by summaries.py as messages are written, so a user's conversation
+# list is a single range scan over the inbox index instead of a scan of every message.
+class ConversationSummary(db.Model):
+    __tablename__ = 'conversation_summary'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    partner_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    conversation_key = db.Column(db.String(32), nullable=False)
+    last_kind = db.Column(db.String(10), nullable=False)  # 'text' or 'voice'
+    last_message_id = db.Column(db.Integer, nullable=False)
+    last_sender_id = db.Column(db.Integer, nullable=False)
+    last_preview = db.Column(db.String(PREVIEW_LENGTH))  # Voice messages have none until transcribed
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+    last_read_at = db.Column(db.DateTime)  # The user has read the partner's messages up to here
+    partner_read_at = db.Column(db.DateTime)  # ... and the partner the user's (the read receipt)
+
+    # Conversation lists are read newest first per user
+    __table_args__ = (db.Index('ix_conversation_summary_inbox', 'user_id', 'last_timestamp', 'partner_id'),)
@@ -0,0 +1,124 @@
+# pagination.py
+
+import base64
+import functools
+import json
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from database import db
+
+# Raised when the pagination query parameters can't be used
+class PaginationError(ValueError):
+    pass
+
+# Function to turn the sort key of the last row on a page into an opaque cursor token
+def encode_cursor(*values):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+# Function to read a cursor token back, converting each value with the matching type
+def decode_cursor(token, *types):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+        if len(values) != len(types):
+            raise ValueError("wrong number of cursor values")
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (ValueError, TypeError) as e:
+        raise PaginationError(f"Invalid cursor: {token}") from e
+
+# Function to read ?limit=, ?before= and ?after= from the query string
+def page_args(args, config):
+    limit = args.get('limit', config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, config['MAX_PAGE_SIZE']))  # Clamp to a sane page size
+    before = args.get('before')
+    after = args.get('after')
+    if before and after:
+        raise PaginationError("Only one of before and after may be given")
+    return limit, before, after
+
+# Function to read up to limit rows of a conversation from the primary and, when an archive is given,
+# from the archive months that hold it. Rows are read in the direction of travel: newest first
+# backwards, where the archive is only looked up if the primary runs out, and oldest first forwards.
+# build(cursor, remaining, archived) makes the query for one source; cursor_of(row) gives the sort
+# key to continue after a row. Archived rows are all older than the rows left in the primary.
+def read_through(build, limit, cursor, forwards, cursor_of, archive=None, key=None, models=()):
+    rows = []
+
+    def read(execute, archived):
+        nonlocal cursor
+        page = execute(build(cursor, limit - len(rows), archived))
+        rows.extend(page)
+        if page:
+            cursor = cursor_of(page[-1])
+
+    def archive_months():
+        return archive.months(key, models, cursor[0] if cursor else None, forwards) if archive is not None else []
+
+    primary = lambda query: db.session.execute(query).all()
+    if not forwards:
+        read(primary, False)
+    if len(rows) < limit:
+        for month in archive_months():
+            read(functools.partial(archive.execute, month), True)
+            if len(rows) >= limit:
+                break
+    if forwards and len(rows) < limit:
+        read(primary, False)
+    return rows
+
+# Function to build the keyset query for the next rows of a conversation after (or, walking
+# backwards, before) a (timestamp, id) cursor
+def _page_query(model, key, columns, cursor, forwards, limit):
+    sort_key = tuple_(model.timestamp, model.id)
+    query = select(*(getattr(model, name) for name in columns)).where(model.conversation_key == key)
+    if cursor:
+        query = query.where(sort_key > cursor if forwards else sort_key < cursor)
+    order = (model.timestamp, model.id) if forwards else (model.timestamp.desc(), model.id.desc())
+    return query.order_by(*order).limit(limit)
+
+# Function to fetch one page of a conversation from a model with timestamp and id columns.
+# Without a cursor the newest page is returned; "before" walks back in time and "after" forward.
+# Pages are always returned oldest first as dicts of the requested fields, together with the
+# cursor for the next page (or None). Only those columns are read, so no ORM objects are built.
+# With an archive, pages continue into archived months once the primary has no more rows.
+def conversation_page(model, key, limit, before=None, after=None, fields=('id', 'timestamp'), archive=None):
+    columns = tuple(dict.fromkeys(fields + ('timestamp', 'id')))  # The sort key is needed for the cursor
+    token = after or before
+    cursor = decode_cursor(token, datetime.fromisoformat, int) if token else None
+    forwards = bool(after)
+    rows = read_through(
+        lambda cursor, remaining, archived: _page_query(model, key, columns, cursor, forwards, remaining),
+        limit, cursor, forwards, lambda row: (row.timestamp, row.id), archive, key, (model,)
+    )
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]  # Furthest row in the direction of travel
+        next_cursor = encode_cursor(last.timestamp, last.id)
+    if not forwards:
+        rows.reverse()  # Walking backwards, so flip the page to oldest first
+    return [{name: getattr(row, name) for name in fields} for row in rows], next_cursor
+
+# Function to yield a whole conversation oldest first (from an "after" cursor if given) as dicts of
+# the requested fields. Archived months come first, then the primary, read in batches.
+def conversation_rows(model, key, fields, after=None, limit=None, batch_size=1000, archive=None):
+    columns = tuple(dict.fromkeys(fields + ('timestamp', 'id')))
+    cursor = decode_cursor(after, datetime.fromisoformat, int) if after else None
+    months = archive.months(key, (model,), cursor[0] if cursor else None, forwards=True) if archive is not None else []
+    for month in months:
+        for row in archive.execute(month, _page_query(model, key, columns, cursor, True, limit)):
+            if limit is not None:
+                limit -= 1
+            cursor = (row.timestamp, row.id)
+            yield {name: getattr(row, name) for name in fields}
+        if limit == 0:
+            return
+    query = _page_query(model, key, columns, cursor, True, limit)
+    for row in db.session.execute(query.execution_options(yield_per=batch_size)):
+        yield {name: getattr(row, name) for name in fields}
+
+# Function to attach the next-page cursor to a response
+def with_cursor(response, next_cursor):
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
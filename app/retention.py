@@ -0,0 +1,213 @@
+# retention.py
+
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, delete, inspect, select, tuple_
+from database import checkpoint, db
+from models import ArchivedConversation, Message, VoiceMessage
+
+retention_log = logging.getLogger('chat.retention')
+
+# Archived kinds: the catalog kind and the model, whose table is created unchanged in every archive file
+ARCHIVE_SOURCES = (('text', Message), ('voice', VoiceMessage))
+
+# Function to add the columns and indexes a message table gained since an archive file was created.
+# Archive files aren't migrated; they follow the models, and rows archived earlier keep NULL there.
+def upgrade_archive_table(connection, table):
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=connection.dialect)}"
+            )
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+# Messages older than the retention horizon, moved out of the primary into one SQLite file per month.
+# Archive files hold the message tables with the same names, columns and conversation indexes, so
+# the queries built for the primary run against them unchanged. The archive_catalog table in the
+# primary lists the months holding each conversation, so reads only open the files they need.
+class MessageArchive:
+    def __init__(self, directory, configure=None):
+        self.directory = directory
+        self.configure = configure  # Called with every archive engine once, e.g. to apply pragmas
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def path(self, month):
+        return os.path.join(self.directory, f"messages-{month}.db")
+
+    # Engine of one month's file, created (with its tables) on first use
+    def engine(self, month):
+        with self._lock:
+            engine = self._engines.get(month)
+            if engine is None:
+                os.makedirs(self.directory, exist_ok=True)
+                engine = create_engine(f"sqlite:///{self.path(month)}")
+                if self.configure:
+                    self.configure(engine)
+                with engine.begin() as connection:
+                    for _, model in ARCHIVE_SOURCES:
+                        model.__table__.create(connection, checkfirst=True)  # Indexes included
+                        upgrade_archive_table(connection, model.__table__)
+                self._engines[month] = engine
+            return engine
+
+    # Run a query built for the primary against one month's file
+    def execute(self, month, query):
+        with self.engine(month).connect() as connection:
+            return connection.execute(query).all()
+
+    # Function to list the months holding rows of a conversation in any of the given models, in the
+    # order a read travels. With a cursor timestamp, months entirely on the far side of it are skipped.
+    def months(self, key, models, cursor_timestamp=None, forwards=False):
+        kinds = [kind for kind, model in ARCHIVE_SOURCES if model in models]
+        query = select(ArchivedConversation.month).distinct().where(
+            ArchivedConversation.conversation_key == key, ArchivedConversation.kind.in_(kinds)
+        )
+        if cursor_timestamp is not None:
+            month = cursor_timestamp.strftime('%Y-%m')
+            query = query.where(ArchivedConversation.month >= month if forwards else ArchivedConversation.month <= month)
+        order = ArchivedConversation.month if forwards else ArchivedConversation.month.desc()
+        return list(db.session.scalars(query.order_by(order)))
+
+    # Move every message older than cutoff into the archive, batch_size rows per transaction.
+    # Rows are copied (ignoring ones already there) before they are deleted from the primary,
+    # so an interrupted run loses nothing and is finished by the next one. Must run in an app context.
+    # Returns the number of rows moved per (kind, month).
+    def archive_before(self, cutoff, batch_size):
+        moved = Counter()
+        for kind, model in ARCHIVE_SOURCES:
+            table = model.__table__
+            while True:
+                rows = db.session.execute(
+                    select(table).where(model.timestamp < cutoff).order_by(model.id).limit(batch_size)
+                ).mappings().all()
+                if not rows:
+                    db.session.rollback()  # End the transaction of the empty read, and its write lock
+                    break
+                by_month = {}
+                for row in rows:
+                    by_month.setdefault(row['timestamp'].strftime('%Y-%m'), []).append(dict(row))
+                for month, month_rows in by_month.items():
+                    with self.engine(month).begin() as connection:
+                        connection.execute(table.insert().prefix_with('OR IGNORE'), month_rows)
+                    moved[(kind, month)] += len(month_rows)
+
+                # Catalog the new (conversation, month) pairs and drop the rows in one primary transaction
+                pairs = {(row['conversation_key'], month) for month, month_rows in by_month.items() for row in month_rows}
+                known = set(db.session.execute(
+                    select(ArchivedConversation.conversation_key, ArchivedConversation.month).where(
+                        ArchivedConversation.kind == kind,
+                        tuple_(ArchivedConversation.conversation_key, ArchivedConversation.month).in_(list(pairs))
+                    )
+                ).all())
+                db.session.add_all(
+                    ArchivedConversation(conversation_key=key, kind=kind, month=month) for key, month in pairs - known
+                )
+                db.session.execute(delete(table).where(model.id.in_([row['id'] for row in rows])))
+                db.session.commit()
+        for month in {month for _, month in moved}:
+            checkpoint(self.engine(month))  # Settle the file; reads only from here on
+        return moved
+
+    # Bytes on disk per archive file, WAL included
+    def file_sizes(self):
+        if not os.path.isdir(self.directory):
+            return {}
+        return {
+            name: file_bytes(os.path.join(self.directory, name))
+            for name in sorted(os.listdir(self.directory)) if name.startswith('messages-') and name.endswith('.db')
+        }
+
+    # Forget the engines and lock inherited from the parent process; call right after a fork,
+    # when the retention thread of the parent may have been holding the lock
+    def after_fork(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+
+# Function to get the bytes on disk of a SQLite file and its WAL
+def file_bytes(path):
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+# Function to measure a SQLite database: bytes in use, bytes on the freelist and bytes on disk (file plus WAL)
+def database_space(engine):
+    with engine.connect() as connection:
+        page_size = connection.exec_driver_sql("PRAGMA page_size").scalar()
+        pages = connection.exec_driver_sql("PRAGMA page_count").scalar()
+        free = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+    return {"used_bytes": (pages - free) * page_size, "free_bytes": free * page_size,
+            "file_bytes": file_bytes(engine.url.database)}
+
+# Function to hand free pages back to the OS and refresh planner statistics. Incremental vacuum
+# frees at most max_pages per call, so it never holds the write lock for long; databases created
+# before auto_vacuum was enabled need one full=True run (a blocking VACUUM) to switch it on.
+# Returns the space before and after, and the bytes reclaimed.
+def compact(engine, max_pages, full=False):
+    if engine.dialect.name != 'sqlite':
+        return None
+    before = database_space(engine)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        sqlite_connection = connection.connection.driver_connection
+        if full:
+            sqlite_connection.executescript("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")  # Rewrites the file
+        mode = connection.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        if mode == 2:  # INCREMENTAL
+            # executescript() steps the pragma to completion; execute() would free a single page
+            sqlite_connection.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        connection.exec_driver_sql("PRAGMA optimize")  # ANALYZE the tables whose statistics went stale
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")  # Shrink the WAL file too
+    after = database_space(engine)
+    return {
+        "before": before, "after": after, "incremental": mode == 2,
+        "reclaimed_bytes": before['file_bytes'] - after['file_bytes'],
+    }
+
+# Function to archive, compact and report once. Must run in an app context.
+def run_retention(archive, config):
+    cutoff = datetime.utcnow() - timedelta(days=config['RETENTION_DAYS'])
+    moved = archive.archive_before(cutoff, config['ARCHIVE_BATCH_SIZE'])
+    report = compact(db.engine, config['COMPACT_MAX_PAGES'])
+    return {"cutoff": cutoff, "moved": moved, "compaction": report, "archive_files": archive.file_sizes()}
+
+# Function to summarize a retention report in one log line
+def describe_report(report):
+    moved = sum(report['moved'].values())
+    text = f"Archived {moved} messages older than {report['cutoff']:%Y-%m-%d}"
+    compaction = report['compaction']
+    if compaction:
+        text += (f", reclaimed {compaction['reclaimed_bytes'] / 1024:.0f} KiB "
+                 f"({compaction['after']['file_bytes'] / 1024:.0f} KiB on disk, "
+                 f"{compaction['after']['free_bytes'] / 1024:.0f} KiB free)")
+        if not compaction['incremental']:
+            text += "; incremental vacuum is off, run flask compact --full once"
+    return text
+
+# Background thread that runs retention every interval seconds. Start it in one process only
+# (serve.py starts it in the gunicorn master); the archive is not safe to fill from two at once.
+class RetentionWorker:
+    def __init__(self, app, archive, interval):
+        self.app = app
+        self.archive = archive
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    retention_log.info(describe_report(run_retention(self.archive, self.app.config)))
+            except Exception:
+                retention_log.exception("Retention run failed")  # Try again next interval
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,108 @@
+# search.py
+
+import re
+from sqlalchemy import column, func, literal, literal_column, select, table, tuple_, union_all
+from database import db
+from models import User, Message, VoiceMessage
+from pagination import decode_cursor, encode_cursor
+
+# Raised when a search query can't be turned into a full-text query
+class SearchError(ValueError):
+    pass
+
+# Each searchable source: result kind, model, the indexed text column and the FTS5 table that indexes it.
+# The conversation key is indexed alongside the text so user and conversation scopes are resolved by the
+# full-text index itself instead of filtering every match afterwards. The tables and the triggers keeping
+# them in sync are created by migrations.py.
+SEARCH_SOURCES = (
+    ('text', Message, 'content', 'message_fts'),
+    ('voice', VoiceMessage, 'transcription', 'voice_message_fts'),
+)
+
+# Function to rebuild every search index from the message tables and merge its segments,
+# returning the number of rows indexed per kind
+def rebuild_search_index(engine):
+    counts = {}
+    with engine.begin() as connection:
+        for kind, model, text, fts in SEARCH_SOURCES:
+            connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")  # One b-tree per index
+            counts[kind] = connection.exec_driver_sql(f"SELECT count(*) FROM {model.__tablename__}").scalar()
+    return counts
+
+# Function to turn free text into an FTS5 query. Every word must appear (a trailing * makes it a
+# prefix match); quoting each word keeps FTS5 operators and punctuation in user input from being parsed.
+def match_expression(text, column_name, user_id=None, other_user_id=None, max_terms=16):
+    terms = re.findall(r"\w+\*?", text)[:max_terms]
+    if not terms:
+        raise SearchError("Search query must contain at least one word")
+    words = " ".join('"' + term.rstrip('*') + '"' + ('*' if term.endswith('*') else '') for term in terms)
+    expression = f"{column_name} : ({words})"
+    # The key "low:high" is indexed as the two tokens low and high
+    if user_id is not None and other_user_id is not None:
+        low, high = sorted((user_id, other_user_id))
+        expression += f' AND conversation_key : "{low} {high}"'
+    elif user_id is not None:
+        expression += f' AND conversation_key : "{user_id}"'
+    return expression
+
+# Function to build the cursor condition for one source. Results are ordered by (rank, kind, id),
+# the same way the timeline orders by (timestamp, kind, id).
+def _cursor_filter(rank, model, kind, cursor):
+    cursor_rank, cursor_kind, cursor_id = cursor
+    if kind == cursor_kind:
+        return tuple_(rank, model.id) > (cursor_rank, cursor_id)
+    return rank >= cursor_rank if kind > cursor_kind else rank > cursor_rank
+
+# Function to find the lowest rowid among the newest max_candidates matches, or None if there are fewer.
+# Walking the match list in rowid order is cheap; scoring it is not, so ranking stops at this cutoff.
+def _candidate_cutoff(fts_table, match, max_candidates):
+    query = select(fts_table.c.rowid).where(match).order_by(fts_table.c.rowid.desc())
+    return db.session.execute(query.offset(max_candidates - 1).limit(1)).scalar()
+
+# Function to fetch one page of text and voice messages matching a search, best match first.
+# Scope the search to a user's conversations with user_id, or to one conversation with both ids.
+# Ranks are BM25 scores (lower is better) and each result carries a snippet with the matches highlighted.
+# With max_candidates set, only the newest max_candidates matches of each kind are ranked, which keeps
+# words that appear in a large share of all messages from scoring every one of them.
+def search_page(text, limit, after=None, user_id=None, other_user_id=None, highlight=('[', ']'), snippet_tokens=16,
+                max_candidates=None):
+    cursor = decode_cursor(after, float, str, int) if after else None
+
+    branches = []
+    for kind, model, text_column, fts in SEARCH_SOURCES:
+        index = literal_column(fts)  # FTS5 functions take the table itself as their first argument
+        fts_table = table(fts, column('rowid'))
+        match = index.op('MATCH')(match_expression(text, text_column, user_id, other_user_id))
+        rank = func.bm25(index, 1.0, 0.0)  # Only the message text counts towards relevance
+        branch = select(
+            literal(kind).label('kind'),
+            model.id,
+            model.timestamp,
+            model.sender_id,
+            User.username.label('sender_username'),
+            model.recipient_id,
+            func.snippet(index, 0, highlight[0], highlight[1], '…', snippet_tokens).label('snippet'),
+            rank.label('rank'),
+        ).select_from(fts_table).join(model, model.id == fts_table.c.rowid).join(
+            User, User.id == model.sender_id
+        ).where(match)
+        cutoff = _candidate_cutoff(fts_table, match, max_candidates) if max_candidates else None
+        if cutoff is not None:
+            branch = branch.where(fts_table.c.rowid >= cutoff)
+        if model is VoiceMessage:
+            branch = branch.where(VoiceMessage.status == 'completed')  # Skip partial and failed transcripts
+        if cursor:
+            branch = branch.where(_cursor_filter(rank, model, kind, cursor))
+        # Each source contributes at most one page
+        branches.append(select(branch.order_by(rank, model.id).limit(limit).subquery()))
+
+    merged = union_all(*branches).subquery()
+    query = select(merged).order_by(merged.c.rank, merged.c.kind, merged.c.id).limit(limit)
+    items = [row._asdict() for row in db.session.execute(query)]
+
+    next_cursor = None
+    if len(items) == limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last['rank'], last['kind'], last['id'])
+    return items, next_cursor
@@ -0,0 +1,142 @@
+# serialization.py
+
+import gzip
+import json
+import zlib
+from datetime import date
+from flask import Response, request, stream_with_context
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stdlib encoder produces the same JSON
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional; responses fall back to gzip
+    brotli = None
+
+# Public fields of each resource, in response order. Routes select exactly these columns,
+# or the subset named by ?fields=, instead of loading full ORM objects.
+USER_FIELDS = ('id', 'username')
+MESSAGE_FIELDS = ('id', 'content', 'timestamp', 'sender_id', 'recipient_id')
+VOICE_MESSAGE_FIELDS = (
+    'id', 'filename', 'timestamp', 'sender_id', 'recipient_id', 'transcription', 'status',
+    'segments_total', 'segments_done'
+)
+TIMELINE_FIELDS = ('kind', 'id', 'timestamp', 'sender_id', 'sender_username', 'recipient_id', 'content', 'status')
+SEARCH_FIELDS = ('kind', 'id', 'timestamp', 'sender_id', 'sender_username', 'recipient_id', 'snippet', 'rank')
+CONVERSATION_FIELDS = (
+    'partner_id', 'partner_username', 'last_kind', 'last_message_id', 'last_sender_id', 'last_preview',
+    'last_timestamp', 'unread_count', 'last_read_at', 'partner_read_at'
+)
+
+# Raised when ?fields= names a field the resource doesn't have
+class FieldError(ValueError):
+    pass
+
+# Function to serialize the values the stdlib encoder doesn't know, timestamps as ISO 8601
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# Function to encode a value as compact JSON bytes, with orjson when it is installed
+def json_dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+def json_loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+# JSON provider that makes jsonify() and request.json use json_dumps/json_loads
+class FastJSONProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return json_dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return json_loads(s)
+
+    def response(self, *args, **kwargs):
+        data = json_dumps(self._prepare_response_obj(args, kwargs))
+        return self._app.response_class(data, mimetype='application/json')
+
+# Function to read ?fields= as a tuple of field names, defaulting to every field of the resource
+def parse_fields(value, allowed):
+    if not value:
+        return allowed
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))  # Dedupe, keep order
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise FieldError(f"Unknown fields: {', '.join(unknown) or value}. Choose from: {', '.join(allowed)}")
+    return fields
+
+# Function to keep only the requested fields of dict rows
+def project(rows, fields):
+    return [{name: row[name] for name in fields} for row in rows]
+
+# Function to check whether the client asked for newline-delimited JSON instead of a JSON array
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+# Function to stream rows as newline-delimited JSON, one object per line. Lines are sent in
+# chunks of about chunk_size bytes so long histories go out without building the whole body.
+def ndjson_response(rows, chunk_size=64 * 1024):
+    def generate():
+        buffer = bytearray()
+        for row in rows:
+            buffer += json_dumps(row)
+            buffer += b"\n"
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Function to gzip a streamed body chunk by chunk
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Function to compress a response with the best encoding the client accepts. Small bodies,
+# other content types and event streams are left alone.
+def compress_response(response, config):
+    if response.status_code < 200 or response.status_code in (204, 304) or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        if 'gzip' not in request.accept_encodings:
+            return response  # Streams are only gzipped
+        response.response = _gzip_stream(response.iter_encoded(), config['COMPRESS_LEVEL'])
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response  # Not worth the CPU or the header bytes
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=config['BROTLI_QUALITY']))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)  # The compressed bytes differ from what a strong ETag promises
+    return response
@@ -0,0 +1,52 @@
+# serve.py - production entry point running the app under gunicorn
+#
+#   python serve.py
+#
+# Worker processes, threads and the bind address come from Config (SERVER_* environment variables).
+
+from gunicorn.app.base import BaseApplication
+from app import app, archive
+from database import db
+from migrations import migrate
+from retention import RetentionWorker
+
+# Called in each worker right after it is forked from the master process
+def post_fork(server, worker):
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)  # Don't reuse SQLite connections opened before the fork
+    archive.after_fork()
+
+# Called in the master once the server is listening. Retention runs here, in exactly one process.
+def when_ready(server):
+    if app.config['RETENTION_ENABLED']:
+        RetentionWorker(app, archive, app.config['RETENTION_INTERVAL']).start()
+
+# Gunicorn application that serves the already imported Flask app
+class ChatServer(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+if __name__ == '__main__':
+    if app.config['MIGRATE_ON_START']:
+        with app.app_context():
+            migrate(db.engine)  # Once in the master, before any worker serves a request
+    ChatServer(app, {
+        'bind': app.config['SERVER_BIND'],
+        'workers': app.config['SERVER_WORKERS'],
+        'threads': app.config['SERVER_THREADS'],
+        'worker_class': 'gthread',  # Threads let one process overlap requests waiting on SQLite or I/O
+        'timeout': app.config['SERVER_TIMEOUT'],
+        'preload_app': True,  # Import the app once in the master
+        'post_fork': post_fork,
+        'when_ready': when_ready,
+    }).run()
@@ -0,0 +1,227 @@
+# summaries.py
+
+from datetime import datetime
+from sqlalchemy import and_, case, func, literal, or_, select, tuple_, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from database import db
+from models import (
+    PREVIEW_LENGTH, ArchivedConversation, ConversationSummary, Message, User, VoiceMessage, conversation_key
+)
+from pagination import decode_cursor, encode_cursor
+
+summary_table = ConversationSummary.__table__
+
+# Columns describing the newest message of a conversation, replaced together when a newer one arrives
+LAST_MESSAGE_COLUMNS = ('conversation_key', 'last_kind', 'last_message_id', 'last_sender_id', 'last_preview', 'last_timestamp')
+
+# Each message source: summary kind, model and the column previewed in the conversation list
+SUMMARY_SOURCES = (
+    ('text', Message, Message.content),
+    ('voice', VoiceMessage, VoiceMessage.transcription),
+)
+
+# Function to describe a newly written message for record_messages
+def summarized(kind, message_id, sender_id, recipient_id, timestamp, text):
+    return {"kind": kind, "id": message_id, "sender_id": int(sender_id), "recipient_id": int(recipient_id),
+            "timestamp": timestamp, "preview": text[:PREVIEW_LENGTH] if text else None}
+
+# Function to fold messages into one summary row per (user, partner): the newest message and the
+# number of messages each recipient got. Messages are ordered like the timeline, by (timestamp, kind, id).
+def _summary_rows(messages):
+    rows = {}
+    for message in messages:
+        sender, recipient = message['sender_id'], message['recipient_id']
+        views = [(sender, recipient, 0)]  # The sender's own messages are never unread
+        if recipient != sender:
+            views.append((recipient, sender, 1))
+        for user_id, partner_id, unread in views:
+            row = rows.get((user_id, partner_id))
+            if row is None:
+                row = rows[(user_id, partner_id)] = {"user_id": user_id, "partner_id": partner_id, "unread_count": 0}
+            row['unread_count'] += unread
+            newest = (message['timestamp'], message['kind'], message['id'])
+            if 'last_timestamp' not in row or newest >= (row['last_timestamp'], row['last_kind'], row['last_message_id']):
+                row.update(
+                    conversation_key=conversation_key(sender, recipient), last_kind=message['kind'],
+                    last_message_id=message['id'], last_sender_id=sender, last_preview=message['preview'],
+                    last_timestamp=message['timestamp'],
+                )
+    return list(rows.values())
+
+# Function to build the upsert that adds new messages to existing summaries: unread counts are added
+# up and the last message is only replaced by a newer one, so concurrent writers can't go backwards
+def _upsert(dialect_name):
+    dialect = postgresql if dialect_name == 'postgresql' else sqlite  # Both spell ON CONFLICT the same way
+    statement = dialect.insert(summary_table)
+    new, old = statement.excluded, summary_table.c
+    newer = tuple_(new.last_timestamp, new.last_kind, new.last_message_id) >= \
+        tuple_(old.last_timestamp, old.last_kind, old.last_message_id)
+    return statement.on_conflict_do_update(
+        index_elements=[old.user_id, old.partner_id],
+        set_={
+            'unread_count': old.unread_count + new.unread_count,
+            **{name: case((newer, new[name]), else_=old[name]) for name in LAST_MESSAGE_COLUMNS},
+        },
+    )
+
+# Function to update the summaries of both participants for messages written in the current
+# transaction; call it before the commit so messages and summaries are saved together
+def record_messages(messages):
+    rows = _summary_rows(messages)
+    if rows:
+        db.session.execute(_upsert(db.session.get_bind().dialect.name), rows)
+
+# Function to show a voice message's transcription in the summaries it is still the last message of
+def record_transcription(voice_message):
+    db.session.execute(
+        update(ConversationSummary)
+        .where(ConversationSummary.conversation_key == voice_message.conversation_key,
+               ConversationSummary.last_kind == 'voice', ConversationSummary.last_message_id == voice_message.id)
+        .values(last_preview=(voice_message.transcription or '')[:PREVIEW_LENGTH] or None)
+    )
+
+# Function to fetch one page of a user's conversations, most recently active first, as dicts of the
+# requested fields together with the cursor for the next page (or None)
+def conversation_list(user_id, limit, after=None, fields=()):
+    sort_key = tuple_(ConversationSummary.last_timestamp, ConversationSummary.partner_id)
+    query = select(
+        ConversationSummary.partner_id,
+        User.username.label('partner_username'),
+        ConversationSummary.last_kind,
+        ConversationSummary.last_message_id,
+        ConversationSummary.last_sender_id,
+        ConversationSummary.last_preview,
+        ConversationSummary.last_timestamp,
+        ConversationSummary.unread_count,
+        ConversationSummary.last_read_at,
+        ConversationSummary.partner_read_at,
+    ).join(User, User.id == ConversationSummary.partner_id).where(ConversationSummary.user_id == user_id)
+    if after:
+        query = query.where(sort_key < decode_cursor(after, datetime.fromisoformat, int))
+    query = query.order_by(ConversationSummary.last_timestamp.desc(), ConversationSummary.partner_id.desc())
+    rows = db.session.execute(query.limit(limit)).all()  # Range scan over the inbox index
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1].last_timestamp, rows[-1].partner_id)
+    return [{name: getattr(row, name) for name in fields} for row in rows], next_cursor
+
+# Function to count a partner's messages in a conversation newer than a timestamp, as a subquery
+# correlated with the summary row being updated
+def _unread_since(partner_id, timestamp):
+    counts = [
+        select(func.count()).where(
+            model.conversation_key == summary_table.c.conversation_key,
+            model.sender_id == partner_id, model.timestamp > timestamp
+        ).scalar_subquery()
+        for _, model, _ in SUMMARY_SOURCES
+    ]
+    return sum(counts[1:], counts[0])
+
+# Function to mark a partner's messages as read up to a timestamp (everything when up_to is None).
+# Read markers only move forward, and each update is a single statement, so a message arriving at
+# the same time is never counted as read. The partner's summary gets the read receipt.
+# Returns the user's summary row, or None when the two users have no conversation.
+def mark_read(user_id, partner_id, up_to=None):
+    mine = and_(summary_table.c.user_id == user_id, summary_table.c.partner_id == partner_id)
+    unread_after = or_(summary_table.c.last_read_at.is_(None), summary_table.c.last_read_at < summary_table.c.last_timestamp)
+    everything = update(summary_table).where(mine, unread_after).values(
+        last_read_at=summary_table.c.last_timestamp, unread_count=0
+    )
+    if up_to is None:
+        db.session.execute(everything)
+    else:
+        db.session.execute(everything.where(summary_table.c.last_timestamp <= up_to))
+        db.session.execute(update(summary_table).where(
+            mine, summary_table.c.last_timestamp > up_to,
+            or_(summary_table.c.last_read_at.is_(None), summary_table.c.last_read_at < up_to)
+        ).values(last_read_at=up_to, unread_count=_unread_since(partner_id, up_to)))
+
+    summary = db.session.get(ConversationSummary, (user_id, partner_id), populate_existing=True)
+    if summary is None:
+        db.session.rollback()
+        return None
+    db.session.execute(update(summary_table).where(
+        summary_table.c.user_id == partner_id, summary_table.c.partner_id == user_id
+    ).values(partner_read_at=summary.last_read_at))
+    db.session.commit()
+    return summary
+
+# Function to compute every summary from the message tables of the primary, keyed by (user, partner).
+# Unread counts follow the read markers already stored.
+def expected_summaries(connection):
+    messages = union_all(*(
+        select(
+            literal(kind).label('kind'), model.id, model.conversation_key, model.sender_id, model.recipient_id,
+            model.timestamp, func.substr(text, 1, PREVIEW_LENGTH).label('preview'),
+        )
+        for kind, model, text in SUMMARY_SOURCES
+    )).subquery()
+
+    # Newest message of each conversation, in timeline order
+    rank = func.row_number().over(
+        partition_by=messages.c.conversation_key,
+        order_by=(messages.c.timestamp.desc(), messages.c.kind.desc(), messages.c.id.desc()),
+    ).label('rank')
+    ranked = select(messages, rank).subquery()
+    newest = connection.execute(select(ranked).where(ranked.c.rank == 1))
+
+    read_marker = and_(summary_table.c.user_id == messages.c.recipient_id, summary_table.c.partner_id == messages.c.sender_id)
+    unread = dict(((row.recipient_id, row.sender_id), row.count) for row in connection.execute(
+        select(messages.c.recipient_id, messages.c.sender_id, func.count().label('count'))
+        .select_from(messages.outerjoin(summary_table, read_marker))
+        .where(messages.c.sender_id != messages.c.recipient_id,
+               or_(summary_table.c.last_read_at.is_(None), messages.c.timestamp > summary_table.c.last_read_at))
+        .group_by(messages.c.recipient_id, messages.c.sender_id)
+    ))
+
+    expected = {}
+    for row in newest:
+        for user_id, partner_id in {(row.sender_id, row.recipient_id), (row.recipient_id, row.sender_id)}:
+            expected[(user_id, partner_id)] = {
+                "user_id": user_id, "partner_id": partner_id, "conversation_key": row.conversation_key,
+                "last_kind": row.kind, "last_message_id": row.id, "last_sender_id": row.sender_id,
+                "last_preview": row.preview or None, "last_timestamp": row.timestamp,
+                "unread_count": unread.get((user_id, partner_id), 0),
+            }
+    return expected
+
+# Function to compare the stored summaries with ones recomputed from the messages, returning the
+# (user, partner) pairs that are missing, stale or orphaned. Conversations with archived messages
+# are only checked for their last message, since unread messages may have moved to the archive;
+# summaries of fully archived conversations are left alone. With repair=True the differences are
+# fixed in place, keeping the stored read markers.
+def check_summaries(connection, repair=False, chunk_size=5000):
+    expected = expected_summaries(connection)
+    archived = set(connection.scalars(select(ArchivedConversation.conversation_key).distinct()))
+    compared = LAST_MESSAGE_COLUMNS + ('unread_count',)
+
+    stored_keys = set()
+    stale, orphaned = [], []
+    for row in connection.execute(select(summary_table)).mappings():
+        pair = (row['user_id'], row['partner_id'])
+        stored_keys.add(pair)
+        want = expected.get(pair)
+        if want is None:
+            if row['conversation_key'] not in archived:
+                orphaned.append(pair)
+            continue
+        columns = LAST_MESSAGE_COLUMNS if row['conversation_key'] in archived else compared
+        if any(row[name] != want[name] for name in columns):
+            stale.append(pair)
+            if row['conversation_key'] in archived:
+                want['unread_count'] = row['unread_count']  # Keep what the check can't recount
+    missing = [pair for pair in expected if pair not in stored_keys]
+
+    if repair:
+        for pair in stale:
+            connection.execute(update(summary_table).where(
+                summary_table.c.user_id == pair[0], summary_table.c.partner_id == pair[1]
+            ).values(**{name: expected[pair][name] for name in compared}))
+        for start in range(0, len(missing), chunk_size):
+            connection.execute(summary_table.insert(), [expected[pair] for pair in missing[start:start + chunk_size]])
+        for pair in orphaned:
+            connection.execute(summary_table.delete().where(
+                summary_table.c.user_id == pair[0], summary_table.c.partner_id == pair[1]
+            ))
+    return {"checked": len(expected), "missing": missing, "stale": stale, "orphaned": orphaned}
@@ -0,0 +1,86 @@
+# timeline.py
+
+from datetime import datetime
+from sqlalchemy import select, literal, null, tuple_, union_all
+from database import db
+from models import User, Message, VoiceMessage
+from pagination import decode_cursor, encode_cursor, read_through
+
+# Each timeline source: item kind, model, the column shown as content and the status column (if any)
+TIMELINE_SOURCES = (
+    ('text', Message, Message.content, None),
+    ('voice', VoiceMessage, VoiceMessage.transcription, VoiceMessage.status),
+)
+
+# Function to build the cursor condition for one source. Timeline items are ordered by
+# (timestamp, kind, id), and within a source the kind is constant, so the comparison
+# collapses to the timestamp alone when the cursor points into the other source.
+def _cursor_filter(model, kind, cursor, backwards):
+    timestamp, cursor_kind, cursor_id = cursor
+    if kind == cursor_kind:
+        sort_key = tuple_(model.timestamp, model.id)
+        return sort_key < (timestamp, cursor_id) if backwards else sort_key > (timestamp, cursor_id)
+    inclusive = (kind < cursor_kind) == backwards  # Ties on timestamp fall on this side of the cursor
+    if backwards:
+        return model.timestamp <= timestamp if inclusive else model.timestamp < timestamp
+    return model.timestamp >= timestamp if inclusive else model.timestamp > timestamp
+
+# Function to build the query merging the next items of both sources after (or, walking backwards,
+# before) a cursor. Archive files have no user table, so archived items get their usernames later.
+def _timeline_query(key, limit, cursor, backwards, archived):
+    branches = []
+    for kind, model, content, status in TIMELINE_SOURCES:
+        sender_username = null() if archived else User.username
+        branch = select(
+            literal(kind).label('kind'),
+            model.id,
+            model.timestamp,
+            model.sender_id,
+            sender_username.label('sender_username'),
+            model.recipient_id,
+            content.label('content'),
+            (status if status is not None else null()).label('status'),
+        ).where(model.conversation_key == key)
+        if not archived:
+            branch = branch.join(User, User.id == model.sender_id)
+        if cursor:
+            branch = branch.where(_cursor_filter(model, kind, cursor, backwards))
+        if backwards:
+            branch = branch.order_by(model.timestamp.desc(), model.id.desc())
+        else:
+            branch = branch.order_by(model.timestamp, model.id)
+        # Each source contributes at most one page, read straight off its conversation index
+        branches.append(select(branch.limit(limit).subquery()))
+
+    merged = union_all(*branches).subquery()
+    order = (merged.c.timestamp, merged.c.kind, merged.c.id)
+    return select(merged).order_by(*(column.desc() for column in order) if backwards else order).limit(limit)
+
+# Function to fetch one page of text and voice messages of a conversation, merged by timestamp in SQL.
+# Paging works like conversation_page: newest page by default, "before"/"after" cursors otherwise,
+# continuing into the archive when one is given.
+def timeline_page(key, limit, before=None, after=None, archive=None):
+    token = after or before
+    cursor = decode_cursor(token, datetime.fromisoformat, str, int) if token else None
+    backwards = not after
+
+    rows = read_through(
+        lambda cursor, remaining, archived: _timeline_query(key, remaining, cursor, backwards, archived),
+        limit, cursor, not backwards, lambda row: (row.timestamp, row.kind, row.id),
+        archive, key, tuple(model for _, model, _, _ in TIMELINE_SOURCES)
+    )
+    items = [row._asdict() for row in rows]
+    missing = {item['sender_id'] for item in items if item['sender_username'] is None}
+    if missing:
+        usernames = dict(db.session.execute(select(User.id, User.username).where(User.id.in_(missing))).all())
+        for item in items:
+            if item['sender_username'] is None:
+                item['sender_username'] = usernames.get(item['sender_id'])
+
+    next_cursor = None
+    if len(items) == limit:
+        last = items[-1]  # Furthest item in the direction of travel
+        next_cursor = encode_cursor(last['timestamp'], last['kind'], last['id'])
+    if backwards:
+        items.reverse()  # Return the page oldest first
+    return items, next_cursor
@@ -0,0 +1,63 @@
+# transcript_cache.py
+
+import threading
+from datetime import datetime, timedelta
+from database import db
+from models import TranscriptionCacheEntry
+from cache import MISSING, TTLCache
+
+# Two-tier cache of finished transcriptions, keyed by the SHA-256 of the uploaded audio
+# and the model that transcribed it. The in-memory LRU tier answers repeats within a process;
+# the SQLite tier survives restarts and is shared by every worker process.
+class TranscriptionCache:
+    def __init__(self, memory_size, ttl, max_rows, evict_every=100):
+        self.ttl = ttl  # Seconds an entry stays valid in either tier
+        self.max_rows = max_rows  # Upper bound on rows in the persistent tier
+        self.evict_every = evict_every  # Run eviction on the persistent tier every this many puts
+        self.memory = TTLCache(memory_size, ttl)
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+            return self.counters[name]
+
+    # Look up a transcription; must run inside an app context
+    def get(self, digest, model):
+        key = f"{model}:{digest}"
+        transcription = self.memory.get(key)
+        if transcription is not MISSING:
+            self._count('memory_hits')
+            return transcription
+        entry = db.session.get(TranscriptionCacheEntry, key)
+        if entry and entry.created_at >= datetime.utcnow() - timedelta(seconds=self.ttl):
+            self._count('db_hits')
+            self.memory.set(key, entry.transcription)  # Promote to the memory tier
+            return entry.transcription
+        self._count('misses')
+        return None
+
+    # Store a finished transcription; must run inside an app context
+    def put(self, digest, model, transcription):
+        key = f"{model}:{digest}"
+        self.memory.set(key, transcription)
+        db.session.merge(TranscriptionCacheEntry(key=key, transcription=transcription, created_at=datetime.utcnow()))
+        db.session.commit()
+        if self._count('stores') % self.evict_every == 0:
+            self.evict()
+
+    # Drop expired rows and, past max_rows, the oldest ones
+    def evict(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        entries = TranscriptionCacheEntry.query
+        entries.filter(TranscriptionCacheEntry.created_at < cutoff).delete(synchronize_session=False)
+        excess = entries.count() - self.max_rows
+        if excess > 0:
+            oldest = db.select(TranscriptionCacheEntry.key).order_by(TranscriptionCacheEntry.created_at).limit(excess)
+            entries.filter(TranscriptionCacheEntry.key.in_(oldest)).delete(synchronize_session=False)
+        db.session.commit()
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, memory_entries=len(self.memory))
@@ -0,0 +1,264 @@
+# transcription.py
+
+import io
+import logging
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from sqlalchemy import update
+from database import db
+from models import VoiceMessage, next_completed_seq
+from summaries import record_transcription
+from audio import decode_wav, encode_wav, preprocess_samples, preprocess_wav, split_on_silence, wav_duration
+
+transcription_log = logging.getLogger('chat.transcription')
+
+# Base class for speech-to-text backends. Subclasses implement transcribe().
+class Transcriber:
+    model = None  # Model name, reported alongside every transcription
+
+    def transcribe(self, audio_file, filename):
+        raise NotImplementedError
+
+# Transcriber backed by the OpenAI Whisper API
+class OpenAITranscriber(Transcriber):
+    def __init__(self, model='whisper-1'):
+        self.model = model
+        self._client = None
+
+    def transcribe(self, audio_file, filename):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI()  # Created lazily so every worker process builds its own client
+        transcript = self._client.audio.transcriptions.create(model=self.model, file=(filename, audio_file))
+        return transcript.text
+
+# Local stand-in for the OpenAI API, used by tests and benchmarks
+class FakeTranscriber(Transcriber):
+    model = 'fake'
+
+    def __init__(self, delay=0.0, text=None, delay_per_second=0.0):
+        self.delay = delay  # Seconds to sleep per call, simulating the API round-trip
+        self.delay_per_second = delay_per_second  # Extra seconds per second of WAV audio, simulating model time
+        self.text = text
+
+    def transcribe(self, audio_file, filename):
+        data = audio_file.read()
+        size = len(data)
+        delay = self.delay + self.delay_per_second * (wav_duration(data[:4096]) or 0)
+        if delay:
+            time.sleep(delay)
+        return self.text if self.text is not None else f"Fake transcription of {filename} ({size} bytes)"
+
+# Function to build the transcriber selected by the app configuration
+def create_transcriber(config):
+    name = config['TRANSCRIBER']
+    if isinstance(name, Transcriber):
+        return name  # Allow a ready-made instance to be plugged in directly
+    if name == 'openai':
+        return OpenAITranscriber(model=config['TRANSCRIPTION_MODEL'])
+    if name == 'fake':
+        return FakeTranscriber(delay=config['FAKE_TRANSCRIBER_DELAY'],
+                               delay_per_second=config['FAKE_TRANSCRIBER_DELAY_PER_SECOND'])
+    raise ValueError(f"Unknown transcriber: {name}")
+
+# Function to shrink a WAV clip with the configured preprocessing options before it is sent
+def prepare_audio(audio, filename, preprocess):
+    if not preprocess or not filename.endswith('.wav'):
+        return audio  # Compressed formats are sent as they are
+    audio.seek(0)
+    try:
+        return io.BytesIO(preprocess_wav(audio.read(), **preprocess))
+    except (wave.Error, EOFError, ValueError):
+        return audio  # Not a PCM WAV we can decode; let the transcriber deal with it
+
+# Function to transcribe an audio buffer, retrying failed attempts with exponential backoff
+def transcribe_with_retry(transcriber, audio, filename, max_retries, backoff, preprocess=None):
+    if isinstance(audio, bytes):
+        audio = io.BytesIO(audio)  # Worker processes receive the raw bytes
+    audio = prepare_audio(audio, filename, preprocess)
+    attempt = 0
+    while True:
+        try:
+            audio.seek(0)  # Every attempt reads the clip from the start
+            return transcriber.transcribe(audio, filename)
+        except Exception:
+            attempt += 1
+            if attempt > max_retries:
+                raise  # Give up once every retry has been used
+            time.sleep(backoff * (2 ** (attempt - 1)))
+
+# Function to transcribe in a worker and report how long the call took, retries included
+def timed_transcribe(*args):
+    start = time.perf_counter()
+    return transcribe_with_retry(*args), time.perf_counter() - start
+
+# Bounded worker pool that transcribes uploaded voice messages off the request thread
+class TranscriptionQueue:
+    def __init__(self, app, transcriber, on_complete=None, cache=None, metrics=None):
+        self.app = app
+        self.transcriber = transcriber
+        self.cache = cache  # Optional TranscriptionCache that receives every successful transcription
+        self.metrics = metrics  # Optional Metrics that times every transcription
+        self.on_complete = on_complete  # Called with the updated VoiceMessage inside an app context
+        self.max_retries = app.config['TRANSCRIPTION_MAX_RETRIES']
+        self.backoff = app.config['TRANSCRIPTION_RETRY_BACKOFF']
+        self.store_retries = app.config['TRANSCRIPTION_STORE_RETRIES']
+        self.store_backoff = app.config['TRANSCRIPTION_STORE_BACKOFF']
+        self.preprocess = {
+            'target_rate': app.config['AUDIO_TARGET_RATE'],
+            'silence_threshold_db': app.config['AUDIO_SILENCE_THRESHOLD_DB'],
+            'encoding': app.config['AUDIO_ENCODING'],
+        } if app.config['AUDIO_PREPROCESS'] else None
+        self.segment_seconds = app.config['SEGMENT_SECONDS'] if app.config['SEGMENTED_TRANSCRIPTION'] else None
+        workers = app.config['TRANSCRIPTION_WORKERS']
+        if app.config['TRANSCRIPTION_EXECUTOR'] == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcription')
+        # Coordinators only split clips and wait on their segments, which run on the bounded executor above
+        self.coordinator = ThreadPoolExecutor(
+            max_workers=app.config['SEGMENT_COORDINATORS'], thread_name_prefix='transcription-segments'
+        )
+
+    # Queue an uploaded audio buffer for transcription; the result is written back to the VoiceMessage row
+    # and, given the audio's digest, to the cache. The buffer is released once the transcription has finished.
+    # WAV clips whose header says they run longer than one segment are transcribed in segments.
+    def submit(self, voice_message_id, audio, filename, digest=None, duration=None):
+        queued = time.perf_counter()
+        if self.segment_seconds and filename.endswith('.wav') and duration and duration > self.segment_seconds:
+            future = self.coordinator.submit(self._transcribe_segments, voice_message_id, audio, filename)
+        else:
+            payload = audio.read() if isinstance(self.executor, ProcessPoolExecutor) else audio  # Can't pickle buffers
+            future = self.executor.submit(
+                timed_transcribe, self.transcriber, payload, filename,
+                self.max_retries, self.backoff, self.preprocess
+            )
+        future.add_done_callback(lambda f: self._store_result(voice_message_id, audio, digest, queued, f))
+        return future
+
+    # Split a long clip at pauses, transcribe the segments concurrently and stitch them back together in order.
+    # The transcript so far is saved on the row as segments finish, so readers can follow along.
+    def _transcribe_segments(self, voice_message_id, audio, filename):
+        audio.seek(0)
+        if self.preprocess:
+            rate = self.preprocess['target_rate']
+            samples = preprocess_samples(audio.read(), rate, self.preprocess['silence_threshold_db'])
+        else:
+            samples, rate = decode_wav(audio.read())
+        encoding = self.preprocess['encoding'] if self.preprocess else 'pcm16'
+        stem = filename.rsplit('.', 1)[0]
+
+        futures = {}
+        for index, (start, end) in enumerate(split_on_silence(samples, rate, self.segment_seconds)):
+            future = self.executor.submit(
+                timed_transcribe, self.transcriber, encode_wav(samples[start:end], rate, encoding),
+                f"{stem}-{index}.wav", self.max_retries, self.backoff
+            )
+            futures[future] = index
+
+        texts = [None] * len(futures)
+        self._store_progress(voice_message_id, texts)
+        try:
+            for future in as_completed(futures):
+                text, seconds = future.result()
+                texts[futures[future]] = text.strip()
+                if self.metrics:
+                    self.metrics.observe_transcriber_call(seconds, 'segment')
+                self._store_progress(voice_message_id, texts)
+        except Exception:
+            for future in futures:
+                future.cancel()  # Don't spend API calls on a transcript that has already failed
+            raise
+        return " ".join(texts), None  # Segment calls were timed one by one
+
+    # Save the finished prefix of a segmented transcription together with the progress counts.
+    # Progress is best effort: a failed write is skipped, and the next segment or the result catches up.
+    def _store_progress(self, voice_message_id, texts):
+        done = sum(text is not None for text in texts)
+        prefix = []
+        for text in texts:
+            if text is None:
+                break
+            prefix.append(text)
+        with self.app.app_context():
+            try:
+                voice_message = db.session.get(VoiceMessage, voice_message_id)
+                if voice_message is not None and voice_message.status in ('pending', 'processing'):
+                    voice_message.status = 'processing'
+                    voice_message.transcription = " ".join(prefix) or None
+                    voice_message.segments_total = len(texts)
+                    voice_message.segments_done = done
+                    record_transcription(voice_message)  # The partial text is the preview for now
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                transcription_log.warning("Could not save the progress of voice message %s", voice_message_id, exc_info=True)
+
+    def _store_result(self, voice_message_id, audio, digest, queued, future):
+        try:
+            transcription, call_seconds = future.result()
+            status = 'completed'
+        except Exception as e:
+            transcription = f"Transcription failed: {str(e)}"  # Keep the error visible to readers
+            status = 'failed'
+            call_seconds = None
+
+        try:
+            voice_message = self._save_result(voice_message_id, transcription, status, digest)
+            if voice_message is not None and self.on_complete:
+                with self.app.app_context():
+                    self.on_complete(voice_message)
+        except Exception:
+            transcription_log.exception("Could not finish voice message %s", voice_message_id)
+        finally:
+            getattr(audio, 'release', audio.close)()  # Free the upload buffer
+            if self.metrics:
+                if call_seconds is not None:
+                    self.metrics.observe_transcriber_call(call_seconds, 'whole')
+                self.metrics.observe_transcription(time.perf_counter() - queued, status)
+
+    # Write a finished transcription to the row (and the cache), retrying with backoff in a fresh session
+    # each time, e.g. while other writers hold the database. If every attempt fails the row is marked
+    # failed, so it never stays pending. Returns the saved VoiceMessage, or None if the row is gone.
+    def _save_result(self, voice_message_id, transcription, status, digest):
+        for attempt in range(self.store_retries + 1):
+            with self.app.app_context():
+                try:
+                    if self.cache is not None and digest and status == 'completed':
+                        self.cache.put(digest, self.transcriber.model, transcription)
+                    voice_message = db.session.get(VoiceMessage, voice_message_id)
+                    if voice_message is not None:
+                        voice_message.transcription = transcription
+                        voice_message.status = status
+                        voice_message.completed_seq = db.session.scalar(next_completed_seq())
+                        record_transcription(voice_message)
+                        db.session.commit()
+                    return voice_message
+                except Exception:
+                    db.session.rollback()
+                    transcription_log.warning(
+                        "Saving the transcription of voice message %s failed (attempt %d of %d)",
+                        voice_message_id, attempt + 1, self.store_retries + 1, exc_info=True
+                    )
+            if attempt < self.store_retries:
+                time.sleep(self.store_backoff * (2 ** attempt))
+
+        # Last resort: a single small UPDATE, so pollers see a final status instead of waiting forever
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    update(VoiceMessage)
+                    .where(VoiceMessage.id == voice_message_id, VoiceMessage.status.in_(('pending', 'processing')))
+                    .values(status='failed', transcription="Transcription failed: the result could not be saved",
+                            completed_seq=next_completed_seq().scalar_subquery())
+                )
+                db.session.commit()
+                return db.session.get(VoiceMessage, voice_message_id)
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def shutdown(self, wait=True):
+        self.coordinator.shutdown(wait=wait)
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,77 @@
+# uploads.py
+
+import hashlib
+from tempfile import SpooledTemporaryFile
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from audio import sniff_audio_format, wav_duration
+
+SNIFF_BYTES = 4096  # Bytes collected before the format and duration are checked
+
+# Upload buffer that is written while the multipart body streams in. Small uploads stay in
+# memory and larger ones spill to an anonymous temp file. Oversized or non-audio payloads are
+# rejected as soon as the offending bytes arrive, not after the whole body has been read.
+class AudioUploadStream(SpooledTemporaryFile):
+    def __init__(self, max_bytes, max_seconds, spool_size):
+        super().__init__(max_size=spool_size)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.size = 0
+        self.audio_format = None
+        self.duration = None  # Seconds, when the header tells us
+        self.claimed = False  # Once claimed, closing is left to whoever claimed it
+        self._header = b''
+        self._sha256 = hashlib.sha256()  # Hashed as the bytes stream in, for the transcription cache
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"Voice messages are limited to {self.max_bytes // (1024 * 1024)}MB")
+        if self.audio_format is None and len(self._header) < SNIFF_BYTES:
+            self._header += data[:SNIFF_BYTES - len(self._header)]
+            if len(self._header) >= SNIFF_BYTES:
+                self._check_header()
+        self._sha256.update(data)
+        return super().write(data)
+
+    # SHA-256 hex digest of everything written so far
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    # The multipart parser rewinds the stream once the part is complete
+    def seek(self, *args):
+        if self.audio_format is None:
+            self._check_header()  # Uploads shorter than SNIFF_BYTES
+        return super().seek(*args)
+
+    def _check_header(self):
+        self.audio_format = sniff_audio_format(self._header)
+        if self.audio_format is None:
+            raise UnsupportedMediaType("File type not allowed. Only WAV, MP3, and OGG files are accepted.")
+        if self.audio_format == 'wav':
+            self.duration = wav_duration(self._header)
+            if self.duration is not None and self.duration > self.max_seconds:
+                raise RequestEntityTooLarge(f"Voice messages are limited to {self.max_seconds} seconds")
+
+    # Keep the buffer alive past the end of the request, e.g. for a transcription worker
+    def claim(self):
+        self.claimed = True
+        return self
+
+    def close(self):
+        if not self.claimed:
+            super().close()
+
+    # Close a claimed buffer once it is no longer needed
+    def release(self):
+        self.claimed = False
+        self.close()
+
+# Request class that streams uploaded files into AudioUploadStream buffers
+class ChatRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        return AudioUploadStream(
+            config['VOICE_MESSAGE_MAX_BYTES'], config['VOICE_MESSAGE_MAX_SECONDS'], config['VOICE_UPLOAD_SPOOL_SIZE']
+        )
@@ -0,0 +1,2 @@
+# Benchmark scripts for the chat server. Run them from the repository root, e.g.
+#   python -m benchmarks.bench_history --rows 1000000
@@ -0,0 +1,105 @@
+# bench_conversations.py - latency of a user's conversation list: summaries vs. scanning the messages
+#
+#   python -m benchmarks.bench_conversations --users 100000 --messages 500000
+#
+# Most users have a handful of partners; --active users talk to --partners others each. Their inbox is
+# read three ways: GET /users/<id>/conversations (one range scan over the summaries), an aggregate over
+# the message table, and the client-side fan-out of one GET /messages per user in the directory, which
+# is timed on a sample of --fanout-sample calls and extrapolated to every user.
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import func, insert, or_, select
+from benchmarks.common import load_app, measure, report
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=500000)
+    parser.add_argument('--active', type=int, default=100, help="users with many conversations")
+    parser.add_argument('--partners', type=int, default=500, help="conversations of each active user")
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--fanout-sample', type=int, default=1000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='chat-conversations-'), 'bench.db')
+    chat_app = load_app(db_path, METRICS_ENABLED=False)
+    app, db = chat_app.app, chat_app.db
+    from database import checkpoint
+    from ingest import insert_messages
+    from models import ConversationSummary, Message, User
+
+    rng = random.Random(1)
+    with app.app_context():
+        for start in range(1, args.users + 1, 50000):
+            db.session.execute(insert(User), [
+                {"username": f"user{i}"} for i in range(start, min(start + 50000, args.users + 1))
+            ])
+        db.session.commit()
+
+        active = list(range(1, args.active + 1))
+        pairs = [(a, rng.randint(1, args.users)) for a in active for _ in range(args.partners)]
+        pairs += [tuple(rng.sample(range(1, args.users + 1), 2)) for _ in range(args.users)]  # About 2 per user
+        pairs = [(a, b) for a, b in pairs if a != b]
+        start = time.perf_counter()
+        for offset in range(0, args.messages, 50000):
+            rows = []
+            for i in range(offset, min(offset + 50000, args.messages)):
+                a, b = rng.choice(pairs)
+                if rng.random() < 0.5:
+                    a, b = b, a
+                rows.append({"sender_id": a, "recipient_id": b, "content": f"message {i} " + "lorem ipsum " * (i % 6)})
+            insert_messages(rows, 5000)  # Maintains the summaries as it goes
+        elapsed = time.perf_counter() - start
+        summaries = db.session.scalar(select(func.count()).select_from(ConversationSummary))
+        db.session.rollback()  # Hand back the write lock the count took before checkpointing on another connection
+        checkpoint(db.engine)
+    print(f"seeded {args.users} users, {args.messages} messages and {summaries} summaries "
+          f"in {elapsed:.1f}s ({args.messages / elapsed:.0f} messages/s)")
+
+    from summaries import check_summaries
+    with app.app_context(), db.engine.begin() as connection:
+        start = time.perf_counter()
+        result = check_summaries(connection)
+        problems = sum(len(result[name]) for name in ('missing', 'stale', 'orphaned'))
+        print(f"consistency check of {result['checked']} summaries: {problems} problems in {time.perf_counter() - start:.1f}s")
+
+    test_client = app.test_client()
+    samples = iter([rng.choice(active) for _ in range(args.repeat * 2)])
+    print(f"\nconversation list of an active user ({args.partners} partners):")
+    report("  summaries (GET /users/<id>/conversations)",
+           measure(lambda: test_client.get(f"/users/{next(samples)}/conversations"), args.repeat))
+
+    # What the endpoint would have to compute without summaries: the newest message and messages received per
+    # partner (unread counts would also need the read markers)
+    def aggregate(user_id):
+        partner = func.iif(Message.sender_id == user_id, Message.recipient_id, Message.sender_id).label('partner')
+        query = select(
+            partner, func.max(Message.timestamp).label('last_timestamp'),
+            func.sum(func.iif(Message.recipient_id == user_id, 1, 0)).label('received'),
+        ).where(or_(Message.sender_id == user_id, Message.recipient_id == user_id)).group_by(partner)
+        with app.app_context():
+            return db.session.execute(query.order_by(func.max(Message.timestamp).desc()).limit(50)).all()
+    repeat = max(1, args.repeat // 20)
+    report("  aggregate over the message table", measure(lambda: aggregate(next(samples)), repeat))
+
+    # Without any inbox endpoint, a client asks every user in the directory for their last message
+    user_id = active[0]
+    others = iter(rng.sample(range(1, args.users + 1), args.fanout_sample))
+    stats = measure(lambda: test_client.get(f"/messages?user1_id={user_id}&user2_id={next(others)}&limit=1"),
+                    args.fanout_sample)
+    report("  one GET /messages of the fan-out", stats)
+    print(f"  fan-out over all {args.users} users: about {sum(stats) / 1000 * args.users / args.fanout_sample:.0f}s "
+          f"per conversation list")
+
+    senders = iter(rng.sample(pairs, args.repeat))
+    report("\n  POST /messages (message plus both summaries)", measure(
+        lambda: test_client.post('/messages', json=dict(zip(('sender_id', 'recipient_id'), next(senders)), content="hi")),
+        args.repeat
+    ))
+
+if __name__ == '__main__':
+    main()
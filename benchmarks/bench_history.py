@@ -0,0 +1,84 @@
+# bench_history.py - conversation history fetch latency before and after the conversation index
+#
+#   python -m benchmarks.bench_history --rows 1000000 --hot 200000
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from benchmarks.common import load_app, measure, report
+
+# Function to fill the message table with one large conversation plus background traffic
+def seed(db, Message, conversation_key, rows, hot, users, chunk=50000):
+    start = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    batch = []
+    for i in range(rows):
+        if i % (rows // hot or 1) == 0:
+            sender, recipient = rng.choice([(1, 2), (2, 1)])  # The conversation we read back
+        else:
+            sender, recipient = rng.sample(range(3, users + 1), 2)
+        batch.append({
+            "content": f"message {i}",
+            "timestamp": start + timedelta(seconds=i),
+            "sender_id": sender,
+            "recipient_id": recipient,
+            "conversation_key": conversation_key(sender, recipient),
+        })
+        if len(batch) == chunk:
+            db.session.execute(Message.__table__.insert(), batch)
+            db.session.commit()
+            batch = []
+    if batch:
+        db.session.execute(Message.__table__.insert(), batch)
+        db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--hot', type=int, default=200_000, help="messages in the conversation being read")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    chat_app = load_app()
+    from database import db
+    from models import User, Message, conversation_key
+    from pagination import conversation_page, encode_cursor
+    from sqlalchemy import text
+
+    with chat_app.app.app_context():
+        db.session.execute(User.__table__.insert(), [{"username": f"user{i}"} for i in range(1, args.users + 1)])
+        seed(db, Message, conversation_key, args.rows, args.hot, args.users)
+        key = conversation_key(1, 2)
+        total = Message.query.filter(Message.conversation_key == key).count()
+        print(f"Seeded {args.rows} messages, {total} in the benchmarked conversation")
+
+        # Before: no conversation index, OR predicate as in the original get_messages
+        db.session.execute(text("DROP INDEX ix_message_conversation"))
+        legacy = Message.query.filter(
+            ((Message.sender_id == 1) & (Message.recipient_id == 2)) |
+            ((Message.sender_id == 2) & (Message.recipient_id == 1))
+        )
+        deep_offset = total * 3 // 4
+        report("before: full history (.all())", measure(lambda: legacy.order_by(Message.timestamp).all(), 3))
+        report("before: first page (LIMIT)", measure(
+            lambda: legacy.order_by(Message.timestamp.desc()).limit(args.limit).all(), args.repeat))
+        report("before: deep page (OFFSET)", measure(
+            lambda: legacy.order_by(Message.timestamp.desc()).offset(deep_offset).limit(args.limit).all(),
+            args.repeat))
+
+        # After: conversation index plus keyset pagination
+        db.session.execute(text(
+            "CREATE INDEX ix_message_conversation ON message (conversation_key, timestamp, id)"))
+        db.session.execute(text("ANALYZE"))
+        deep_row = Message.query.filter(Message.conversation_key == key).order_by(
+            Message.timestamp.desc(), Message.id.desc()).offset(deep_offset).first()
+        deep_cursor = encode_cursor(deep_row.timestamp, deep_row.id)
+        report("after: first page (keyset)", measure(
+            lambda: conversation_page(Message, key, args.limit), args.repeat))
+        report("after: deep page (keyset)", measure(
+            lambda: conversation_page(Message, key, args.limit, before=deep_cursor), args.repeat))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# bench_ingest.py - message ingest throughput: per-message commits vs. write coalescing vs. POST /messages/batch
+#
+#   python -m benchmarks.bench_ingest --messages 20000 --clients 16
+
+import argparse
+import threading
+import time
+from benchmarks.common import load_app
+
+# Function to post messages one at a time from several concurrent clients, returning the messages/sec
+# that were stored and the number of requests that failed (any non-2xx response)
+def run_single(app, messages, clients, users):
+    per_client = messages // clients
+    errors = []
+
+    def client_loop(offset):
+        test_client = app.test_client()
+        failed = 0
+        for i in range(per_client):
+            sender = (offset + i) % users + 1
+            recipient = sender % users + 1
+            response = test_client.post('/messages', json={"sender_id": sender, "recipient_id": recipient, "content": "hi"})
+            if not 200 <= response.status_code < 300:
+                failed += 1
+        errors.append(failed)
+
+    threads = [threading.Thread(target=client_loop, args=(offset,)) for offset in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    failed = sum(errors)
+    return (per_client * clients - failed) / (time.perf_counter() - start), failed
+
+# Function to post messages through the batch endpoint, returning the messages/sec that were stored
+# and the number of messages that weren't
+def run_batch(app, messages, batch_size, users):
+    test_client = app.test_client()
+    created = 0
+    start = time.perf_counter()
+    for offset in range(0, messages, batch_size):
+        response = test_client.post('/messages/batch', json={"messages": [
+            {"sender_id": i % users + 1, "recipient_id": (i + 1) % users + 1, "content": "hi"}
+            for i in range(offset, min(offset + batch_size, messages))
+        ]})
+        if 200 <= response.status_code < 300:
+            created += response.json['created']
+    return created / (time.perf_counter() - start), messages - created
+
+# Function to print one throughput line; failed messages are excluded from the rate
+def report(label, rate, errors):
+    print(f"{label:<21} {rate:10.1f} msg/s  {errors} errors")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--clients', type=int, default=16, help="concurrent clients for single-message posts")
+    parser.add_argument('--batch', type=int, default=1000, help="messages per POST /messages/batch")
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    chat_app = load_app()
+    app = chat_app.app
+    test_client = app.test_client()
+    for i in range(1, args.users + 1):
+        test_client.post('/users', json={"username": f"user{i}"})
+
+    app.config['MESSAGE_WRITE_COALESCING'] = False
+    report("per-message commits", *run_single(app, args.messages, args.clients, args.users))
+    app.config['MESSAGE_WRITE_COALESCING'] = True
+    report("coalesced commits", *run_single(app, args.messages, args.clients, args.users))
+    report("batch endpoint", *run_batch(app, args.messages, args.batch, args.users))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# bench_load.py - requests/sec of the production server (serve.py) for mixed read/write traffic
+#
+#   python -m benchmarks.bench_load --workers 1,2,4,8 --clients 32 --duration 20
+#
+# Each worker count gets a fresh database, so runs are comparable. Throughput that stops
+# growing as workers are added marks the point where SQLite writer contention sets in.
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.common import APP_DIR, percentile
+
+# Function to start serve.py with the given number of worker processes; settings are extra environment variables
+def start_server(port, workers, threads, db_path, **settings):
+    env = dict(os.environ, **settings)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{db_path}",
+        'TRANSCRIBER': 'fake',
+        'SERVER_BIND': f"127.0.0.1:{port}",
+        'SERVER_WORKERS': str(workers),
+        'SERVER_THREADS': str(threads),
+    })
+    server = subprocess.Popen([sys.executable, 'serve.py'], cwd=APP_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/users?limit=1')
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)  # Not accepting connections yet
+    server.kill()
+    raise RuntimeError("server did not start")
+
+# Function to send one request on a keep-alive connection and return the status code
+def call(connection, method, path, body=None):
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+# Function to run one virtual client until the deadline, recording latencies per operation
+def client_loop(port, users, write_ratio, deadline, results, seed):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while time.time() < deadline:
+        a, b = rng.sample(range(1, users + 1), 2)
+        roll = rng.random()
+        if roll < write_ratio:
+            op, args = 'send', ('POST', '/messages', {"sender_id": a, "recipient_id": b, "content": "hi"})
+        elif roll < write_ratio + (1 - write_ratio) / 2:
+            op, args = 'timeline', ('GET', f"/conversations/{a}/{b}/timeline")
+        else:
+            op, args = 'lookup', ('GET', f"/users/by-username/user{a}")
+        start = time.perf_counter()
+        try:
+            ok = call(connection, *args) < 500
+        except (OSError, http.client.HTTPException):
+            ok = False
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)  # Reconnect
+        results.append((op, (time.perf_counter() - start) * 1000, ok))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4', help="comma separated worker process counts")
+    parser.add_argument('--threads', type=int, default=4, help="threads per worker process")
+    parser.add_argument('--clients', type=int, default=32, help="concurrent virtual clients")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--duration', type=float, default=15, help="seconds per worker count")
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    for workers in [int(w) for w in args.workers.split(',')]:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='chat-load-'), 'load.db')
+        server = start_server(args.port, workers, args.threads, db_path)
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', args.port, timeout=30)
+            for i in range(1, args.users + 1):
+                call(connection, 'POST', '/users', {"username": f"user{i}"})
+
+            results = []
+            deadline = time.time() + args.duration
+            clients = [threading.Thread(target=client_loop,
+                                        args=(args.port, args.users, args.write_ratio, deadline, results, seed))
+                       for seed in range(args.clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+        errors = sum(1 for _, _, ok in results if not ok)
+        print(f"workers={workers:<3} {len(results) / args.duration:9.1f} req/s  errors={errors}")
+        for op in ('send', 'timeline', 'lookup'):
+            latencies = [ms for name, ms, _ in results if name == op]
+            print(f"    {op:<10} n={len(latencies):<7} p50={percentile(latencies, 50):8.2f}ms  "
+                  f"p99={percentile(latencies, 99):8.2f}ms")
+
+if __name__ == '__main__':
+    main()
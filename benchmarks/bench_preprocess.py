@@ -0,0 +1,58 @@
+# bench_preprocess.py - bytes and wall time saved per clip by the audio preprocessing stage
+#
+#   python -m benchmarks.bench_preprocess --seconds 5,30,120 --uplink-mbps 10
+
+import argparse
+import io
+import time
+import wave
+import numpy as np
+from benchmarks.common import load_app
+
+# Function to build a speech-like test clip: amplitude-modulated tones padded with silence
+def synthetic_clip(seconds, rate, channels, silence=1.0):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * rate)) / rate
+    voice = sum(np.sin(2 * np.pi * f * t) for f in (180, 360, 720, 1400)) / 4
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)  # Syllable-rate loudness changes
+    signal = 0.4 * voice * envelope + 0.01 * rng.standard_normal(len(t))
+    pad = np.zeros(int(silence * rate))
+    signal = np.concatenate([pad, signal, pad])
+    frames = np.repeat(signal[:, None], channels, axis=1)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((frames * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', default='5,30,120', help="comma separated clip lengths")
+    parser.add_argument('--rate', type=int, default=44100, help="sample rate of the recorded clip")
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--uplink-mbps', type=float, default=10, help="bandwidth used to estimate transfer time")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    load_app()
+    from audio import preprocess_wav
+
+    print(f"{'clip':>6} {'encoding':>8} {'original':>10} {'processed':>10} {'saved':>7} "
+          f"{'cpu ms':>8} {'transfer ms saved':>18}")
+    for seconds in [float(s) for s in args.seconds.split(',')]:
+        clip = synthetic_clip(seconds, args.rate, args.channels)
+        for encoding in ('pcm16', 'mulaw'):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                processed = preprocess_wav(clip, encoding=encoding)
+                timings.append((time.perf_counter() - start) * 1000)
+            saved_bytes = len(clip) - len(processed)
+            transfer_saved = saved_bytes * 8 / (args.uplink_mbps * 1e6) * 1000
+            print(f"{seconds:>5.0f}s {encoding:>8} {len(clip):>10} {len(processed):>10} "
+                  f"{saved_bytes / len(clip):>6.0%} {min(timings):>8.1f} {transfer_saved:>18.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# bench_replicas.py - history read throughput of serve.py as SQLite read replicas are added
+#
+#   python -m benchmarks.bench_replicas --replicas 0,1,2,4 --clients 32 --writers 4 --duration 15
+#
+# A seeded primary is copied to N replica files, and serve.py routes GET /messages, /users and
+# timeline reads to them round-robin while writer clients keep posting to the primary. With
+# --read-only, the 0-replica run reads through a separate pool of read-only connections instead.
+
+import argparse
+import http.client
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from benchmarks.bench_load import call, start_server
+from benchmarks.common import load_app, percentile
+
+# Function to create the primary with users and conversation history
+def seed_primary(db_path, users, conversations, messages):
+    chat_app = load_app(db_path)
+    from ingest import insert_messages
+    from models import User
+    rng = random.Random(1)
+    with chat_app.app.app_context():
+        chat_app.db.session.add_all(User(username=f"user{i}") for i in range(1, users + 1))
+        chat_app.db.session.commit()
+        pairs = sorted({tuple(rng.sample(range(1, users + 1), 2)) for _ in range(conversations)})
+        rows = [
+            {"sender_id": a, "recipient_id": b, "content": f"message {i} between {a} and {b}"}
+            for a, b in pairs for i in range(messages)
+        ]
+        insert_messages(rows, 5000)
+        chat_app.db.engine.dispose()  # Close the file before serve.py opens it
+    return pairs
+
+# Function to copy the primary to count replica files, returning their URLs
+def make_replicas(db_path, count):
+    urls = []
+    for index in range(count):
+        path = f"{db_path}.replica{index}"
+        source, target = sqlite3.connect(db_path), sqlite3.connect(path)
+        source.backup(target)
+        source.close()
+        target.close()
+        urls.append(f"sqlite:///{path}")
+    return urls
+
+# Function to run one virtual client until the deadline, reading history or (as a writer) sending messages
+def client_loop(port, pairs, writer, deadline, results, seed):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while time.time() < deadline:
+        a, b = rng.choice(pairs)
+        if writer:
+            op, args = 'send', ('POST', '/messages', {"sender_id": a, "recipient_id": b, "content": "hi"})
+        else:
+            op, args = rng.choice((
+                ('messages', ('GET', f"/messages?user1_id={a}&user2_id={b}")),
+                ('messages', ('GET', f"/messages?user1_id={a}&user2_id={b}&limit=200")),
+                ('timeline', ('GET', f"/conversations/{a}/{b}/timeline")),
+                ('users', ('GET', f"/users?prefix=user{a % 10}")),
+            ))
+        start = time.perf_counter()
+        try:
+            ok = call(connection, *args) < 500
+        except (OSError, http.client.HTTPException):
+            ok = False
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)  # Reconnect
+        results.append((op, (time.perf_counter() - start) * 1000, ok))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replicas', default='0,1,2,4', help="comma separated replica counts")
+    parser.add_argument('--workers', type=int, default=4, help="serve.py worker processes")
+    parser.add_argument('--threads', type=int, default=8, help="threads per worker process")
+    parser.add_argument('--read-pool', type=int, default=2, help="pool size of each read engine per worker")
+    parser.add_argument('--read-only', action='store_true', help="0 replicas: read through read-only connections")
+    parser.add_argument('--clients', type=int, default=32, help="concurrent reading clients")
+    parser.add_argument('--writers', type=int, default=4, help="concurrent writing clients")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=200, help="seeded messages per conversation")
+    parser.add_argument('--duration', type=float, default=15, help="seconds per replica count")
+    parser.add_argument('--port', type=int, default=5056)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='chat-replicas-'), 'primary.db')
+    pairs = seed_primary(db_path, args.users, args.conversations, args.messages)
+    print(f"seeded {len(pairs) * args.messages} messages in {len(pairs)} conversations")
+
+    for count in [int(c) for c in args.replicas.split(',')]:
+        server = start_server(
+            args.port, args.workers, args.threads, db_path,
+            DATABASE_REPLICA_URLS=','.join(make_replicas(db_path, count)),
+            READ_ONLY_CONNECTIONS=str(args.read_only).lower(),
+            READ_DB_POOL_SIZE=str(args.read_pool),
+            READ_DB_MAX_OVERFLOW='0',  # Fixed pools, so added replicas add read connections
+            METRICS_ENABLED='false',
+        )
+        try:
+            results = []
+            deadline = time.time() + args.duration
+            clients = [
+                threading.Thread(target=client_loop, args=(args.port, pairs, seed < args.writers, deadline, results, seed))
+                for seed in range(args.clients + args.writers)
+            ]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+        reads = [ms for op, ms, ok in results if op != 'send' and ok]
+        writes = [ms for op, ms, ok in results if op == 'send' and ok]
+        errors = sum(1 for _, _, ok in results if not ok)
+        print(f"replicas={count:<3} reads {len(reads) / args.duration:8.1f}/s  p50={percentile(reads, 50):7.2f}ms  "
+              f"p99={percentile(reads, 99):8.2f}ms   writes {len(writes) / args.duration:7.1f}/s  "
+              f"p99={percentile(writes, 99):8.2f}ms  errors={errors}")
+
+if __name__ == '__main__':
+    main()
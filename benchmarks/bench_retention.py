@@ -0,0 +1,93 @@
+# bench_retention.py - primary size, backup time and history latency before and after archiving
+#
+#   python -m benchmarks.bench_retention --messages 1000000 --months 24 --retention-days 90
+#
+# Messages are spread evenly over the given months. Reads of the newest page stay in the primary;
+# deep pages (older than the horizon) fall through to the monthly archive files after the run.
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from benchmarks.common import load_app, measure, report
+
+# Function to time a full copy of a SQLite file with the backup API, as a nightly backup would
+def backup_seconds(db_path):
+    target = sqlite3.connect(os.path.join(tempfile.mkdtemp(prefix='chat-backup-'), 'backup.db'))
+    source = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    source.backup(target)
+    elapsed = time.perf_counter() - start
+    source.close()
+    target.close()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--months', type=int, default=24, help="months of history to spread the messages over")
+    parser.add_argument('--retention-days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='chat-retention-')
+    db_path = os.path.join(directory, 'bench.db')
+    chat_app = load_app(
+        db_path, ARCHIVE_DIR=os.path.join(directory, 'archive'), RETENTION_DAYS=args.retention_days,
+        COMPACT_MAX_PAGES=10**9, METRICS_ENABLED=False,
+    )
+    app, db = chat_app.app, chat_app.db
+    from database import checkpoint
+    from ingest import insert_messages
+    from models import User
+    from pagination import encode_cursor
+    from retention import file_bytes
+
+    rng = random.Random(1)
+    with app.app_context():
+        db.session.add_all(User(username=f"user{i}") for i in range(1, args.users + 1))
+        db.session.commit()
+        pairs = [tuple(rng.sample(range(1, args.users + 1), 2)) for _ in range(args.conversations)]
+        now = datetime.utcnow()
+        span = timedelta(days=30 * args.months)
+        for offset in range(0, args.messages, 50000):
+            count = min(50000, args.messages - offset)
+            insert_messages([
+                {"sender_id": a, "recipient_id": b, "content": f"message {offset + i} " + "lorem ipsum " * (i % 6),
+                 "timestamp": now - span + span * (offset + i) / args.messages}
+                for i, (a, b) in ((i, rng.choice(pairs)) for i in range(count))
+            ], 5000)
+        checkpoint(db.engine)
+
+    test_client = app.test_client()
+    deep = encode_cursor(now - span / 2, 0)  # Half way back through the history, well past the horizon
+
+    def run_reads(label):
+        print(f"\n{label}: primary {file_bytes(db_path) / 2**20:.1f} MiB, backup {backup_seconds(db_path):.2f}s")
+        samples = [rng.choice(pairs) for _ in range(args.repeat)]
+        cases = [
+            ("newest page", lambda a, b: f"/messages?user1_id={a}&user2_id={b}"),
+            ("newest timeline page", lambda a, b: f"/conversations/{a}/{b}/timeline"),
+            ("deep page (past the horizon)", lambda a, b: f"/messages?user1_id={a}&user2_id={b}&before={deep}"),
+        ]
+        for name, url in cases:
+            pages = iter(samples)
+            report(f"  {name}", measure(lambda: test_client.get(url(*next(pages))), args.repeat))
+
+    run_reads("before archiving")
+    with app.app_context():
+        start = time.perf_counter()
+        result = chat_app.run_retention(chat_app.archive, app.config)
+        elapsed = time.perf_counter() - start
+        print(f"\n{chat_app.describe_report(result)} in {elapsed:.1f}s")
+        archived = sum(result['archive_files'].values())
+        print(f"{len(result['archive_files'])} archive files, {archived / 2**20:.1f} MiB")
+    run_reads("after archiving")
+
+if __name__ == '__main__':
+    main()
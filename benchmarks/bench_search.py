@@ -0,0 +1,89 @@
+# bench_search.py - GET /search (FTS5) latency vs. a naive LIKE scan over message content
+#
+#   python -m benchmarks.bench_search --rows 1000000 --users 1000
+
+import argparse
+import itertools
+import random
+import time
+from benchmarks.common import load_app, measure, report
+
+# Function to build a vocabulary with cumulative Zipf-like weights, so a few words are as common as in real chat text
+def vocabulary(size):
+    rng = random.Random(0)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = sorted({''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size * 2)})[:size]
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    return words, weights
+
+# Function to fill the message table with random sentences, returning the vocabulary used
+def seed(chat_app, rows, users, batch=10000):
+    from models import conversation_key
+    words, weights = vocabulary(20000)
+    rng = random.Random(1)
+    with chat_app.app.app_context():
+        connection = chat_app.db.engine.raw_connection()
+        cursor = connection.cursor()
+        cursor.executemany("INSERT INTO user (username) VALUES (?)", [(f"user{i}",) for i in range(1, users + 1)])
+        for offset in range(0, rows, batch):
+            values = []
+            for _ in range(min(batch, rows - offset)):
+                sender, recipient = rng.sample(range(1, users + 1), 2)
+                content = ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(4, 20)))
+                values.append((content, sender, recipient, conversation_key(sender, recipient)))
+            cursor.executemany(
+                "INSERT INTO message (content, timestamp, sender_id, recipient_id, conversation_key) "
+                "VALUES (?, datetime('now'), ?, ?, ?)", values
+            )  # The insert trigger indexes every row as it goes in
+            connection.commit()
+        connection.close()
+    return words
+
+# Function to run the query behind GET /search, without the HTTP round-trip so it compares evenly with LIKE
+def fts_search(chat_app, text, limit, user_id=None, other_user_id=None):
+    with chat_app.app.app_context():
+        return chat_app.search_page(
+            text, limit, user_id=user_id, other_user_id=other_user_id,
+            max_candidates=chat_app.app.config['SEARCH_MAX_CANDIDATES']
+        )
+
+# Function to run the LIKE equivalent of a search: newest matching rows first, optionally scoped to a user
+def like_search(chat_app, term, limit, user_id=None):
+    from models import Message
+    with chat_app.app.app_context():
+        query = Message.query.filter(Message.content.like(f"%{term}%"))
+        if user_id is not None:
+            query = query.filter((Message.sender_id == user_id) | (Message.recipient_id == user_id))
+        return query.order_by(Message.id.desc()).limit(limit).all()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=20, help="results per page")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-candidates', type=int, default=10000, help="SEARCH_MAX_CANDIDATES (0 ranks every match)")
+    args = parser.parse_args()
+
+    chat_app = load_app(SEARCH_MAX_CANDIDATES=args.max_candidates or None)
+    start = time.perf_counter()
+    words = seed(chat_app, args.rows, args.users)
+    print(f"seeded {args.rows} messages with triggers in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    with chat_app.app.app_context():
+        chat_app.rebuild_search_index(chat_app.db.engine)
+    print(f"rebuilt the search index in {time.perf_counter() - start:.1f}s")
+
+    terms = {'common': words[0], 'mid': words[200], 'rare': words[-1], 'two words': f"{words[0]} {words[200]}"}
+    for label, term in terms.items():
+        report(f"fts  {label}", measure(lambda: fts_search(chat_app, term, args.limit), args.repeat))
+        report(f"fts  {label}, one user", measure(lambda: fts_search(chat_app, term, args.limit, 1), args.repeat))
+        report(f"fts  {label}, one conversation",
+               measure(lambda: fts_search(chat_app, term, args.limit, 1, 2), args.repeat))
+        if ' ' in term:
+            continue  # LIKE has no notion of separate words
+        report(f"like {label}", measure(lambda: like_search(chat_app, term, args.limit), args.repeat))
+        report(f"like {label}, one user", measure(lambda: like_search(chat_app, term, args.limit, 1), args.repeat))
+
+if __name__ == '__main__':
+    main()
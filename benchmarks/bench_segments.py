@@ -0,0 +1,54 @@
+# bench_segments.py - end-to-end transcription latency of long clips, monolithic vs. segmented
+#
+#   python -m benchmarks.bench_segments --seconds 30,60,120,300 --delay 0.3 --delay-per-second 0.05
+#
+# The fake transcriber sleeps delay + delay_per_second * clip length per call, so a segmented clip
+# finishes in roughly the time of its longest segment once there are enough workers.
+
+import argparse
+import io
+import time
+from benchmarks.common import load_app
+from benchmarks.bench_preprocess import synthetic_clip
+
+# Function to upload a clip and wait for its transcription, returning the latency in seconds
+def transcribe(test_client, clip, sender, recipient):
+    start = time.perf_counter()
+    response = test_client.post('/voice_messages', data={
+        "sender_id": sender, "recipient_id": recipient, "file": (io.BytesIO(clip), 'clip.wav')
+    })
+    location = response.headers['Location']
+    while test_client.get(location).json['status'] not in ('completed', 'failed'):
+        time.sleep(0.02)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', default='30,60,120,300', help="comma separated clip lengths")
+    parser.add_argument('--delay', type=float, default=0.3, help="fake transcriber seconds per call")
+    parser.add_argument('--delay-per-second', type=float, default=0.05, help="fake transcriber seconds per audio second")
+    parser.add_argument('--workers', type=int, default=8, help="transcription worker pool size")
+    parser.add_argument('--segment-seconds', type=int, default=30)
+    args = parser.parse_args()
+
+    chat_app = load_app(
+        FAKE_TRANSCRIBER_DELAY=args.delay, FAKE_TRANSCRIBER_DELAY_PER_SECOND=args.delay_per_second,
+        TRANSCRIPTION_WORKERS=args.workers, SEGMENT_SECONDS=args.segment_seconds,
+        TRANSCRIPTION_CACHE_ENABLED=False,  # Every upload must reach the transcriber
+    )
+    test_client = chat_app.app.test_client()
+    sender = test_client.post('/users', json={"username": "sender"}).json['id']
+    recipient = test_client.post('/users', json={"username": "recipient"}).json['id']
+    queue = chat_app.transcription_queue
+
+    print(f"{'clip':>6} {'monolithic':>12} {'segmented':>12} {'speedup':>8}")
+    for seconds in [float(s) for s in args.seconds.split(',')]:
+        clip = synthetic_clip(seconds, 16000, 1)
+        queue.segment_seconds = None  # Whole clip in one call
+        monolithic = transcribe(test_client, clip, sender, recipient)
+        queue.segment_seconds = args.segment_seconds
+        segmented = transcribe(test_client, clip, sender, recipient)
+        print(f"{seconds:>5.0f}s {monolithic:>11.2f}s {segmented:>11.2f}s {monolithic / segmented:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# bench_serialization.py - CPU time and bytes on the wire for one long conversation, by serialization path
+#
+#   python -m benchmarks.bench_serialization --messages 50000
+
+import argparse
+import time
+from benchmarks.common import load_app, percentile
+
+# Function to run fn repeatedly, returning the median CPU time in milliseconds and the last result
+def cpu_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        timings.append((time.process_time() - start) * 1000)
+    return percentile(timings, 50), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    chat_app = load_app(MAX_PAGE_SIZE=args.messages)  # Whole conversation in one page
+    app = chat_app.app
+    test_client = app.test_client()
+    test_client.post('/users', json={"username": "alice"})
+    test_client.post('/users', json={"username": "bob"})
+    for offset in range(0, args.messages, 5000):
+        test_client.post('/messages/batch', json={"messages": [
+            {"sender_id": 1 + i % 2, "recipient_id": 2 - i % 2, "content": f"message {i} " + "lorem ipsum " * (i % 8)}
+            for i in range(offset, min(offset + 5000, args.messages))
+        ]})
+
+    # The previous path: hydrate every Message and encode with Flask's stdlib provider and HTTP dates
+    import serialization
+    from flask.json.provider import DefaultJSONProvider
+    from models import Message, conversation_key
+    legacy_provider = DefaultJSONProvider(app)
+
+    def legacy():
+        with app.app_context():
+            messages = Message.query.filter(Message.conversation_key == conversation_key(1, 2)).order_by(
+                Message.timestamp, Message.id).all()
+            return legacy_provider.dumps([chat_app.message_to_dict(message) for message in messages]).encode()
+
+    url = f"/messages?user1_id=1&user2_id=2&limit={args.messages}"
+    gzip, brotli = {'Accept-Encoding': 'gzip'}, {'Accept-Encoding': 'br'}
+    cases = [
+        ("ORM + stdlib json (previous)", legacy),
+        ("columns + fast json", lambda: test_client.get(url).data),
+        ("columns + fast json, ?fields=id,content", lambda: test_client.get(f"{url}&fields=id,content").data),
+        ("columns + fast json, gzip", lambda: test_client.get(url, headers=gzip).data),
+        ("columns + fast json, brotli", lambda: test_client.get(url, headers=brotli).data),
+        ("NDJSON stream", lambda: test_client.get(f"{url}&format=ndjson").data),
+        ("NDJSON stream, gzip", lambda: test_client.get(f"{url}&format=ndjson", headers=gzip).data),
+    ]
+    print(f"json backend: {'orjson' if serialization.orjson else 'stdlib'}")
+    print(f"{'path':<44} {'cpu ms':>9} {'bytes':>12}")
+    for label, fn in cases:
+        if 'brotli' in label and serialization.brotli is None:
+            print(f"{label:<44} skipped, brotli is not installed")
+            continue
+        cpu, body = cpu_time(fn, args.repeat)  # Bodies stay compressed: the test client doesn't decode them
+        print(f"{label:<44} {cpu:>9.1f} {len(body):>12}")
+
+if __name__ == '__main__':
+    main()
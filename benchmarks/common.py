@@ -0,0 +1,48 @@
+# common.py - helpers shared by the benchmark scripts
+
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+
+# Function to import the Flask app against a throwaway SQLite file with the fake transcriber.
+# The message archive goes next to the database file, never into the app's instance folder.
+def load_app(db_path=None, **overrides):
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)  # The app modules import each other by bare name
+    os.environ.setdefault('TRANSCRIBER', 'fake')  # Never call OpenAI from a benchmark
+    import config
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='chat-bench-'), 'bench.db')
+    config.Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+    config.Config.ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive')
+    for key, value in overrides.items():
+        setattr(config.Config, key, value)
+    import app as chat_app
+    from migrations import migrate
+    with chat_app.app.app_context():
+        migrate(chat_app.db.engine)  # Create the schema in the fresh file
+    return chat_app
+
+# Function to time repeated calls of fn, returning the latencies in milliseconds
+def measure(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+# Function to compute the nearest-rank percentile of a list of numbers
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+# Function to print one result line with p50/p99 latencies
+def report(label, latencies):
+    print(f"{label:<40} p50={percentile(latencies, 50):9.2f}ms  p99={percentile(latencies, 99):9.2f}ms")
@@ -0,0 +1,328 @@
+# suite.py - end-to-end load test: seeded database, concurrent virtual clients, per-endpoint latencies
+#
+#   python -m benchmarks.suite --workloads send,history,voice,mixed --clients 16 --output results.json
+#   python -m benchmarks.suite --save-baseline benchmarks/baseline.json   # on the reference commit
+#   python -m benchmarks.suite --baseline benchmarks/baseline.json        # fails on a regression
+#
+# A run also fails when any request errors or a voice message is still pending once the clients are done.
+#
+# The app runs in this process behind werkzeug's threaded server, against a temporary SQLite file
+# and the fake transcriber. Every virtual client drives the API through client.ChatClient with a
+# fixed request count and its own random seed, so runs are reproducible. Each workload starts
+# from a freshly seeded database.
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+import requests
+from werkzeug.serving import make_server
+from benchmarks.common import load_app, percentile
+from benchmarks.bench_preprocess import synthetic_clip
+
+# Relative weights of the operations each workload issues
+WORKLOADS = {
+    'send': {'send': 8, 'history': 1, 'lookup': 1},
+    'history': {'history': 6, 'timeline': 3, 'lookup': 1},
+    'voice': {'voice': 6, 'poll': 3, 'history': 1},
+    'mixed': {'send': 3, 'history': 3, 'timeline': 1, 'voice': 1, 'poll': 1, 'lookup': 1, 'search': 1},
+}
+
+WORDS = ('lunch', 'meeting', 'tomorrow', 'call', 'thanks', 'later', 'project', 'weekend', 'coffee', 'done')
+
+# Shared state of one run: who exists, who talks to whom, and the voice messages uploaded so far
+class World:
+    def __init__(self, user_ids, conversations, clip):
+        self.user_ids = user_ids  # username -> user ID
+        self.conversations = conversations  # (user ID, user ID) pairs that already have history
+        self.clip = clip  # WAV template for uploads
+        self.voice_ids = []
+        self.lock = threading.Lock()
+
+# Function to build a unique voice clip from the template, so uploads miss the transcription cache
+def unique_clip(world, rng):
+    clip = bytearray(world.clip)
+    clip[-64:] = rng.randbytes(64)  # Noise in the last samples changes the audio hash
+    return bytes(clip)
+
+# Operations: each takes (client, world, rng) and issues one or two API calls
+def op_send(client, world, rng):
+    a, b = rng.choice(world.conversations)
+    client.send_message(a, b, ' '.join(rng.choices(WORDS, k=rng.randint(3, 12))))
+
+def op_history(client, world, rng):
+    a, b = rng.choice(world.conversations)
+    _, cursor = client.messages(a, b)
+    if cursor and rng.random() < 0.3:
+        client.messages(a, b, before=cursor)  # Some readers scroll back a page
+
+def op_timeline(client, world, rng):
+    a, b = rng.choice(world.conversations)
+    client.timeline(a, b)
+
+def op_voice(client, world, rng):
+    a, b = rng.choice(world.conversations)
+    voice_message = client.send_voice_message(a, b, io.BytesIO(unique_clip(world, rng)))
+    with world.lock:
+        world.voice_ids.append(voice_message['id'])
+
+def op_poll(client, world, rng):
+    with world.lock:
+        voice_id = rng.choice(world.voice_ids) if world.voice_ids else None
+    if voice_id is None:
+        return op_history(client, world, rng)  # Nothing uploaded yet
+    client.get_voice_message(voice_id)
+
+def op_lookup(client, world, rng):
+    client.get_user_id(rng.choice(list(world.user_ids)))
+
+def op_search(client, world, rng):
+    client.search(rng.choice(WORDS), user1_id=rng.choice(world.conversations)[0])
+
+OPERATIONS = {
+    'send': op_send, 'history': op_history, 'timeline': op_timeline, 'voice': op_voice,
+    'poll': op_poll, 'lookup': op_lookup, 'search': op_search,
+}
+
+# Function to get the size of the SQLite database including its WAL
+def database_bytes(db_path):
+    return sum(os.path.getsize(path) for path in (db_path, f"{db_path}-wal") if os.path.exists(path))
+
+# Function to wait until no voice message is left pending or processing, returning how many still are
+# after timeout seconds
+def drain_transcriptions(chat_app, timeout=30):
+    from models import VoiceMessage
+    deadline = time.monotonic() + timeout
+    with chat_app.app.app_context():
+        while True:
+            unfinished = VoiceMessage.query.filter(VoiceMessage.status.in_(('pending', 'processing'))).count()
+            chat_app.db.session.remove()
+            if not unfinished or time.monotonic() > deadline:
+                return unfinished
+            time.sleep(0.05)
+
+# Function to empty every table and search index, then seed users and conversation history
+def seed(chat_app, users, conversations, messages_per_conversation, rng):
+    from database import checkpoint
+    from ingest import insert_messages
+    from models import User
+    from migrations import migrate
+    from search import SEARCH_SOURCES
+    db = chat_app.db
+    with chat_app.app.app_context():
+        db.drop_all()
+        with db.engine.begin() as connection:
+            for _, _, _, fts in SEARCH_SOURCES:
+                connection.exec_driver_sql(f"DROP TABLE IF EXISTS {fts}")
+            connection.exec_driver_sql("DROP TABLE IF EXISTS schema_version")
+        migrate(db.engine)
+        chat_app.user_cache.clear()
+        if chat_app.transcript_cache:
+            chat_app.transcript_cache.memory.clear()
+
+        db.session.add_all(User(username=f"user{i}") for i in range(1, users + 1))
+        db.session.commit()
+        user_ids = {user.username: user.id for user in User.query.all()}
+        ids = list(user_ids.values())
+        pairs = sorted({tuple(rng.sample(ids, 2)) for _ in range(conversations)})
+        rows = [
+            {"sender_id": a if i % 2 else b, "recipient_id": b if i % 2 else a,
+             "content": ' '.join(rng.choices(WORDS, k=rng.randint(3, 12)))}
+            for a, b in pairs for i in range(messages_per_conversation)
+        ]
+        insert_messages(rows, chat_app.app.config['BATCH_CHUNK_SIZE'])
+        checkpoint(db.engine)  # Fold the seed into the main file
+    return World(user_ids, pairs, synthetic_clip(2, 16000, 1, silence=0.2))
+
+# Function to run one virtual client, recording (operation, milliseconds, ok) for every operation
+def virtual_client(base_url, world, weights, requests_per_client, seed_value, start, results):
+    import client as chat_client
+    rng = random.Random(seed_value)
+    names, cumulative = list(weights), []
+    for name in names:
+        cumulative.append((cumulative[-1] if cumulative else 0) + weights[name])
+    own = []
+    # No retries, so errors are counted; no username cache, so lookups reach the server
+    with chat_client.ChatClient(base_url, retries=0, pool_size=1, cache_ttl=0) as client:
+        start.wait()
+        for _ in range(requests_per_client):
+            name = rng.choices(names, cum_weights=cumulative)[0]
+            began = time.perf_counter()
+            try:
+                OPERATIONS[name](client, world, rng)
+                ok = True
+            except requests.RequestException:
+                ok = False
+            own.append((name, (time.perf_counter() - began) * 1000, ok))
+    results.extend(own)
+
+# Function to summarize latencies of one set of operations
+def summarize(samples, seconds):
+    latencies = [ms for _, ms, _ in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, _, ok in samples if not ok),
+        "throughput": round(len(samples) / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+# Function to run one workload against a freshly seeded database and return its results
+def run_workload(chat_app, base_url, db_path, name, args):
+    rng = random.Random(args.seed)
+    world = seed(chat_app, args.users, args.conversations, args.messages, rng)
+    seeded_bytes = database_bytes(db_path)
+
+    results = []
+    start = threading.Barrier(args.clients + 1)  # Release every client at once
+    threads = [
+        threading.Thread(target=virtual_client, args=(
+            base_url, world, WORKLOADS[name], args.requests, args.seed * 100003 + index, start, results
+        ))
+        for index in range(args.clients)
+    ]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - began
+
+    unfinished = drain_transcriptions(chat_app)  # Count the stored transcriptions in the growth too
+    final_bytes = database_bytes(db_path)
+    return {
+        **summarize(results, seconds),
+        "seconds": round(seconds, 3),
+        "unfinished_transcriptions": unfinished,
+        "db_bytes": {"seeded": seeded_bytes, "final": final_bytes, "growth": final_bytes - seeded_bytes},
+        "endpoints": {
+            op: summarize([sample for sample in results if sample[0] == op], seconds)
+            for op in sorted({sample[0] for sample in results})
+        },
+    }
+
+# Function to print one workload's results as a table
+def print_results(name, result):
+    growth = result['db_bytes']['growth']
+    print(f"\n{name}: {result['throughput']:.1f} req/s over {result['seconds']:.1f}s, "
+          f"{result['errors']} errors, database grew {growth / 1024:.0f} KiB")
+    if result['unfinished_transcriptions']:
+        print(f"    {result['unfinished_transcriptions']} voice messages were still pending after the run")
+    print(f"    {'operation':<10} {'n':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for op, stats in result['endpoints'].items():
+        print(f"    {op:<10} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput']:>9.1f} "
+              f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+
+# Function to compare results with a baseline, returning the list of regressions found.
+# An operation regresses when its p95 latency rose, or its throughput fell, by more than tolerance.
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\nComparison with baseline from {baseline['meta'].get('commit') or 'unknown commit'}:")
+    settings, previous_settings = results['meta']['settings'], baseline['meta'].get('settings', {})
+    changed = [key for key in settings if key != 'workloads' and settings[key] != previous_settings.get(key)]
+    if changed:
+        print(f"    warning: the baseline was recorded with different {', '.join(changed)}")
+    for name, result in results['workloads'].items():
+        previous = baseline['workloads'].get(name)
+        if previous is None:
+            print(f"    {name}: not in the baseline")
+            continue
+        for op, stats in result['endpoints'].items():
+            before = previous['endpoints'].get(op)
+            if before is None:
+                continue
+            p95_change = stats['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+            throughput_change = stats['throughput'] / before['throughput'] - 1 if before['throughput'] else 0.0
+            regressed = p95_change > tolerance or throughput_change < -tolerance
+            print(f"    {name + '/' + op:<20} p95 {before['p95_ms']:8.2f} -> {stats['p95_ms']:8.2f}ms ({p95_change:+.0%})  "
+                  f"throughput {throughput_change:+.0%}{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append(f"{name}/{op}")
+    return regressions
+
+# Function to list the workloads that failed requests or left voice messages pending. Such a run
+# is broken rather than slow, so its numbers are neither compared nor saved as a baseline.
+def failures(results):
+    found = []
+    for name, result in results['workloads'].items():
+        if result['errors']:
+            found.append(f"{name}: {result['errors']} failed requests")
+        if result['unfinished_transcriptions']:
+            found.append(f"{name}: {result['unfinished_transcriptions']} voice messages left pending")
+    return found
+
+# Function to describe the environment a run happened in, so results can be told apart
+def run_metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'baseline', 'save_baseline')},
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workloads', default='send,history,voice,mixed', help=f"comma separated: {', '.join(WORKLOADS)}")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent virtual clients")
+    parser.add_argument('--requests', type=int, default=200, help="operations per virtual client")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=100, help="seeded messages per conversation")
+    parser.add_argument('--transcriber-delay', type=float, default=0.05, help="fake transcriber seconds per call")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against results saved with --save-baseline")
+    parser.add_argument('--save-baseline', help="write the results to this file as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative change before flagging")
+    args = parser.parse_args()
+
+    names = args.workloads.split(',')
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(unknown)}")
+
+    chat_app = load_app(FAKE_TRANSCRIBER_DELAY=args.transcriber_delay)
+    db_path = chat_app.app.config['SQLALCHEMY_DATABASE_URI'].removeprefix('sqlite:///')
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No access log line per request
+    server = make_server('127.0.0.1', 0, chat_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    results = {"meta": run_metadata(args), "workloads": {}}
+    try:
+        for name in names:
+            results['workloads'][name] = run_workload(chat_app, base_url, db_path, name, args)
+            print_results(name, results['workloads'][name])
+    finally:
+        server.shutdown()
+
+    broken = failures(results)
+    for path in (args.output, None if broken else args.save_baseline):
+        if path:
+            with open(path, 'w') as output:
+                json.dump(results, output, indent=2)
+    if broken:
+        raise SystemExit(f"Load test failed: {'; '.join(broken)}")
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            raise SystemExit(f"Performance regressions: {', '.join(regressions)}")
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,15 @@
 import requests
+import asyncio
 import json
 import os
 import configparser
 from prettytable import PrettyTable
 import time
-import pyaudio
 import wave
 import tempfile
+from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Function to load configuration settings from a config file
 def load_config(config_file='config.ini'):
@@ -18,7 +21,11 @@ def load_config(config_file='config.ini'):
         'Username': 'DefaultUser',
         'ServerIP': '127.0.0.1',
         'ServerPort': '5000',
-        'Debug': 'false'
+        'Debug': 'false',
+        'CacheTTL': '300',
+        'SampleRate': '44100',
+        'Timeout': '10',
+        'Retries': '3'
     }
     
     # Update defaults with values from the config file if they exist
@@ -29,6 +36,10 @@ def load_config(config_file='config.ini'):
     
     # Convert 'Debug' value to a boolean
     defaults['Debug'] = defaults['Debug'].lower() == 'true'
+    defaults['CacheTTL'] = int(defaults['CacheTTL'])  # Seconds to remember username lookups
+    defaults['SampleRate'] = int(defaults['SampleRate'])  # Recording sample rate in Hz
+    defaults['Timeout'] = float(defaults['Timeout'])  # Seconds to wait for the server to answer
+    defaults['Retries'] = int(defaults['Retries'])  # Attempts after a failed connection or a 502/503/504
     
     return defaults
 
@@ -37,6 +48,307 @@ CONFIG = load_config()
 API_URL = f"http://{CONFIG['ServerIP']}:{CONFIG['ServerPort']}"  # Base API URL
 USERNAME = CONFIG['Username']  # User's username
 DEBUG = CONFIG['Debug']  # Debug mode flag
+CACHE_TTL = CONFIG['CacheTTL']  # Lifetime of cached username lookups
+SAMPLE_RATE = CONFIG['SampleRate']  # 16000 matches what the server transcribes at and keeps uploads small
+
+RETRY_STATUSES = (502, 503, 504)  # Gateway and overload errors worth retrying
+CONNECT_TIMEOUT = 3.05  # Seconds to wait for a TCP connection
+
+# Scriptable client for the chat API. One pooled keep-alive session is shared by every call,
+# requests time out, and failed connections and idempotent requests answered 502/503/504 are
+# retried with exponential backoff. Methods raise requests exceptions instead of printing them.
+class ChatClient:
+    def __init__(self, api_url, timeout=10, retries=3, backoff=0.3, pool_size=10, cache_ttl=300):
+        self.api_url = api_url
+        self.timeout = (CONNECT_TIMEOUT, timeout)  # (connect, read) timeouts
+        self.cache_ttl = cache_ttl  # Seconds to remember username lookups
+        self._user_ids = {}  # username -> (user ID, expiry time)
+        self.session = requests.Session()
+        # POSTs are only retried when the connection failed, so a message is never sent twice
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def _request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        response = self.session.request(method, f"{self.api_url}{path}", **kwargs)
+        response.raise_for_status()  # Raise an error for bad status codes
+        return response
+
+    # Remember a username's ID for cache_ttl seconds
+    def cache_user_id(self, username, user_id):
+        self._user_ids[username] = (user_id, time.time() + self.cache_ttl)
+
+    # Get the user ID by username, or None if there is no such user
+    def get_user_id(self, username):
+        cached = self._user_ids.get(username)
+        if cached and cached[1] > time.time():
+            return cached[0]  # Still fresh, skip the round-trip
+        try:
+            user_id = self._request('GET', f"/users/by-username/{quote(username, safe='')}").json()['id']
+        except requests.HTTPError as e:
+            if e.response.status_code == 404:
+                return None  # No user with that name
+            raise
+        self.cache_user_id(username, user_id)
+        return user_id
+
+    # Create a new user, returning its ID
+    def create_user(self, username):
+        user_id = self._request('POST', "/users", json={"username": username}).json()['id']
+        self.cache_user_id(username, user_id)
+        return user_id
+
+    # Get a user's ID, creating the user first if needed
+    def ensure_user(self, username):
+        user_id = self.get_user_id(username)
+        if user_id:
+            return user_id
+        try:
+            return self.create_user(username)
+        except requests.HTTPError as e:
+            if e.response.status_code != 409:
+                raise
+            return self.get_user_id(username)  # Someone else created it in the meantime
+
+    # Send a text message, returning the stored message
+    def send_message(self, sender_id, recipient_id, content):
+        data = {"sender_id": sender_id, "recipient_id": recipient_id, "content": content}
+        return self._request('POST', "/messages", json=data).json()
+
+    # Send many text messages in one request, returning one result per message
+    def send_messages(self, messages):
+        return self._request('POST', "/messages/batch", json={"messages": messages}).json()
+
+    # Upload a voice message from a path or file object, returning the stored voice message
+    def send_voice_message(self, sender_id, recipient_id, audio, filename='voice_message.wav'):
+        data = {"sender_id": sender_id, "recipient_id": recipient_id}
+        if isinstance(audio, (str, os.PathLike)):
+            with open(audio, 'rb') as file:
+                return self.send_voice_message(sender_id, recipient_id, file, filename)
+        files = {'file': (filename, audio, 'audio/wav')}
+        return self._request('POST', "/voice_messages", data=data, files=files).json()
+
+    def get_voice_message(self, voice_message_id):
+        return self._request('GET', f"/voice_messages/{voice_message_id}").json()
+
+    # Poll the server until a voice message has been transcribed
+    def wait_for_transcription(self, voice_message_id, timeout=60, interval=1):
+        deadline = time.time() + timeout
+        while True:
+            voice_message = self.get_voice_message(voice_message_id)  # Check the transcription status
+            if voice_message['status'] not in ('pending', 'processing') or time.time() >= deadline:
+                return voice_message
+            time.sleep(interval)  # Wait before polling again
+
+    # Get one page of text messages between two users, returning (messages, cursor for older messages)
+    def messages(self, user_id, other_id, before=None, limit=None):
+        params = {key: value for key, value in (
+            ("user1_id", user_id), ("user2_id", other_id), ("before", before), ("limit", limit)
+        ) if value}
+        response = self._request('GET', "/messages", params=params)
+        return response.json(), response.headers.get('X-Next-Cursor')
+
+    # Get one page of the timeline between two users, returning (items, cursor for older items)
+    def timeline(self, user_id, other_id, before=None, limit=None):
+        params = {key: value for key, value in (("before", before), ("limit", limit)) if value}
+        response = self._request('GET', f"/conversations/{user_id}/{other_id}/timeline", params=params)
+        return response.json(), response.headers.get('X-Next-Cursor')
+
+    # Get one page of users, returning (users, cursor for the next page)
+    def list_users(self, prefix=None, after=None, limit=None):
+        params = {key: value for key, value in (("prefix", prefix), ("after", after), ("limit", limit)) if value}
+        response = self._request('GET', "/users", params=params)
+        users = response.json()
+        for user in users:
+            self.cache_user_id(user['username'], user['id'])
+        return users, response.headers.get('X-Next-Cursor')
+
+    # Search messages and transcriptions, returning (results, cursor for the next page)
+    def search(self, query, user1_id=None, user2_id=None, after=None, limit=None):
+        params = {key: value for key, value in (
+            ("q", query), ("user1_id", user1_id), ("user2_id", user2_id), ("after", after), ("limit", limit)
+        ) if value}
+        response = self._request('GET', "/search", params=params)
+        return response.json(), response.headers.get('X-Next-Cursor')
+
+    # Get one page of a user's conversations, most recent first, returning (conversations, cursor for the next page)
+    def conversations(self, user_id, after=None, limit=None):
+        params = {key: value for key, value in (("after", after), ("limit", limit)) if value}
+        response = self._request('GET', f"/users/{user_id}/conversations", params=params)
+        return response.json(), response.headers.get('X-Next-Cursor')
+
+    # Mark a partner's messages as read, up to an ISO 8601 timestamp if given, returning the conversation
+    def mark_read(self, user_id, partner_id, up_to=None):
+        data = {"up_to": up_to} if up_to else {}
+        return self._request('POST', f"/users/{user_id}/conversations/{partner_id}/read", json=data).json()
+
+    # Yield (event ID, event) pairs from a user's event stream until the connection drops
+    def events(self, user_id, last_event_id=None, timeout=60):
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        with self._request('GET', f"/users/{user_id}/events", headers=headers, stream=True,
+                           timeout=(CONNECT_TIMEOUT, timeout)) as response:
+            event_id, data = last_event_id, None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('id: '):
+                    event_id = line[4:]
+                elif line.startswith('data: '):
+                    data = json.loads(line[6:])
+                elif line == '' and data:  # A blank line ends the event
+                    yield event_id, data
+                    data = None
+
+# asyncio version of ChatClient for issuing independent requests concurrently, e.g. to simulate
+# many users from one process. Needs the aiohttp package.
+class AsyncChatClient:
+    def __init__(self, api_url, timeout=10, retries=3, backoff=0.3, pool_size=100, cache_ttl=300):
+        import aiohttp  # Only needed for the async mode
+        self._aiohttp = aiohttp
+        self.api_url = api_url
+        self.retries = retries
+        self.backoff = backoff
+        self.cache_ttl = cache_ttl
+        self._user_ids = {}  # username -> (user ID, expiry time)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),  # Keep-alive connections shared by every task
+            timeout=aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.session.close()
+
+    # Send a request and return (status, decoded JSON body, headers). Connection failures and
+    # 502/503/504 answers to GETs are retried with exponential backoff, like ChatClient.
+    async def _request(self, method, path, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                async with self.session.request(method, f"{self.api_url}{path}", **kwargs) as response:
+                    if response.status in RETRY_STATUSES and method == 'GET' and attempt < self.retries:
+                        raise self._aiohttp.ClientConnectionError(f"HTTP {response.status}")
+                    response.raise_for_status()  # Raise an error for bad status codes
+                    return await response.json(), response.headers
+            except (self._aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                attempt += 1
+                if attempt > self.retries:
+                    raise  # Give up once every retry has been used
+                await asyncio.sleep(self.backoff * (2 ** (attempt - 1)))
+
+    def cache_user_id(self, username, user_id):
+        self._user_ids[username] = (user_id, time.time() + self.cache_ttl)
+
+    async def get_user_id(self, username):
+        cached = self._user_ids.get(username)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        try:
+            user, _ = await self._request('GET', f"/users/by-username/{quote(username, safe='')}")
+        except self._aiohttp.ClientResponseError as e:
+            if e.status == 404:
+                return None
+            raise
+        self.cache_user_id(username, user['id'])
+        return user['id']
+
+    async def create_user(self, username):
+        user, _ = await self._request('POST', "/users", json={"username": username})
+        self.cache_user_id(username, user['id'])
+        return user['id']
+
+    async def ensure_user(self, username):
+        user_id = await self.get_user_id(username)
+        if user_id:
+            return user_id
+        try:
+            return await self.create_user(username)
+        except self._aiohttp.ClientResponseError as e:
+            if e.status != 409:
+                raise
+            return await self.get_user_id(username)
+
+    async def send_message(self, sender_id, recipient_id, content):
+        data = {"sender_id": sender_id, "recipient_id": recipient_id, "content": content}
+        message, _ = await self._request('POST', "/messages", json=data)
+        return message
+
+    async def send_messages(self, messages):
+        results, _ = await self._request('POST', "/messages/batch", json={"messages": messages})
+        return results
+
+    async def send_voice_message(self, sender_id, recipient_id, audio_bytes, filename='voice_message.wav'):
+        form = self._aiohttp.FormData()
+        form.add_field('sender_id', str(sender_id))
+        form.add_field('recipient_id', str(recipient_id))
+        form.add_field('file', audio_bytes, filename=filename, content_type='audio/wav')
+        voice_message, _ = await self._request('POST', "/voice_messages", data=form)
+        return voice_message
+
+    async def get_voice_message(self, voice_message_id):
+        voice_message, _ = await self._request('GET', f"/voice_messages/{voice_message_id}")
+        return voice_message
+
+    async def wait_for_transcription(self, voice_message_id, timeout=60, interval=1):
+        deadline = time.time() + timeout
+        while True:
+            voice_message = await self.get_voice_message(voice_message_id)
+            if voice_message['status'] not in ('pending', 'processing') or time.time() >= deadline:
+                return voice_message
+            await asyncio.sleep(interval)
+
+    async def messages(self, user_id, other_id, before=None, limit=None):
+        params = {key: value for key, value in (
+            ("user1_id", user_id), ("user2_id", other_id), ("before", before), ("limit", limit)
+        ) if value}
+        messages, headers = await self._request('GET', "/messages", params=params)
+        return messages, headers.get('X-Next-Cursor')
+
+    async def timeline(self, user_id, other_id, before=None, limit=None):
+        params = {key: value for key, value in (("before", before), ("limit", limit)) if value}
+        items, headers = await self._request('GET', f"/conversations/{user_id}/{other_id}/timeline", params=params)
+        return items, headers.get('X-Next-Cursor')
+
+    async def list_users(self, prefix=None, after=None, limit=None):
+        params = {key: value for key, value in (("prefix", prefix), ("after", after), ("limit", limit)) if value}
+        users, headers = await self._request('GET', "/users", params=params)
+        for user in users:
+            self.cache_user_id(user['username'], user['id'])
+        return users, headers.get('X-Next-Cursor')
+
+    async def search(self, query, user1_id=None, user2_id=None, after=None, limit=None):
+        params = {key: value for key, value in (
+            ("q", query), ("user1_id", user1_id), ("user2_id", user2_id), ("after", after), ("limit", limit)
+        ) if value}
+        results, headers = await self._request('GET', "/search", params=params)
+        return results, headers.get('X-Next-Cursor')
+
+    async def conversations(self, user_id, after=None, limit=None):
+        params = {key: value for key, value in (("after", after), ("limit", limit)) if value}
+        conversations, headers = await self._request('GET', f"/users/{user_id}/conversations", params=params)
+        return conversations, headers.get('X-Next-Cursor')
+
+    async def mark_read(self, user_id, partner_id, up_to=None):
+        data = {"up_to": up_to} if up_to else {}
+        conversation, _ = await self._request('POST', f"/users/{user_id}/conversations/{partner_id}/read", json=data)
+        return conversation
+
+# Shared client used by the interactive menu
+CLIENT = ChatClient(API_URL, timeout=CONFIG['Timeout'], retries=CONFIG['Retries'], cache_ttl=CACHE_TTL)
 
 # Function to clear the console screen
 def clear_screen():
@@ -49,17 +361,13 @@ def print_menu():
     print("2. Send Voice Message")
     print("3. View Messages")
     print("4. List Users")
-    print("5. Exit")
+    print("5. Live Feed")
+    print("6. Exit")
 
 # Function to get the user ID by username
 def get_user_id(username):
     try:
-        response = requests.get(f"{API_URL}/users")  # Send a GET request to retrieve users
-        response.raise_for_status()  # Raise an error for bad status codes
-        users = response.json()  # Parse the response as JSON
-        for user in users:
-            if user['username'] == username:
-                return user['id']  # Return the ID if the username matches
+        return CLIENT.get_user_id(username)  # Cached for CACHE_TTL seconds
     except requests.RequestException as e:
         print(f"Error retrieving users: {e}")  # Print an error if the request fails
     return None
@@ -67,9 +375,7 @@ def get_user_id(username):
 # Function to create a new user with the given username
 def create_user(username):
     try:
-        response = requests.post(f"{API_URL}/users", json={"username": username})  # Send a POST request to create a user
-        response.raise_for_status()  # Raise an error for bad status codes
-        return response.json()['id']  # Return the new user's ID
+        return CLIENT.create_user(username)  # Return the new user's ID
     except requests.RequestException as e:
         print(f"Error creating user: {e}")  # Print an error if the request fails
     return None
@@ -89,20 +395,20 @@ def send_text_message(sender_id):
     try:
         if DEBUG:
             print(f"Sending payload: {json.dumps(data, indent=2)}")  # Print the data in debug mode
-        response = requests.post(f"{API_URL}/messages", json=data)  # Send a POST request to send the message
-        response.raise_for_status()  # Raise an error for bad status codes
+        CLIENT.send_message(sender_id, recipient_id, content)  # Send a POST request to send the message
         print("Message sent successfully!")
     except requests.RequestException as e:
         print(f"Error sending message: {e}")  # Print an error if the request fails
-        if DEBUG:
-            print(f"Response content: {response.content}")  # Print response content in debug mode
+        if DEBUG and e.response is not None:
+            print(f"Response content: {e.response.content}")  # Print response content in debug mode
 
 # Function to record audio and save it to a file
-def record_audio(duration=5, output_file='temp_voice_message.wav'):
+def record_audio(duration=5, output_file='temp_voice_message.wav', rate=None):
+    import pyaudio  # Only needed for recording, so scripted use works without it
     CHUNK = 1024  # Audio chunk size
     FORMAT = pyaudio.paInt16  # Audio format
     CHANNELS = 1  # Number of channels (mono)
-    RATE = 44100  # Sample rate
+    RATE = rate or SAMPLE_RATE  # Sample rate
 
     p = pyaudio.PyAudio()  # Initialize PyAudio
 
@@ -139,8 +445,11 @@ def record_audio(duration=5, output_file='temp_voice_message.wav'):
 def send_voice_message(sender_id):
     recipient = input("Enter recipient's username: ")  # Prompt for the recipient's username
     
+    duration = input("Recording length in seconds [5]: ")  # Long recordings are transcribed in segments
+    duration = int(duration) if duration.isdigit() and int(duration) > 0 else 5
+
     temp_file = 'temp_voice_message.wav'  # Temporary file to store the recording
-    record_audio(duration=5, output_file=temp_file)  # Record a 5-second voice message
+    record_audio(duration=duration, output_file=temp_file)  # Record the voice message
 
     recipient_id = get_user_id(recipient)  # Get the recipient's user ID
     if not recipient_id:
@@ -150,19 +459,22 @@ def send_voice_message(sender_id):
     data = {"sender_id": sender_id, "recipient_id": recipient_id}  # Prepare the data for the request
 
     try:
-        with open(temp_file, 'rb') as file:
-            files = {'file': ('voice_message.wav', file, 'audio/wav')}  # Prepare the file for upload
-            if DEBUG:
-                print(f"Sending payload: {json.dumps(data, indent=2)}")  # Print the data in debug mode
-                print(f"Sending file: {temp_file}")
-            response = requests.post(f"{API_URL}/voice_messages", data=data, files=files)  # Send the voice message
-            response.raise_for_status()  # Raise an error for bad status codes
-        print("Voice message sent and transcribed successfully!")
-        print(f"Transcription: {response.json()['transcription']}")  # Print the transcription
+        if DEBUG:
+            print(f"Sending payload: {json.dumps(data, indent=2)}")  # Print the data in debug mode
+            print(f"Sending file: {temp_file}")
+        voice_message = CLIENT.send_voice_message(sender_id, recipient_id, temp_file)  # Send the voice message
+        print("Voice message sent! Waiting for transcription...")
+        voice_message = CLIENT.wait_for_transcription(voice_message['id'])  # Poll until a worker has transcribed it
+        if voice_message['status'] in ('pending', 'processing'):
+            print("Transcription is still in progress. It will show up in your messages once it is done.")
+            if voice_message['transcription']:
+                print(f"So far: {voice_message['transcription']}")  # Long clips are transcribed in segments
+        else:
+            print(f"Transcription: {voice_message['transcription']}")  # Print the transcription
     except requests.RequestException as e:
         print(f"Error sending voice message: {e}")  # Print an error if the request fails
-        if DEBUG:
-            print(f"Response content: {response.content}")  # Print response content in debug mode
+        if DEBUG and e.response is not None:
+            print(f"Response content: {e.response.content}")  # Print response content in debug mode
     finally:
         if os.path.exists(temp_file):
             os.remove(temp_file)  # Delete the temporary file
@@ -176,52 +488,60 @@ def view_messages(user_id):
         print("User not found.")
         return
 
+    cursor = None  # Start with the newest page
     try:
-        # Retrieve text messages
-        response = requests.get(f"{API_URL}/messages?user1_id={user_id}&user2_id={other_id}")
-        # Retrieve voice messages
-        voice_response = requests.get(f"{API_URL}/voice_messages?user1_id={user_id}&user2_id={other_id}")
-        
-        response.raise_for_status()  # Raise an error for bad status codes
-        voice_response.raise_for_status()  # Raise an error for bad status codes
-
-        messages = response.json()  # Parse text messages as JSON
-        voice_messages = voice_response.json()  # Parse voice messages as JSON
-        
-        all_messages = messages + voice_messages  # Combine all messages
-        all_messages.sort(key=lambda x: x['timestamp'])  # Sort messages by timestamp
-
-        # Create a table to display the messages
-        table = PrettyTable()
-        table.field_names = ["Timestamp", "Sender", "Content"]
-        
-        # Retrieve the list of users to resolve user IDs to usernames
-        users_response = requests.get(f"{API_URL}/users")
-        users_response.raise_for_status()
-        users = users_response.json()
-
-        # Add each message to the table
-        for msg in all_messages:
-            sender = next((u['username'] for u in users if u['id'] == msg['sender_id']), "Unknown")
-            content = msg.get('content') or msg.get('transcription', 'Voice Message')
-            table.add_row([msg['timestamp'], sender, content])
-        
-        print(table)  # Print the table
+        while True:
+            # Retrieve one page of text and voice messages, already merged and with sender usernames
+            items, cursor = CLIENT.timeline(user_id, other_id, before=cursor)
+
+            # Create a table to display the messages
+            table = PrettyTable()
+            table.field_names = ["Timestamp", "Sender", "Content"]
+            for item in items:
+                content = item['content'] or 'Voice Message (transcribing...)'
+                table.add_row([item['timestamp'], item['sender_username'], content])
+            print(table)  # Print the table
+
+            # The cursor is present when older messages exist
+            if not cursor or input("Load older messages? (y/n): ").lower() != 'y':
+                break
     except requests.RequestException as e:
         print(f"Error retrieving messages: {e}")  # Print an error if the request fails
 
 
-# Function to list all users in the system
+# Function to print new messages as the server pushes them, until Ctrl+C is pressed
+def live_feed(user_id):
+    print("Listening for new messages. Press Ctrl+C to stop.")
+    last_event_id = None  # Lets the server replay anything missed while reconnecting
+    try:
+        while True:
+            try:
+                for last_event_id, data in CLIENT.events(user_id, last_event_id):
+                    content = data['content'] or 'Voice Message'
+                    print(f"[{data['timestamp']}] {data['sender_username']}: {content}")
+            except requests.RequestException as e:
+                if DEBUG:
+                    print(f"Connection lost: {e}")
+                time.sleep(3)  # Wait before reconnecting
+    except KeyboardInterrupt:
+        print("\nStopped listening.")
+
+# Function to list the users in the system, one page at a time
 def list_users():
+    prefix = input("Filter by username prefix (leave empty for all): ")  # Optional prefix search
+    cursor = None  # Start with the first page
     try:
-        response = requests.get(f"{API_URL}/users")  # Send a GET request to retrieve users
-        response.raise_for_status()  # Raise an error for bad status codes
-        users = response.json()  # Parse the response as JSON
-        table = PrettyTable()
-        table.field_names = ["ID", "Username"]
-        for user in users:
-            table.add_row([user['id'], user['username']])  # Add each user to the table
-        print(table)  # Print the table
+        while True:
+            users, cursor = CLIENT.list_users(prefix, after=cursor)  # Also refreshes the username cache
+            table = PrettyTable()
+            table.field_names = ["ID", "Username"]
+            for user in users:
+                table.add_row([user['id'], user['username']])  # Add each user to the table
+            print(table)  # Print the table
+
+            # The cursor is present when more users exist
+            if not cursor or input("Show more users? (y/n): ").lower() != 'y':
+                break
     except requests.RequestException as e:
         print(f"Error retrieving users: {e}")  # Print an error if the request fails
 
@@ -243,7 +563,7 @@ def main():
 
     while True:
         print_menu()  # Display the main menu
-        choice = input("Enter your choice (1-5): ")
+        choice = input("Enter your choice (1-6): ")
 
         if choice == '1':
             send_text_message(user_id)  # Send a text message
@@ -254,6 +574,8 @@ def main():
         elif choice == '4':
             list_users()  # List all users
         elif choice == '5':
+            live_feed(user_id)  # Stream new messages as they arrive
+        elif choice == '6':
             print("Thank you for using the Messaging App. Goodbye!")
             break  # Exit the app
         else:
@@ -0,0 +1,52 @@
+# conftest.py - one app against a throwaway SQLite file with the fake transcriber, shared by every test
+
+import io
+import os
+import sys
+import time
+import wave
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # For benchmarks.common
+from benchmarks.common import load_app
+
+@pytest.fixture(scope='session')
+def chat_app():
+    return load_app(TRANSCRIPTION_WORKERS=4, METRICS_ENABLED=False)
+
+@pytest.fixture
+def users(chat_app):
+    client = chat_app.app.test_client()
+    suffix = time.monotonic_ns()  # Unique names, since the database is shared by every test
+    return tuple(client.post('/users', json={'username': f"{name}-{suffix}"}).json['id'] for name in ('sender', 'recipient'))
+
+# Function to build a short WAV clip whose bytes differ per seed, so the transcription cache never answers it
+def clip(seed):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(16000)
+        output.writeframes(seed.to_bytes(4, 'little') * 4000)
+    return buffer.getvalue()
+
+# Function to send text messages one by one, returning their JSON representations
+def send_messages(chat_app, sender, recipient, contents):
+    client = chat_app.app.test_client()
+    return [client.post('/messages', json={'sender_id': sender, 'recipient_id': recipient, 'content': content}).json
+            for content in contents]
+
+# Function to wait until no voice message is pending or processing, returning how many still are
+def wait_for_transcriptions(chat_app, timeout=30):
+    from models import VoiceMessage
+    db = chat_app.db
+    deadline = time.monotonic() + timeout
+    with chat_app.app.app_context():
+        while True:
+            unfinished = db.session.scalar(
+                db.select(db.func.count()).where(VoiceMessage.status.in_(('pending', 'processing')))
+            )
+            db.session.rollback()
+            if not unfinished or time.monotonic() > deadline:
+                return unfinished
+            time.sleep(0.05)
@@ -0,0 +1,75 @@
+# test_batch_ingest.py - POST /messages/batch: per-item validation, chunked inserts and partial failures
+
+import pytest
+
+def post_batch(chat_app, messages):
+    return chat_app.app.test_client().post('/messages/batch', json={"messages": messages})
+
+def test_every_item_gets_a_result(chat_app, users):
+    sender, recipient = users
+    response = post_batch(chat_app, [
+        {"sender_id": sender, "recipient_id": recipient, "content": "hi"},
+        {"sender_id": sender, "recipient_id": recipient},
+        {"sender_id": sender, "recipient_id": recipient, "content": "x" * 501},
+        {"sender_id": "abc", "recipient_id": recipient, "content": "hi"},
+        {"sender_id": sender, "recipient_id": 10 ** 9, "content": "hi"},
+        "not an object",
+    ])
+    assert response.status_code == 200
+    assert (response.json['created'], response.json['failed']) == (1, 5)
+    assert [result['status'] for result in response.json['results']] == [201, 400, 400, 400, 404, 400]
+    assert [result['index'] for result in response.json['results']] == list(range(6))
+
+@pytest.mark.parametrize('body', [{}, {"messages": []}, {"messages": "hi"}])
+def test_batch_must_be_a_non_empty_list(chat_app, body):
+    response = chat_app.app.test_client().post('/messages/batch', json=body)
+    assert response.status_code == 400
+
+def test_batch_over_the_limit_is_rejected(chat_app, users, monkeypatch):
+    monkeypatch.setitem(chat_app.app.config, 'BATCH_MAX_MESSAGES', 2)
+    sender, recipient = users
+    response = post_batch(chat_app, [{"sender_id": sender, "recipient_id": recipient, "content": "hi"}] * 3)
+    assert response.status_code == 413
+
+def test_messages_are_stored_across_chunks_in_order(chat_app, users, monkeypatch):
+    monkeypatch.setitem(chat_app.app.config, 'BATCH_CHUNK_SIZE', 2)
+    sender, recipient = users
+    response = post_batch(chat_app, [
+        {"sender_id": sender, "recipient_id": recipient, "content": f"m{i}"} for i in range(5)
+    ])
+    ids = [result['id'] for result in response.json['results']]
+    assert ids == sorted(ids) and len(set(ids)) == 5
+
+    page = chat_app.app.test_client().get(f"/messages?user1_id={sender}&user2_id={recipient}")
+    assert sorted(message['content'] for message in page.json) == [f"m{i}" for i in range(5)]
+
+def test_failed_chunk_reports_the_committed_items_and_publishes_them(chat_app, users, monkeypatch):
+    import ingest
+    monkeypatch.setitem(chat_app.app.config, 'BATCH_CHUNK_SIZE', 2)
+    calls = {"count": 0}
+    original = ingest.record_messages
+
+    def record_messages(messages):
+        calls['count'] += 1
+        if calls['count'] == 2:
+            raise RuntimeError("disk full")
+        return original(messages)
+
+    monkeypatch.setattr(ingest, 'record_messages', record_messages)
+    sender, recipient = users
+    subscription = chat_app.events.subscribe(recipient)
+    try:
+        response = post_batch(chat_app, [
+            {"sender_id": sender, "recipient_id": recipient, "content": f"m{i}"} for i in range(5)
+        ])
+        pushed = [subscription.get(timeout=0) for _ in range(3)]
+    finally:
+        subscription.close()
+
+    assert response.status_code == 200
+    assert (response.json['created'], response.json['failed']) == (2, 3)
+    assert [result['status'] for result in response.json['results']] == [201, 201, 500, 500, 500]
+    assert [event and event['content'] for event in pushed] == ["m0", "m1", None]
+
+    page = chat_app.app.test_client().get(f"/messages?user1_id={sender}&user2_id={recipient}")
+    assert sorted(message['content'] for message in page.json) == ["m0", "m1"]  # The failed chunk was rolled back
@@ -0,0 +1,84 @@
+# test_concurrent_writes.py - write transactions must wait for each other instead of failing with
+# "database is locked" when another commit lands between their first read and first write
+#
+#   python -m pytest -q tests
+
+import io
+import threading
+import time
+from conftest import clip, wait_for_transcriptions
+
+# Function to run fn(index) on count threads that start together, returning the exceptions raised
+def run_concurrently(fn, count):
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def worker(index):
+        barrier.wait()
+        try:
+            fn(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+def test_read_then_write_transactions_wait_for_each_other(chat_app):
+    from models import User
+    app, db = chat_app.app, chat_app.db
+
+    def read_then_write(index):
+        with app.app_context():
+            db.session.execute(db.select(db.func.count(User.id))).scalar()  # The transaction starts with a read
+            time.sleep(0.05)  # ... while the other writers read too
+            db.session.add(User(username=f"writer-{index}"))
+            db.session.commit()
+
+    assert run_concurrently(read_then_write, 8) == []
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).where(User.username.like('writer-%'))) == 8
+
+def test_concurrent_uploads_and_sends_succeed_and_finish_transcribing(chat_app, users):
+    sender, recipient = users
+    statuses = []
+
+    def upload_and_send(index):
+        client = chat_app.app.test_client()
+        for round_number in range(5):
+            response = client.post('/voice_messages', data={
+                'file': (io.BytesIO(clip(index * 100 + round_number)), 'clip.wav'),
+                'sender_id': str(sender), 'recipient_id': str(recipient),
+            })
+            statuses.append(response.status_code)
+            response = client.post('/messages', json={'sender_id': sender, 'recipient_id': recipient, 'content': 'hi'})
+            statuses.append(response.status_code)
+
+    assert run_concurrently(upload_and_send, 8) == []
+    assert [status for status in statuses if status >= 500] == []
+    assert wait_for_transcriptions(chat_app) == 0
+
+def test_new_connection_waits_for_a_writer_holding_the_lock(chat_app, tmp_path):
+    import sqlite3
+    from sqlalchemy import create_engine
+    from database import configure_engine
+    path = tmp_path / 'locked.db'
+    writer = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    writer.execute("CREATE TABLE t (x)")
+    writer.execute("BEGIN EXCLUSIVE")  # Without WAL, a committing writer keeps everyone else out, pragmas included
+    writer.execute("INSERT INTO t VALUES (1)")
+    release = threading.Timer(0.3, writer.execute, ("COMMIT",))
+    release.start()
+    # No driver-level timeout, so only the busy_timeout pragma of the connect hook makes it wait
+    engine = create_engine(f"sqlite:///{path}", connect_args={'timeout': 0})
+    configure_engine(engine, {**chat_app.app.config, 'SQLITE_JOURNAL_MODE': 'DELETE'})
+    try:
+        with engine.connect() as connection:
+            assert connection.exec_driver_sql("SELECT count(*) FROM t").scalar() == 1
+    finally:
+        release.join()
+        writer.close()
+        engine.dispose()
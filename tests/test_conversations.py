@@ -0,0 +1,86 @@
+# test_conversations.py - conversation lists backed by summaries, unread counts and mark-read
+
+import io
+import time
+from datetime import datetime, timedelta
+from conftest import clip, send_messages, wait_for_transcriptions
+
+def create_user(chat_app, name):
+    return chat_app.app.test_client().post('/users', json={'username': f"{name}-{time.monotonic_ns()}"}).json['id']
+
+def conversations(chat_app, user_id, **args):
+    return chat_app.app.test_client().get(f"/users/{user_id}/conversations", query_string=args)
+
+def mark_read(chat_app, user_id, partner_id, **body):
+    return chat_app.app.test_client().post(f"/users/{user_id}/conversations/{partner_id}/read", json=body)
+
+def test_lists_conversations_most_recent_first_with_unread_counts(chat_app):
+    me, alice, bob = (create_user(chat_app, name) for name in ('me', 'alice', 'bob'))
+    send_messages(chat_app, alice, me, ["hi", "are you there?"])
+    send_messages(chat_app, me, bob, ["lunch?"])
+    send_messages(chat_app, bob, me, ["sure"])
+
+    listed = conversations(chat_app, me).json
+    assert [(item['partner_id'], item['last_preview'], item['unread_count']) for item in listed] == \
+        [(bob, "sure", 1), (alice, "are you there?", 2)]
+    assert [item['unread_count'] for item in conversations(chat_app, bob).json] == [1]  # Only "lunch?"; bob sent "sure"
+
+def test_mark_read_clears_the_count_and_sets_the_read_receipt(chat_app, users):
+    sender, recipient = users
+    send_messages(chat_app, sender, recipient, ["one", "two"])
+    response = mark_read(chat_app, recipient, sender)
+    assert response.status_code == 200
+    assert response.json['unread_count'] == 0
+
+    assert conversations(chat_app, recipient).json[0]['unread_count'] == 0
+    receipt = conversations(chat_app, sender).json[0]['partner_read_at']
+    assert receipt == response.json['last_read_at']
+
+    send_messages(chat_app, sender, recipient, ["three"])
+    assert conversations(chat_app, recipient).json[0]['unread_count'] == 1
+
+def test_mark_read_up_to_a_timestamp_keeps_newer_messages_unread(chat_app, users):
+    sender, recipient = users
+    messages = send_messages(chat_app, sender, recipient, ["one", "two", "three"])
+    seen = datetime.fromisoformat(messages[0]['timestamp'])
+    response = mark_read(chat_app, recipient, sender, up_to=(seen + timedelta(microseconds=1)).isoformat() + "+00:00")
+    assert response.status_code == 200
+    assert response.json['unread_count'] == 2
+
+    # Read markers only move forward
+    mark_read(chat_app, recipient, sender, up_to=(seen - timedelta(days=1)).isoformat())
+    assert conversations(chat_app, recipient).json[0]['unread_count'] == 2
+
+def test_voice_messages_show_their_transcription_once_done(chat_app, users):
+    sender, recipient = users
+    chat_app.app.test_client().post('/voice_messages', data={
+        'file': (io.BytesIO(clip(60001)), 'clip.wav'), 'sender_id': str(sender), 'recipient_id': str(recipient),
+    })
+    assert wait_for_transcriptions(chat_app) == 0
+    item = conversations(chat_app, recipient).json[0]
+    assert item['last_kind'] == 'voice' and item['last_preview'].startswith("Fake transcription")
+
+def test_list_pages_with_the_after_cursor(chat_app):
+    me = create_user(chat_app, 'me')
+    partners = [create_user(chat_app, f"p{i}") for i in range(5)]
+    for partner in partners:
+        send_messages(chat_app, partner, me, ["hi"])
+    first = conversations(chat_app, me, limit=3)
+    second = conversations(chat_app, me, limit=3, after=first.headers['X-Next-Cursor'])
+    assert [item['partner_id'] for item in first.json + second.json] == partners[::-1]
+    assert 'X-Next-Cursor' not in second.headers
+
+def test_invalid_requests_are_rejected(chat_app, users):
+    sender, recipient = users
+    assert conversations(chat_app, 10 ** 9).status_code == 404
+    assert conversations(chat_app, sender, before='WzFd').status_code == 400
+    assert conversations(chat_app, sender, after='bad').status_code == 400
+    assert mark_read(chat_app, sender, recipient).status_code == 404  # No conversation yet
+    send_messages(chat_app, sender, recipient, ["hi"])
+    assert mark_read(chat_app, recipient, sender, up_to="yesterday").status_code == 400
+
+def test_summaries_match_the_messages(chat_app):
+    from summaries import check_summaries
+    with chat_app.app.app_context(), chat_app.db.engine.begin() as connection:
+        report = check_summaries(connection)
+    assert (report['missing'], report['stale'], report['orphaned']) == ([], [], [])
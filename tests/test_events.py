@@ -0,0 +1,53 @@
+# test_events.py - event streams resume from the last voice message delivered, counted in the order
+# voice messages finished rather than by ID
+
+import json
+
+def test_resume_replays_voice_messages_that_finished_after_a_newer_one(chat_app, users):
+    from models import VoiceMessage
+    app, db = chat_app.app, chat_app.db
+    sender, recipient = users
+    with app.app_context():
+        older, newer = (VoiceMessage(filename='clip.wav', sender_id=sender, recipient_id=recipient) for _ in range(2))
+        db.session.add_all((older, newer))
+        db.session.commit()
+        older_id, newer_id = older.id, newer.id
+
+    queue = chat_app.transcription_queue
+    newer_seq = queue._save_result(newer_id, "short clip", 'completed', None).completed_seq  # Delivered live
+    older_seq = queue._save_result(older_id, "long clip", 'completed', None).completed_seq  # Finished later
+    assert older_seq > newer_seq
+
+    response = app.test_client().get(f"/users/{recipient}/events", headers={'Last-Event-ID': f"0-{newer_seq}"}, buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b"retry:")
+    replayed = next(chunks).decode()
+    response.close()
+    assert replayed.startswith(f"id: 0-{older_seq}\n")
+    assert json.loads(replayed.split("data: ", 1)[1])['id'] == older_id
+
+# Function to read the replayed events of a stream, stopping at the end of the stream or after count events
+def read_events(response, count):
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b"retry:")
+    replayed = []
+    for chunk in chunks:
+        event_id, _, data = chunk.decode().partition("\nevent: message\ndata: ")
+        replayed.append((event_id.removeprefix("id: "), json.loads(data)['content']))
+        if len(replayed) == count:
+            break
+    response.close()
+    return replayed
+
+def test_replay_cut_off_by_its_limit_ends_the_stream_and_resumes_where_it_stopped(chat_app, users, monkeypatch):
+    monkeypatch.setitem(chat_app.app.config, 'EVENT_REPLAY_LIMIT', 3)
+    sender, recipient = users
+    client = chat_app.app.test_client()
+    ids = [client.post('/messages', json={'sender_id': sender, 'recipient_id': recipient, 'content': f"m{i}"}).json['id']
+           for i in range(5)]
+
+    first = read_events(client.get(f"/users/{recipient}/events?last_event_id=0-0", buffered=False), 10)
+    assert first == [(f"{ids[i]}-0", f"m{i}") for i in range(3)]  # The stream ended after one page
+
+    second = read_events(client.get(f"/users/{recipient}/events?last_event_id={first[-1][0]}", buffered=False), 2)
+    assert second == [(f"{ids[i]}-0", f"m{i}") for i in range(3, 5)]
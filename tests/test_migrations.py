@@ -0,0 +1,49 @@
+# test_migrations.py - the migration chain builds the schema models.py describes, both on an empty
+# database and on one created by the first release
+
+from sqlalchemy import create_engine, inspect
+
+# Function to describe a database's tables: columns (name, type, nullable) and indexes (name, columns)
+def schema(engine):
+    inspector = inspect(engine)
+    return {
+        table: (
+            {(column['name'], str(column['type']), column['nullable']) for column in inspector.get_columns(table)},
+            {(index['name'], tuple(index['column_names'])) for index in inspector.get_indexes(table)},
+        )
+        for table in inspector.get_table_names()
+        if table != 'schema_version' and '_fts' not in table
+    }
+
+def test_migrations_match_the_models(chat_app, tmp_path):
+    from migrations import migrate
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    created = create_engine(f"sqlite:///{tmp_path / 'created.db'}")
+    migrate(migrated)
+    chat_app.db.metadata.create_all(created)
+    assert schema(migrated) == schema(created)
+
+def test_first_release_database_is_upgraded(chat_app, tmp_path):
+    from migrations import MIGRATIONS, migrate
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        MIGRATIONS[0][2](connection)  # The tables as the first release created them, without schema_version
+        connection.exec_driver_sql("INSERT INTO user (id, username) VALUES (1, 'alice'), (2, 'bob')")
+        connection.exec_driver_sql(
+            "INSERT INTO message (content, timestamp, sender_id, recipient_id) VALUES ('lunch?', '2024-01-01 12:00:00', 2, 1)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO voice_message (filename, timestamp, sender_id, recipient_id, transcription) "
+            "VALUES ('a.wav', '2024-01-01 12:05:00', 1, 2, 'sure')"
+        )
+
+    assert [version for version, _ in migrate(engine)] == [version for version, _, _ in MIGRATIONS]
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT conversation_key FROM message").scalar() == '1:2'
+        assert connection.exec_driver_sql("SELECT status, conversation_key FROM voice_message").one() == ('completed', '1:2')
+        assert connection.exec_driver_sql("SELECT rowid FROM message_fts WHERE message_fts MATCH 'lunch'").scalar() == 1
+        summaries = connection.exec_driver_sql(
+            "SELECT user_id, partner_id, last_kind, last_preview, unread_count FROM conversation_summary ORDER BY user_id"
+        ).all()
+        assert summaries == [(1, 2, 'voice', 'sure', 0), (2, 1, 'voice', 'sure', 0)]
+    assert migrate(engine) == []
@@ -0,0 +1,64 @@
+# test_pagination.py - keyset pagination of conversation history with opaque cursors
+
+import json
+import pytest
+from conftest import send_messages
+
+@pytest.fixture
+def history(chat_app, users):
+    sender, recipient = users
+    messages = send_messages(chat_app, sender, recipient, [f"m{i}" for i in range(7)])
+    return sender, recipient, [message['id'] for message in messages]
+
+def get_page(chat_app, sender, recipient, **args):
+    return chat_app.app.test_client().get('/messages', query_string={'user1_id': sender, 'user2_id': recipient, **args})
+
+def test_pages_walk_back_from_the_newest_messages(chat_app, history):
+    sender, recipient, ids = history
+    first = get_page(chat_app, sender, recipient, limit=3)
+    assert [message['id'] for message in first.json] == ids[4:]  # Newest page, oldest first within it
+    second = get_page(chat_app, recipient, sender, limit=3, before=first.headers['X-Next-Cursor'])
+    assert [message['id'] for message in second.json] == ids[1:4]
+    last = get_page(chat_app, sender, recipient, limit=3, before=second.headers['X-Next-Cursor'])
+    assert [message['id'] for message in last.json] == ids[:1]
+    assert 'X-Next-Cursor' not in last.headers
+
+def test_after_cursor_pages_forward(chat_app, history):
+    from datetime import datetime
+    from pagination import encode_cursor
+    sender, recipient, ids = history
+    oldest = get_page(chat_app, sender, recipient, limit=7).json[0]
+    cursor = encode_cursor(datetime.fromisoformat(oldest['timestamp']), oldest['id'])
+
+    pages = []
+    while cursor:
+        page = get_page(chat_app, sender, recipient, limit=2, after=cursor)
+        pages.append([message['id'] for message in page.json])
+        cursor = page.headers.get('X-Next-Cursor')
+    assert pages == [ids[1:3], ids[3:5], ids[5:7], []]  # A full last page can't tell it was the last
+
+def test_fields_projection(chat_app, history):
+    sender, recipient, ids = history
+    page = get_page(chat_app, sender, recipient, limit=1, fields='id,content')
+    assert page.json == [{"id": ids[-1], "content": "m6"}]
+    assert get_page(chat_app, sender, recipient, fields='id,password').status_code == 400
+
+def test_ndjson_streams_the_whole_history_oldest_first(chat_app, history):
+    sender, recipient, ids = history
+    response = get_page(chat_app, sender, recipient, format='ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line)['id'] for line in response.data.splitlines()] == ids
+
+@pytest.mark.parametrize('args', [
+    {'before': 'not-a-cursor'},
+    {'after': 'WzFd'},  # Valid base64 JSON with the wrong number of values
+    {'before': 'WzFd', 'after': 'WzFd'},
+])
+def test_bad_cursors_are_rejected(chat_app, history, args):
+    sender, recipient, _ = history
+    response = get_page(chat_app, sender, recipient, **args)
+    assert response.status_code == 400
+    assert 'error' in response.json
+
+def test_both_users_are_required(chat_app, users):
+    assert chat_app.app.test_client().get(f"/messages?user1_id={users[0]}").status_code == 400
@@ -0,0 +1,68 @@
+# test_search.py - full-text search over text messages and voice transcriptions
+
+import io
+import time
+import pytest
+from conftest import clip, send_messages, wait_for_transcriptions
+
+@pytest.fixture
+def word():
+    return f"zq{time.monotonic_ns()}"  # A word no other test writes
+
+def search(chat_app, **args):
+    return chat_app.app.test_client().get('/search', query_string=args)
+
+def test_finds_messages_containing_every_word(chat_app, users, word):
+    sender, recipient = users
+    hits = send_messages(chat_app, sender, recipient, [f"lunch {word} tomorrow", f"{word} lunch"])
+    send_messages(chat_app, sender, recipient, [f"dinner {word}", "lunch only"])
+    response = search(chat_app, q=f"lunch {word}")
+    assert response.status_code == 200
+    assert sorted(item['id'] for item in response.json) == sorted(message['id'] for message in hits)
+    assert all(item['kind'] == 'text' and f"[{word}]" in item['snippet'] for item in response.json)
+
+def test_trailing_star_matches_prefixes(chat_app, users, word):
+    sender, recipient = users
+    message = send_messages(chat_app, sender, recipient, [f"{word}suffix"])[0]
+    assert [item['id'] for item in search(chat_app, q=f"{word}*").json] == [message['id']]
+    assert search(chat_app, q=word).json == []
+
+def test_scopes_to_a_user_and_a_conversation(chat_app, users, word):
+    sender, recipient = users
+    other = chat_app.app.test_client().post('/users', json={'username': f"other-{word}"}).json['id']
+    mine = send_messages(chat_app, sender, recipient, [word])[0]
+    theirs = send_messages(chat_app, other, recipient, [word])[0]
+    assert {item['id'] for item in search(chat_app, q=word, user1_id=recipient).json} == {mine['id'], theirs['id']}
+    assert [item['id'] for item in search(chat_app, q=word, user1_id=sender).json] == [mine['id']]
+    assert [item['id'] for item in search(chat_app, q=word, user1_id=recipient, user2_id=other).json] == [theirs['id']]
+
+def test_finds_completed_voice_transcriptions(chat_app, users):
+    sender, recipient = users
+    response = chat_app.app.test_client().post('/voice_messages', data={
+        'file': (io.BytesIO(clip(40001)), 'clip.wav'), 'sender_id': str(sender), 'recipient_id': str(recipient),
+    })
+    assert wait_for_transcriptions(chat_app) == 0
+    results = search(chat_app, q="fake transcription", user1_id=sender, user2_id=recipient).json
+    assert [(item['kind'], item['id']) for item in results] == [('voice', response.json['id'])]
+
+def test_pages_with_the_cursor(chat_app, users, word):
+    sender, recipient = users
+    ids = {message['id'] for message in send_messages(chat_app, sender, recipient, [word] * 5)}
+    seen, cursor = [], None
+    while True:
+        page = search(chat_app, q=word, limit=2, **({'after': cursor} if cursor else {}))
+        seen += [item['id'] for item in page.json]
+        cursor = page.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(ids)
+
+@pytest.mark.parametrize('query', ['"unbalanced', 'a AND OR (', 'NEAR(x y', 'content:secret', '*'])
+def test_operators_in_user_input_are_not_parsed(chat_app, query):
+    assert search(chat_app, q=query).status_code in (200, 400)
+
+@pytest.mark.parametrize('args', [{'q': ''}, {'q': '!!! ...'}, {'q': 'x', 'user2_id': 1}, {'q': 'x', 'after': 'bad'}])
+def test_invalid_searches_are_rejected(chat_app, args):
+    response = search(chat_app, **args)
+    assert response.status_code == 400
+    assert 'error' in response.json
@@ -0,0 +1,47 @@
+# test_timeline.py - the merged text and voice timeline of a conversation
+
+import io
+from conftest import clip, send_messages, wait_for_transcriptions
+
+def upload_voice(chat_app, sender, recipient, seed):
+    response = chat_app.app.test_client().post('/voice_messages', data={
+        'file': (io.BytesIO(clip(seed)), 'clip.wav'), 'sender_id': str(sender), 'recipient_id': str(recipient),
+    })
+    return response.json
+
+def test_text_and_voice_messages_are_merged_in_time_order(chat_app, users):
+    sender, recipient = users
+    first = send_messages(chat_app, sender, recipient, ["before"])[0]
+    voice = upload_voice(chat_app, recipient, sender, 30001)
+    last = send_messages(chat_app, sender, recipient, ["after"])[0]
+    assert wait_for_transcriptions(chat_app) == 0
+
+    items = chat_app.app.test_client().get(f"/conversations/{recipient}/{sender}/timeline").json
+    assert [(item['kind'], item['id']) for item in items] == [('text', first['id']), ('voice', voice['id']), ('text', last['id'])]
+    assert items[1]['status'] == 'completed' and items[1]['content'].startswith("Fake transcription")
+    assert items[0]['status'] is None
+
+    from models import User
+    with chat_app.app.app_context():
+        names = {user_id: chat_app.db.session.get(User, user_id).username for user_id in users}
+    assert [item['sender_username'] for item in items] == [names[sender], names[recipient], names[sender]]
+
+def test_timeline_pages_back_with_the_cursor(chat_app, users):
+    sender, recipient = users
+    texts = send_messages(chat_app, sender, recipient, [f"t{i}" for i in range(3)])
+    voices = [upload_voice(chat_app, sender, recipient, 30010 + i) for i in range(2)]
+    client = chat_app.app.test_client()
+
+    first = client.get(f"/conversations/{sender}/{recipient}/timeline?limit=3")
+    second = client.get(f"/conversations/{sender}/{recipient}/timeline?limit=3&before={first.headers['X-Next-Cursor']}")
+    assert [(item['kind'], item['id']) for item in second.json + first.json] == \
+        [('text', text['id']) for text in texts] + [('voice', voice['id']) for voice in voices]
+    assert 'X-Next-Cursor' not in second.headers
+
+def test_timeline_fields_and_bad_cursor(chat_app, users):
+    sender, recipient = users
+    send_messages(chat_app, sender, recipient, ["hello"])
+    client = chat_app.app.test_client()
+    assert client.get(f"/conversations/{sender}/{recipient}/timeline?fields=kind,content").json == \
+        [{"kind": "text", "content": "hello"}]
+    assert client.get(f"/conversations/{sender}/{recipient}/timeline?before=nope").status_code == 400
@@ -0,0 +1,63 @@
+# test_transcription_cache.py - the two-tier cache of finished transcriptions
+
+import io
+import time
+import pytest
+from conftest import clip, wait_for_transcriptions
+
+@pytest.fixture
+def cache(chat_app):
+    from transcript_cache import TranscriptionCache
+    with chat_app.app.app_context():
+        yield TranscriptionCache(memory_size=2, ttl=60, max_rows=3, evict_every=1)
+
+def digest():
+    return f"{time.monotonic_ns():064x}"  # Unique per test, as the table is shared
+
+def test_memory_tier_answers_first_then_the_database(chat_app, cache):
+    key = digest()
+    cache.put(key, 'fake', "hello")
+    assert cache.get(key, 'fake') == "hello"
+    cache.memory.clear()  # As if another process had stored it
+    assert cache.get(key, 'fake') == "hello"
+    assert cache.get(key, 'other-model') is None
+    assert {name: cache.stats()[name] for name in ('memory_hits', 'db_hits', 'misses', 'stores')} == \
+        {"memory_hits": 1, "db_hits": 1, "misses": 1, "stores": 1}
+
+def test_expired_entries_are_misses(chat_app, cache, monkeypatch):
+    key = digest()
+    cache.put(key, 'fake', "hello")
+    cache.memory.clear()
+    monkeypatch.setattr(cache, 'ttl', 0)
+    assert cache.get(key, 'fake') is None
+
+def test_eviction_keeps_at_most_max_rows(chat_app, cache):
+    from models import TranscriptionCacheEntry
+    keys = [digest() for _ in range(5)]
+    for key in keys:
+        cache.put(key, 'fake', key)
+    assert chat_app.db.session.scalar(chat_app.db.select(chat_app.db.func.count()).select_from(TranscriptionCacheEntry)) == 3
+    cache.memory.clear()
+    assert [cache.get(key, 'fake') is not None for key in keys] == [False, False, True, True, True]
+
+def test_repeated_upload_is_answered_without_calling_the_transcriber(chat_app, users, monkeypatch):
+    sender, recipient = users
+    transcriber = chat_app.transcription_queue.transcriber
+    calls = []
+    original = transcriber.transcribe
+    monkeypatch.setattr(transcriber, 'transcribe', lambda audio, filename: calls.append(filename) or original(audio, filename))
+
+    def upload():
+        return chat_app.app.test_client().post('/voice_messages', data={
+            'file': (io.BytesIO(clip(50001)), 'clip.wav'), 'sender_id': str(sender), 'recipient_id': str(recipient),
+        })
+
+    first = upload()
+    assert first.status_code == 202
+    assert wait_for_transcriptions(chat_app) == 0
+    transcription = chat_app.app.test_client().get(first.headers['Location']).json['transcription']
+
+    repeat = upload()
+    assert repeat.status_code == 201
+    assert (repeat.json['status'], repeat.json['transcription']) == ('completed', transcription)
+    assert len(calls) == 1
@@ -0,0 +1,43 @@
+# test_transcription_store.py - a finished transcription is saved even when the first writes fail,
+# and a voice message never stays pending when saving keeps failing
+
+import io
+import sqlite3
+import pytest
+from conftest import clip, wait_for_transcriptions
+
+@pytest.fixture
+def failing_store(chat_app, monkeypatch):
+    import transcription
+    monkeypatch.setattr(chat_app.transcription_queue, 'store_backoff', 0.01)
+    original = transcription.record_transcription
+    failures = {"left": 0}
+
+    def record_transcription(voice_message):
+        if failures['left']:
+            failures['left'] -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return original(voice_message)
+
+    monkeypatch.setattr(transcription, 'record_transcription', record_transcription)
+    return failures
+
+def upload(chat_app, users, seed):
+    sender, recipient = users
+    response = chat_app.app.test_client().post('/voice_messages', data={
+        'file': (io.BytesIO(clip(seed)), 'clip.wav'), 'sender_id': str(sender), 'recipient_id': str(recipient),
+    })
+    assert response.status_code == 202
+    assert wait_for_transcriptions(chat_app) == 0
+    return chat_app.app.test_client().get(response.headers['Location']).json
+
+def test_store_is_retried_until_it_succeeds(chat_app, users, failing_store):
+    failing_store['left'] = 2
+    voice_message = upload(chat_app, users, 10001)
+    assert voice_message['status'] == 'completed'
+    assert voice_message['transcription'].startswith("Fake transcription")
+
+def test_voice_message_is_marked_failed_when_every_store_fails(chat_app, users, failing_store):
+    failing_store['left'] = 10 ** 6
+    voice_message = upload(chat_app, users, 10002)
+    assert voice_message['status'] == 'failed'
@@ -0,0 +1,36 @@
+# test_users.py - the user directory: prefix search and paging
+
+import time
+import pytest
+
+def create_users(chat_app, *names):
+    client = chat_app.app.test_client()
+    return [client.post('/users', json={'username': name}).json['id'] for name in names]
+
+def test_prefix_search_finds_only_matching_users(chat_app):
+    stem = f"dir{time.monotonic_ns()}"
+    ids = create_users(chat_app, f"{stem}-ann", f"{stem}-anna", f"{stem}-bob")
+    response = chat_app.app.test_client().get(f"/users?prefix={stem}-ann")
+    assert response.status_code == 200
+    assert [user['id'] for user in response.json] == ids[:2]
+
+@pytest.mark.parametrize('last', [chr(0x10FFFF), chr(0xD7FF)])
+def test_prefix_ending_in_the_last_code_points_is_searchable(chat_app, last):
+    stem = f"edge{time.monotonic_ns()}"
+    ids = create_users(chat_app, f"{stem}{last}", f"{stem}{last}x", f"{stem}a")
+    response = chat_app.app.test_client().get('/users', query_string={'prefix': f"{stem}{last}"})
+    assert response.status_code == 200
+    assert [user['id'] for user in response.json] == ids[:2]
+
+def test_users_are_paged_with_the_cursor(chat_app):
+    stem = f"page{time.monotonic_ns()}"
+    ids = create_users(chat_app, *(f"{stem}-{i}" for i in range(5)))
+    client = chat_app.app.test_client()
+    first = client.get(f"/users?prefix={stem}&limit=3")
+    assert [user['id'] for user in first.json] == ids[:3]
+    second = client.get(f"/users?prefix={stem}&limit=3&after={first.headers['X-Next-Cursor']}")
+    assert [user['id'] for user in second.json] == ids[3:]
+    assert 'X-Next-Cursor' not in second.headers
+
+def test_bad_cursor_is_rejected(chat_app):
+    assert chat_app.app.test_client().get('/users?after=not-a-cursor').status_code == 400
@@ -0,0 +1,42 @@
+# test_voice_messages.py - uploading voice messages: validation and the response
+
+import io
+import pytest
+from conftest import clip, wait_for_transcriptions
+
+# Function to upload a voice message with the given form fields
+def upload(chat_app, seed, **form):
+    return chat_app.app.test_client().post('/voice_messages', data={
+        'file': (io.BytesIO(clip(seed)), 'clip.wav'), **{key: str(value) for key, value in form.items()},
+    })
+
+@pytest.mark.parametrize('field', ['sender_id', 'recipient_id'])
+def test_non_integer_user_ids_are_rejected(chat_app, users, field):
+    sender, recipient = users
+    form = {'sender_id': sender, 'recipient_id': recipient, field: 'abc'}
+    response = upload(chat_app, 20001, **form)
+    assert response.status_code == 400
+    assert response.json['error'] == "sender_id and recipient_id must be integers"
+
+def test_unknown_users_are_rejected_without_a_summary(chat_app, users):
+    from models import ConversationSummary
+    sender, _ = users
+    response = upload(chat_app, 20002, sender_id=sender, recipient_id=10 ** 9)
+    assert response.status_code == 404
+    with chat_app.app.app_context():
+        assert chat_app.db.session.get(ConversationSummary, (sender, 10 ** 9)) is None
+
+def test_missing_user_ids_are_rejected(chat_app, users):
+    response = upload(chat_app, 20003, sender_id=users[0])
+    assert response.status_code == 400
+
+def test_upload_responses_carry_integer_user_ids(chat_app, users):
+    sender, recipient = users
+    first = upload(chat_app, 20004, sender_id=sender, recipient_id=recipient)
+    assert first.status_code == 202
+    assert (first.json['sender_id'], first.json['recipient_id']) == (sender, recipient)
+
+    assert wait_for_transcriptions(chat_app) == 0
+    repeat = upload(chat_app, 20004, sender_id=sender, recipient_id=recipient)  # Same audio, answered from the cache
+    assert repeat.status_code == 201
+    assert (repeat.json['sender_id'], repeat.json['recipient_id']) == (sender, recipient)